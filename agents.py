@@ -0,0 +1,63 @@
+import functools
+import threading
+from typing import TYPE_CHECKING, Type
+
+import httpx
+
+from pydantic import BaseModel
+
+from config  import OPENAI_API_KEY
+from utils   import load_prompt, get_setting
+from metrics import async_event_hooks
+from http_client import LONG_TIMEOUT
+
+if TYPE_CHECKING:
+    from pydantic_ai import Agent
+    from pydantic_ai.models.openai import OpenAIModel
+    from pydantic_ai.providers.openai import OpenAIProvider
+
+# === Process-wide provider / model / agent registry ===
+# Building a provider creates an HTTP client, so everything here is built once
+# and reused. System prompts are resolved per run through `load_prompt`, which
+# keeps edits to prompts/*.txt live without rebuilding the agent.
+# pydantic_ai / openai are imported on first use (or by `warmup`), keeping
+# them off the import path of api.py and ui.py.
+
+OPENAI_BASE_URL = get_setting("OPENAI_BASE_URL", None)  # None = api.openai.com
+
+_agents: dict[str, "Agent"] = {}
+_lock = threading.Lock()
+
+@functools.cache
+def get_openai_provider() -> "OpenAIProvider":
+    from pydantic_ai.providers.openai import OpenAIProvider
+
+    # Own client so OpenAI calls show up in the upstream metrics like the other providers
+    client = httpx.AsyncClient(timeout=LONG_TIMEOUT, event_hooks=async_event_hooks())
+    return OpenAIProvider(base_url=OPENAI_BASE_URL, api_key=OPENAI_API_KEY, http_client=client)
+
+@functools.cache
+def get_openai_model(model_name: str) -> "OpenAIModel":
+    from pydantic_ai.models.openai import OpenAIModel
+
+    return OpenAIModel(model_name=model_name, provider=get_openai_provider())
+
+def get_agent(name: str, model_name: str, result_type: Type[BaseModel], prompt_path: str) -> "Agent":
+    agent = _agents.get(name)
+    if agent is not None:
+        return agent
+
+    from pydantic_ai import Agent
+    with _lock:
+        if name not in _agents:
+            agent = Agent(model=get_openai_model(model_name), result_type=result_type)
+            agent.system_prompt(lambda: load_prompt(prompt_path))
+            _agents[name] = agent
+        return _agents[name]
+
+def clear():
+    """Drop every cached agent, model and provider (e.g. after rotating the API key)."""
+    with _lock:
+        _agents.clear()
+    get_openai_model.cache_clear()
+    get_openai_provider.cache_clear()
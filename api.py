@@ -1,118 +1,243 @@
-import os
+import json
+import asyncio
 from typing import Optional
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import FileResponse, JSONResponse
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, UploadFile, File, Form
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 
 # === Import core logic ===
-from image_caption     import caption_image_with_gpt4o
-from opencage_api      import location_text_to_latlon
-from openweather_api   import get_weather_by_lat_lon, get_weather_by_ip
-from weather_to_prompt import interpret_weather_to_music_prompt
-from stableaudio_api   import text2audio, audio2audio
-
-import asyncio
-import nest_asyncio
-
-try:
-    asyncio.get_event_loop()
-except RuntimeError:
-    asyncio.set_event_loop(asyncio.new_event_loop())
-
-nest_asyncio.apply()
-
-app = FastAPI(title="AI Sonification API")
+from pipeline          import run_pipeline, run_preview, render_full, warmup, StageError, STAGES, WARMUP_ON_STARTUP
+from geocode_cache     import geocode_cache
+from gazetteer         import gazetteer
+from geoip             import geoip, client_ip
+from weather_cache     import weather_cache
+from audio_store       import audio_store, reference_store
+from caption_cache     import caption_cache
+from interpretation_cache import interpretation_cache
+from audio_serving     import audio_file_response, resolve_store_path
+from jobs              import job_queue, QueueFull, QueueNotShared
+from batch             import run_batch, BatchRequest, BATCH_PARALLELISM, BATCH_MAX_ITEMS
+from uploads           import save_upload, discard, UploadTooLarge, MAX_IMAGE_BYTES, MAX_AUDIO_BYTES, MAX_REQUEST_BYTES
+from stableaudio_api   import shutdown_reference_pool
+import http_client
+import metrics
+import resilience
+import scheduler
+import singleflight
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await job_queue.start()
+    if WARMUP_ON_STARTUP:
+        # Not awaited: the first request that needs an agent simply builds it itself
+        app.state.warmup = asyncio.create_task(asyncio.to_thread(warmup))
+    yield
+    await job_queue.stop()
+    await http_client.aclose()
+    shutdown_reference_pool()
+
+app = FastAPI(title="AI Sonification API", lifespan=lifespan)
+
+# === Upload Limits ===
+@app.middleware("http")
+async def limit_request_size(request: Request, call_next):
+    # Refuse oversized bodies from the declared length, before any of it is parsed
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > MAX_REQUEST_BYTES:
+        return JSONResponse(status_code=413, content={"error": f"Request body exceeds {MAX_REQUEST_BYTES} bytes"})
+    return await call_next(request)
+
+# === Instrumentation ===
+@app.middleware("http")
+async def add_server_timing(request: Request, call_next):
+    with metrics.track_request() as timings:
+        response = await call_next(request)
+    if timings:
+        response.headers["Server-Timing"] = metrics.server_timing(timings)
+    return response
+
+@app.get("/metrics")
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+def _error_response(e: Exception) -> JSONResponse:
+    # Refusals from the scheduler say when to come back
+    retry_after = getattr(e, "retry_after", None)
+    headers = {"Retry-After": str(retry_after)} if retry_after else None
+    return JSONResponse(status_code=e.status_code, content={"error": str(e)}, headers=headers)
+
+def _client_ip(request: Request) -> Optional[str]:
+    # For IP-based weather when no location is given
+    return client_ip(request.client.host if request.client else None, request.headers)
+
+async def _collect(*tasks):
+    """Await upload tasks regardless of how the request ended and return what was saved."""
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    return [r for r in results if r is not None and not isinstance(r, BaseException)]
 
 @app.post("/generate")
 async def generate_music_prompt(
+    request: Request,
     location: Optional[str] = Form(None),
     journal: Optional[str] = Form(None),
     duration: Optional[int] = Form(20),  #
     image: Optional[UploadFile] = File(None),
-    reference_audio: Optional[UploadFile] = File(None)
+    reference_audio: Optional[UploadFile] = File(None),
+    progressive: bool = Form(False),
+    interpretation_mode: Optional[str] = Form(None),
 ):
+    # Uploads stream to disk in the background; the pipeline awaits them only when needed
+    image_task = asyncio.create_task(save_upload(image, MAX_IMAGE_BYTES))
+    reference_task = asyncio.create_task(save_upload(reference_audio, MAX_AUDIO_BYTES))
+    handed_off = None  # reference upload now owned by a background full render
     try:
-        # === Get weather ===
-        if location:
-            latlon = location_text_to_latlon(location)
-            if not latlon:
-                return JSONResponse(status_code=400, content={"error": "Invalid location"})
-            lat, lon = latlon
-            weather = get_weather_by_lat_lon(lat, lon)
-            latlon_str = f"{lat:.4f}, {lon:.4f}"
-        else:
-            weather = get_weather_by_ip()
-            if not weather:
-                return JSONResponse(status_code=500, content={"error": "Weather fetch failed"})
-            latlon_str = "Detected via IP"
-
-        print(lat, lon)
-        # === Handle image upload ===
-        image_caption = ""
-        image_path = None
-        if image:
-            image_path = f"temp_{image.filename}"
-            with open(image_path, "wb") as f:
-                f.write(await image.read())
-            image_caption = caption_image_with_gpt4o(image_path)
-        # === Generate prompt ===
-        result = interpret_weather_to_music_prompt(
-            weather=weather,
-            journal=journal or "",
-            image_caption=image_caption or ""
+        if not progressive:
+            return await run_pipeline(
+                location=location,
+                journal=journal,
+                duration=duration,
+                image=image_task,
+                reference=reference_task,
+                interpretation_mode=interpretation_mode,
+                client_ip=_client_ip(request),
+            )
+
+        job_queue.ensure_shared()   # refuse before spending a preview on it
+        response, plan = await run_preview(
+            location=location,
+            journal=journal,
+            duration=duration,
+            image=image_task,
+            reference=reference_task,
+            interpretation_mode=interpretation_mode,
+            client_ip=_client_ip(request),
         )
-        
+        try:
+            job = job_queue.submit(
+                lambda job: render_full(plan, on_stage=job.update_stage),
+                stages=("audio",),
+                on_finish=lambda: discard(plan.reference),
+            )
+        except QueueFull as e:
+            response["full_audio"] = {"status": "error", "error": str(e)}
+        else:
+            handed_off = plan.reference
+            response["full_audio"] = {"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
+        return response
 
-        # === Handle audio generation ===
-        reference_path = None
-        audio_filename = "./audio/generated_music.mp3"
-        duration = min(duration, 180)
+    except (StageError, UploadTooLarge, QueueNotShared, resilience.UpstreamUnavailable, scheduler.Overloaded) as e:
+        return _error_response(e)
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+    finally:
+        # === Clean up temp files, even when a stage raised ===
+        discard(*(item for item in await _collect(image_task, reference_task) if item is not handed_off))
 
-        if reference_audio:
-            reference_path = f"temp_{reference_audio.filename}"
-            with open(reference_path, "wb") as f:
-                f.write(await reference_audio.read())
 
-            audio2audio(
-                prompt=result.suggested_prompt,
-                audio_path=reference_path,
-                duration=duration,
-                filename=audio_filename
-            )
-            gen_mode = "audio2audio"
-        else:
-            text2audio(
-                prompt=result.suggested_prompt,
+# === Batch Mode ===
+@app.post("/generate/batch")
+async def generate_batch(batch: BatchRequest, request: Request):
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        return JSONResponse(status_code=413, content={"error": f"At most {BATCH_MAX_ITEMS} items per batch"})
+
+    async def ndjson():
+        async for line in run_batch(batch.items, batch.parallelism or BATCH_PARALLELISM, _client_ip(request)):
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+# === Job Mode ===
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    request: Request,
+    location: Optional[str] = Form(None),
+    journal: Optional[str] = Form(None),
+    duration: Optional[int] = Form(20),
+    image: Optional[UploadFile] = File(None),
+    reference_audio: Optional[UploadFile] = File(None),
+    interpretation_mode: Optional[str] = Form(None),
+):
+    try:
+        job_queue.ensure_shared()
+    except QueueNotShared as e:
+        return _error_response(e)
+
+    # Uploads must be on disk before returning; the request body is gone afterwards
+    image_task = asyncio.create_task(save_upload(image, MAX_IMAGE_BYTES))
+    reference_task = asyncio.create_task(save_upload(reference_audio, MAX_AUDIO_BYTES))
+    try:
+        saved_image, saved_reference = await asyncio.gather(image_task, reference_task)
+    except UploadTooLarge as e:
+        discard(*await _collect(image_task, reference_task))
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+
+    ip = _client_ip(request)
+
+    async def runner(job):
+        # Nobody is waiting on the response, so interactive requests go first
+        with scheduler.priority("batch"):
+            return await run_pipeline(
+                location=location,
+                journal=journal,
                 duration=duration,
-                filename=audio_filename
+                image=saved_image,
+                reference=saved_reference,
+                on_stage=job.update_stage,
+                interpretation_mode=interpretation_mode,
+                client_ip=ip,
             )
-            gen_mode = "text2audio"
-
-        # === Clean up temp files ===
-        if image_path and os.path.exists(image_path):
-            os.remove(image_path)
-        if reference_path and os.path.exists(reference_path):
-            os.remove(reference_path)
-
-        return {
-            "location": latlon_str,
-            "image_caption": image_caption,
-            "weather_summary": f"{weather['city']} | {weather['temperature']}C | {weather['weather_desc']}",
-            "mood_keywords": result.mood_keywords,
-            "summary": result.summary,
-            "prompt": result.suggested_prompt,
-            "mode": gen_mode,
-            "audio_url": f"/audio/{audio_filename}"
-        }
 
-    except Exception as e:
-        return JSONResponse(status_code=500, content={"error": str(e)})
+    try:
+        job = job_queue.submit(runner, stages=STAGES, on_finish=lambda: discard(saved_image, saved_reference))
+    except QueueFull as e:
+        discard(saved_image, saved_reference)
+        return JSONResponse(status_code=503, content={"error": str(e)}, headers={"Retry-After": "5"})
 
+    return {"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
 
-@app.get("/audio/{filename}")
-def serve_audio(filename: str):
-    path = f"./{filename}"
-    if not os.path.exists(path):
-        return JSONResponse(status_code=404, content={"error": "File not found"})
-    return FileResponse(path, media_type="audio/mpeg")
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None and job_queue.foreign(job_id):
+        return JSONResponse(status_code=409, content={
+            "error": "Job was queued by another server process, or before a restart; its status is not known here"
+        })
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found"})
+    return job.to_dict()
 
 
+@app.get("/audio/{filename}")
+def serve_audio(filename: str, request: Request):
+    path = resolve_store_path(audio_store.root, filename)
+    if path is None:
+        return JSONResponse(status_code=404, content={"error": "File not found"})
+    return audio_file_response(request, path)
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "geocode": geocode_cache.stats(),
+        "gazetteer": gazetteer.stats(),
+        "geoip": geoip.stats(),
+        "weather": weather_cache.stats(),
+        "caption": caption_cache.stats(),
+        "interpretation": interpretation_cache.stats(),
+        "audio": audio_store.stats(),
+        "reference_audio": reference_store.stats(),
+        "jobs": job_queue.stats(),
+        "upstreams": resilience.stats(),
+        "singleflight": singleflight.stats(),
+        "scheduler": scheduler.stats(),
+    }
+
+
+@app.get("/admin/audio")
+def list_audio():
+    return {
+        "stats": audio_store.stats(),
+        "files": audio_store.list(),
+    }
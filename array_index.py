@@ -0,0 +1,67 @@
+import os
+import json
+import mmap
+from typing import Optional
+
+import numpy as np
+
+class ArrayIndex:
+    """
+    A directory of flat arrays compiled from source files, memory-mapped on load.
+
+    Arrays are stored as `.npy` files and raw byte buffers as `.bin` files.
+    meta.json records every source's path, size and mtime plus the caller's
+    build parameters (format version, options); the index is current while
+    all of them match, so editing a source or changing an option triggers a
+    rebuild. `write` removes meta.json first and writes it last, so an
+    interrupted build is never mistaken for a complete one.
+    """
+    def __init__(self, directory: str, sources: list[str], params: Optional[dict] = None):
+        self.directory = directory
+        self.sources = sources
+        self.params = params or {}
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    # === Staleness ===
+    def source_meta(self) -> dict:
+        stats = [os.stat(source) for source in self.sources]
+        return dict(self.params, sources=[os.path.abspath(source) for source in self.sources],
+                    sizes=[stat.st_size for stat in stats], mtimes=[stat.st_mtime for stat in stats])
+
+    def current(self) -> bool:
+        try:
+            with open(self.path("meta.json")) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return all(meta.get(k) == v for k, v in self.source_meta().items())
+
+    # === Build ===
+    def write(self, arrays: dict[str, np.ndarray], blobs: Optional[dict[str, bytes]] = None, **counts):
+        """Write `<name>.npy` per array and `<name>.bin` per blob; `counts` are recorded in meta.json."""
+        os.makedirs(self.directory, exist_ok=True)
+        meta_path = self.path("meta.json")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for name, blob in (blobs or {}).items():
+            with open(self.path(f"{name}.bin"), "wb") as f:
+                f.write(blob)
+        for name, array in arrays.items():
+            np.save(self.path(f"{name}.npy"), array)
+        with open(meta_path, "w") as f:
+            json.dump(dict(self.source_meta(), **counts), f)
+
+    # === Load ===
+    def array(self, name: str) -> np.ndarray:
+        # A plain ndarray view of the memory map: np.memmap slices are slow to create
+        return np.load(self.path(f"{name}.npy"), mmap_mode="r").view(np.ndarray)
+
+    def blob(self, name: str):
+        """A read-only mmap of `<name>.bin` (bytes when empty); slicing returns bytes."""
+        path = self.path(f"{name}.bin")
+        if not os.path.getsize(path):
+            return b""   # mmap refuses empty files
+        with open(path, "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
@@ -0,0 +1,158 @@
+import wave
+import shutil
+import subprocess
+from typing import Optional
+
+import numpy as np
+
+from utils import get_setting
+
+# Runs in spawned worker processes too: keep this module free of caches and
+# other import-time side effects.
+
+# === Configuration (override any of these in config.py) ===
+PREPROCESS_REFERENCE  = get_setting("REFERENCE_PREPROCESS_AUDIO", True)
+REFERENCE_SAMPLE_RATE = get_setting("REFERENCE_SAMPLE_RATE", 44100)
+REFERENCE_CHANNELS    = get_setting("REFERENCE_CHANNELS", 2)           # 1 = downmix to mono; never upmixed
+REFERENCE_FORMAT      = get_setting("REFERENCE_FORMAT", "mp3")         # "mp3" needs ffmpeg, else 16-bit "wav"
+REFERENCE_MP3_BITRATE = get_setting("REFERENCE_MP3_BITRATE", "192k")
+REFERENCE_MIN_SECONDS = get_setting("REFERENCE_MIN_SECONDS", 6)        # audio-to-audio rejects shorter references
+REFERENCE_WORKERS     = get_setting("REFERENCE_PREPROCESS_WORKERS", 2)  # processes; 0 = a worker thread
+
+# ffmpeg is optional: without it only WAV references are preprocessed, and re-encoded as WAV
+FFMPEG = shutil.which("ffmpeg")
+FFPROBE = shutil.which("ffprobe")   # ships with ffmpeg; used to avoid upmixing mono sources
+OUTPUT_FORMAT = REFERENCE_FORMAT if REFERENCE_FORMAT == "wav" or FFMPEG else "wav"
+
+class UnsupportedReference(Exception):
+    """The reference cannot be decoded here; the original file is uploaded instead."""
+
+# === Decoding ===
+def _pcm_to_float(raw: bytes, width: int, channels: int) -> np.ndarray:
+    """Interleaved little-endian PCM -> float32 array of shape (frames, channels) in [-1, 1]."""
+    if width == 1:
+        data = (np.frombuffer(raw, np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        data = np.frombuffer(raw, "<i2").astype(np.float32) / 2 ** 15
+    elif width == 3:
+        b = np.frombuffer(raw, np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = (b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)) << 8 >> 8   # sign-extend 24-bit
+        data = ints.astype(np.float32) / 2 ** 23
+    elif width == 4:
+        data = np.frombuffer(raw, "<i4").astype(np.float32) / 2 ** 31
+    else:
+        raise UnsupportedReference(f"{width * 8}-bit PCM")
+    return data.reshape(-1, channels)
+
+def _decode_wav(path: str, max_seconds: float) -> tuple[np.ndarray, int]:
+    # Only the frames that can end up in the output are read
+    with wave.open(path, "rb") as wav:
+        rate, channels, width = wav.getframerate(), wav.getnchannels(), wav.getsampwidth()
+        raw = wav.readframes(int(max_seconds * rate) + 1)
+    return _pcm_to_float(raw, width, channels), rate
+
+def _source_channels(path: str) -> Optional[int]:
+    """Channels of the first audio stream, or None when ffprobe is not installed."""
+    if not FFPROBE:
+        return None
+    result = subprocess.run(
+        [FFPROBE, "-v", "error", "-select_streams", "a:0", "-show_entries", "stream=channels", "-of", "csv=p=0", path],
+        capture_output=True, check=True,
+    )
+    fields = result.stdout.split()
+    if not fields:
+        raise UnsupportedReference("no audio stream")
+    return int(fields[0])
+
+def _decode_ffmpeg(path: str, max_seconds: float, rate: int, channels: int) -> tuple[np.ndarray, int]:
+    # Compressed formats: ffmpeg decodes straight to the target rate / layout,
+    # downmixing but never upmixing (like `downmix`)
+    channels = min(channels, _source_channels(path) or channels)
+    result = subprocess.run(
+        [FFMPEG, "-v", "error", "-t", f"{max_seconds:.3f}", "-i", path,
+         "-f", "f32le", "-ac", str(channels), "-ar", str(rate), "-"],
+        capture_output=True, check=True,
+    )
+    return np.frombuffer(result.stdout, "<f4").reshape(-1, channels), rate
+
+def decode(path: str, max_seconds: float, rate: int, channels: int) -> tuple[np.ndarray, int]:
+    try:
+        return _decode_wav(path, max_seconds)
+    except (wave.Error, EOFError) as e:
+        if not FFMPEG:
+            raise UnsupportedReference(f"not a PCM WAV and ffmpeg is not installed ({e})") from e
+    return _decode_ffmpeg(path, max_seconds, rate, channels)
+
+# === Buffer Operations ===
+def downmix(samples: np.ndarray, channels: int) -> np.ndarray:
+    if samples.shape[1] <= channels:
+        return samples
+    if channels == 1:
+        return samples.mean(axis=1, keepdims=True)
+    return samples[:, :channels]   # multichannel -> front left / right
+
+def resample(samples: np.ndarray, rate: int, target: int) -> np.ndarray:
+    """Linear-interpolation resampling of every channel at once."""
+    if rate == target or len(samples) < 2:
+        return samples
+    positions = np.arange(int(round(len(samples) * target / rate))) * (rate / target)
+    left = np.minimum(positions.astype(np.int64), len(samples) - 1)
+    right = np.minimum(left + 1, len(samples) - 1)
+    frac = (positions - left)[:, None].astype(np.float32)
+    return samples[left] * (1 - frac) + samples[right] * frac
+
+def fit_length(samples: np.ndarray, frames: int) -> np.ndarray:
+    """Trim to `frames`, or loop a shorter clip until it fills them."""
+    if len(samples) == 0:
+        raise UnsupportedReference("reference contains no audio")
+    if len(samples) >= frames:
+        return samples[:frames]
+    return np.tile(samples, (-(-frames // len(samples)), 1))[:frames]
+
+# === Encoding ===
+def _encode_wav(samples: np.ndarray, rate: int, out_path: str):
+    pcm = (np.clip(samples, -1.0, 1.0) * (2 ** 15 - 1)).astype("<i2")
+    with wave.open(out_path, "wb") as wav:
+        wav.setnchannels(samples.shape[1])
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.tobytes())
+
+def _encode_mp3(samples: np.ndarray, rate: int, out_path: str, bitrate: str):
+    subprocess.run(
+        [FFMPEG, "-v", "error", "-y", "-f", "f32le", "-ar", str(rate), "-ac", str(samples.shape[1]), "-i", "-",
+         "-b:a", bitrate, "-f", "mp3", out_path],
+        input=samples.astype("<f4").tobytes(), check=True,
+    )
+
+def preprocess_params() -> dict:
+    """Every setting that changes the prepared file; part of its cache key."""
+    return {"rate": REFERENCE_SAMPLE_RATE, "channels": REFERENCE_CHANNELS,
+            "format": OUTPUT_FORMAT, "bitrate": REFERENCE_MP3_BITRATE, "min_seconds": REFERENCE_MIN_SECONDS}
+
+def prepare_reference(
+    path: str,
+    out_path: str,
+    duration: float,
+    rate: int = REFERENCE_SAMPLE_RATE,
+    channels: int = REFERENCE_CHANNELS,
+    output_format: str = OUTPUT_FORMAT,
+    bitrate: str = REFERENCE_MP3_BITRATE,
+    min_seconds: float = REFERENCE_MIN_SECONDS,
+) -> str:
+    """
+    Decode a reference clip, trim or loop it to `duration` seconds (but never
+    below `min_seconds`, the provider's minimum), downmix and resample it, and
+    encode it to `out_path`. Pure CPU / file work, so it can run in a worker
+    process.
+    """
+    duration = max(duration, min_seconds)
+    samples, source_rate = decode(path, duration, rate, channels)
+    samples = downmix(samples, channels)
+    samples = resample(samples, source_rate, rate)
+    samples = fit_length(samples, int(round(duration * rate)))
+    if output_format == "mp3":
+        _encode_mp3(samples, rate, out_path, bitrate)
+    else:
+        _encode_wav(samples, rate, out_path)
+    return out_path
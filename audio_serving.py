@@ -0,0 +1,92 @@
+import os
+import re
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from utils import get_setting
+
+# === Configuration (override any of these in config.py) ===
+AUDIO_CACHE_CONTROL = get_setting("AUDIO_CACHE_CONTROL", "public, max-age=86400")
+CHUNK_SIZE          = 64 * 1024
+
+MEDIA_TYPES = {"mp3": "audio/mpeg", "wav": "audio/wav"}
+
+# Only content-addressed store entries are servable: <sha256>.<ext>
+_STORE_NAME = re.compile(r"^[0-9a-f]{64}\.(mp3|wav)$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def resolve_store_path(root: str, filename: str) -> Optional[str]:
+    if not _STORE_NAME.match(filename):
+        return None
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, filename))
+    if os.path.dirname(path) != root or not os.path.isfile(path):
+        return None
+    return path
+
+def _parse_range(header: str, size: int):
+    """Return (start, end) inclusive for a single byte range, None to ignore, or "invalid"."""
+    match = _RANGE.match(header.strip())
+    if not match:
+        return None  # multi-range or unknown unit: serve the whole file
+    first, last = match.groups()
+    if first == "" and last == "":
+        return "invalid"
+    if first == "":
+        length = int(last)
+        if length == 0 or size == 0:
+            return "invalid"
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return "invalid"
+    return start, end
+
+def _iter_file(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def audio_file_response(request: Request, path: str) -> Response:
+    """Serve a stored audio file with ETag / If-None-Match, Cache-Control and single-range support."""
+    size = os.path.getsize(path)
+    name = os.path.basename(path)
+    stem, ext = os.path.splitext(name)
+    headers = {
+        "ETag": f'"{stem}-{size:x}"',
+        "Cache-Control": AUDIO_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    media_type = MEDIA_TYPES.get(ext.lstrip("."), "application/octet-stream")
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or headers["ETag"] in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == headers["ETag"]):
+        byte_range = _parse_range(range_header, size)
+        if byte_range == "invalid":
+            return JSONResponse(
+                status_code=416,
+                content={"error": "Requested range not satisfiable"},
+                headers={"Content-Range": f"bytes */{size}"},
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(length)})
+            return StreamingResponse(_iter_file(path, start, length), status_code=206, media_type=media_type, headers=headers)
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(_iter_file(path, 0, size), media_type=media_type, headers=headers)
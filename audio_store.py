@@ -0,0 +1,144 @@
+import os
+import json
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from utils import get_setting
+
+# === Configuration (override any of these in config.py) ===
+STORE_DIR = get_setting("AUDIO_STORE_DIR", "./audio/store")
+MAX_BYTES = get_setting("AUDIO_STORE_MAX_BYTES", 2 * 1024 ** 3)
+MAX_FILES = get_setting("AUDIO_STORE_MAX_FILES", 5000)
+
+REFERENCE_STORE_DIR       = get_setting("REFERENCE_STORE_DIR", "./cache/reference_audio")
+REFERENCE_STORE_MAX_BYTES = get_setting("REFERENCE_STORE_MAX_BYTES", 512 * 1024 ** 2)
+
+def generation_key(**params) -> str:
+    """Stable hash of every parameter that influences the generated audio."""
+    payload = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class AudioStore:
+    """
+    Content-addressed store for generated audio: `<root>/<key>.<ext>`.
+
+    Files are tracked in least-recently-used order (seeded from mtimes on
+    startup, refreshed with os.utime on every hit) and evicted once the store
+    exceeds `max_bytes` or `max_files`. The directory is scanned on first use
+    and only created when the first file is written, so importing the module
+    (or reading its stats) creates nothing on disk.
+    """
+    def __init__(self, root: str = STORE_DIR, max_bytes: int = MAX_BYTES, max_files: int = MAX_FILES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # filename -> size, oldest first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._ready = False
+
+    def path_for(self, key: str, ext: str) -> str:
+        return os.path.join(self.root, f"{key}.{ext}")
+
+    def temp_path(self, key: str, ext: str) -> str:
+        """Unique scratch path in the store directory, later committed with `put`."""
+        self._open()
+        os.makedirs(self.root, exist_ok=True)
+        return os.path.join(self.root, f".{key}.{uuid.uuid4().hex}.{ext}.part")
+
+    def get(self, key: str, ext: str) -> Optional[str]:
+        name = f"{key}.{ext}"
+        path = self.path_for(key, ext)
+        self._open()
+        with self._lock:
+            if name in self._index and os.path.exists(path):
+                self._index.move_to_end(name)
+                self._stats["hits"] += 1
+                os.utime(path)
+                return path
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, temp_path: str, key: str, ext: str) -> str:
+        name = f"{key}.{ext}"
+        path = self.path_for(key, ext)
+        self._open()
+        os.replace(temp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._total_bytes += size - self._index.pop(name, 0)
+            self._index[name] = size
+            self._stats["stores"] += 1
+            self._evict(keep=name)
+        return path
+
+    def list(self) -> list[dict]:
+        self._open()
+        with self._lock:
+            names = list(reversed(self._index.items()))
+        entries = []
+        for name, size in names:
+            path = os.path.join(self.root, name)
+            try:
+                last_used = os.path.getmtime(path)
+            except OSError:
+                continue
+            entries.append({"name": name, "url": f"/audio/{name}", "size": size, "last_used": last_used})
+        return entries
+
+    def stats(self) -> dict:
+        self._open()
+        with self._lock:
+            stats = dict(self._stats, files=len(self._index), total_bytes=self._total_bytes, max_bytes=self.max_bytes)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    # === Internals ===
+    def _open(self):
+        if self._ready:
+            return
+        with self._lock:
+            if not self._ready:
+                if os.path.isdir(self.root):
+                    self._scan()
+                self._ready = True
+
+    def _scan(self):
+        files = []
+        for entry in os.scandir(self.root):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(".part"):
+                os.remove(entry.path)  # leftover from an interrupted write
+                continue
+            stat = entry.stat()
+            files.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._index[name] = size
+            self._total_bytes += size
+
+    def _evict(self, keep: str):
+        # Caller holds the lock
+        while (self._total_bytes > self.max_bytes or len(self._index) > self.max_files) and len(self._index) > 1:
+            name, size = next(iter(self._index.items()))
+            if name == keep:
+                self._index.move_to_end(name)
+                continue
+            del self._index[name]
+            self._total_bytes -= size
+            self._stats["evictions"] += 1
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+
+# Process-wide instance used by stableaudio_api and the API
+audio_store = AudioStore()
+
+# Preprocessed reference clips for audio2audio uploads (never served)
+reference_store = AudioStore(REFERENCE_STORE_DIR, REFERENCE_STORE_MAX_BYTES)
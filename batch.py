@@ -0,0 +1,133 @@
+import asyncio
+from typing import AsyncIterator, Optional
+
+from pydantic import BaseModel
+
+from opencage_api      import location_text_to_latlon_async
+from openweather_api   import get_weather_by_lat_lon_async, get_weather_by_ip_async
+from weather_to_prompt import interpret_weather_to_music_prompt_async
+from geocode_cache     import normalize_key
+from weather_cache     import weather_cache
+from pipeline          import generate_audio, build_response, StageError, MAX_DURATION
+from utils             import get_setting
+import metrics
+import resilience
+import scheduler
+
+# === Configuration (override any of these in config.py) ===
+BATCH_PARALLELISM = get_setting("BATCH_PARALLELISM", 4)     # items in the LLM / audio stages at once
+BATCH_MAX_ITEMS   = get_setting("BATCH_MAX_ITEMS", 100)
+
+# === Schemas ===
+class BatchItem(BaseModel):
+    location: Optional[str] = None
+    journal: Optional[str] = None
+    duration: int = 20
+
+class BatchRequest(BaseModel):
+    items: list[BatchItem]
+    parallelism: Optional[int] = None
+
+async def _bounded(semaphore: asyncio.Semaphore, stage: str, awaitable):
+    async with semaphore:
+        with scheduler.priority("batch"), metrics.stage(stage):
+            return await awaitable
+
+async def _gather_unique(stage, keys, fetch, semaphore) -> dict:
+    """Run `fetch(key)` once per distinct key; failures are stored as the exception."""
+    keys = list(dict.fromkeys(keys))
+    results = await asyncio.gather(*(_bounded(semaphore, stage, fetch(k)) for k in keys), return_exceptions=True)
+    return dict(zip(keys, results))
+
+async def run_batch(
+    items: list[BatchItem], parallelism: int = BATCH_PARALLELISM, client_ip: Optional[str] = None
+) -> AsyncIterator[dict]:
+    """
+    Generate every item, yielding one result dict per item as soon as it finishes.
+
+    Distinct place names are geocoded once and distinct weather cells are
+    fetched once for the whole batch. The LLM and audio stages run once per
+    distinct (weather cell, journal, duration), at most `parallelism` at a
+    time; `parallelism` is client-supplied, so it is capped at BATCH_PARALLELISM.
+    """
+    semaphore = asyncio.Semaphore(min(max(1, parallelism), BATCH_PARALLELISM))
+
+    # === Geocode each distinct location once ===
+    location_keys = {}
+    for item in items:
+        if item.location and item.location.strip():
+            location_keys.setdefault(normalize_key(item.location), item.location)
+    latlons = await _gather_unique("geocode", location_keys, lambda key: location_text_to_latlon_async(location_keys[key]), semaphore)
+
+    # === Fetch weather once per distinct cell ===
+    cell_coords = {}
+    for latlon in latlons.values():
+        if isinstance(latlon, tuple):
+            cell_coords.setdefault(weather_cache.cell_for(*latlon), latlon)
+    weather_by_cell = await _gather_unique("weather", cell_coords, lambda cell: get_weather_by_lat_lon_async(*cell_coords[cell]), semaphore)
+    ip_weather = None
+    if any(not (item.location and item.location.strip()) for item in items):
+        try:
+            ip_weather = await _bounded(semaphore, "weather", get_weather_by_ip_async(client_ip))
+        except Exception as e:
+            ip_weather = e   # like the lookups above: only the items that need it fail
+
+    def weather_for(item: BatchItem):
+        if not (item.location and item.location.strip()):
+            if isinstance(ip_weather, BaseException):
+                raise ip_weather
+            if not ip_weather:
+                raise StageError(500, "Weather fetch failed")
+            return ip_weather, "Detected via IP", "ip"
+        latlon = latlons[normalize_key(item.location)]
+        if isinstance(latlon, BaseException):
+            raise latlon
+        if not latlon:
+            raise StageError(400, "Invalid location")
+        cell = weather_cache.cell_for(*latlon)
+        weather = weather_by_cell[cell]
+        if isinstance(weather, BaseException):
+            raise weather
+        if not weather:
+            raise StageError(500, "Weather fetch failed")
+        return weather, f"{latlon[0]:.4f}, {latlon[1]:.4f}", cell
+
+    # === LLM + audio once per distinct render, bounded by `parallelism` ===
+    async def render(weather: dict, journal: str, duration: int):
+        async with semaphore:
+            with scheduler.priority("batch"), resilience.deadline():
+                with metrics.stage("interpret"):
+                    result = await interpret_weather_to_music_prompt_async(weather=weather, journal=journal)
+                with metrics.stage("audio"):
+                    audio_path, gen_mode = await generate_audio(result.suggested_prompt, duration)
+        return result, audio_path, gen_mode
+
+    # Items with the same weather, journal and duration share one render,
+    # e.g. "Lima" and "lima " would otherwise each pay for the same track
+    renders: dict[tuple, asyncio.Task] = {}
+
+    async def run_item(index: int, item: BatchItem) -> dict:
+        try:
+            weather, latlon_str, cell = weather_for(item)
+            journal, duration = (item.journal or "").strip(), min(item.duration, MAX_DURATION)
+            key = (cell, journal, duration)
+            if key not in renders:
+                renders[key] = asyncio.create_task(render(weather, journal, duration))
+            # Shielded: one item being cancelled must not cancel a render others share
+            result, audio_path, gen_mode = await asyncio.shield(renders[key])
+            return {"index": index, "status": "done",
+                    "result": build_response(latlon_str, "", weather, result, audio_path, gen_mode)}
+        except Exception as e:
+            error = {"index": index, "status": "error", "error": str(e),
+                     "status_code": getattr(e, "status_code", 500)}
+            if getattr(e, "retry_after", None):
+                error["retry_after"] = e.retry_after
+            return error
+
+    tasks = [asyncio.create_task(run_item(i, item)) for i, item in enumerate(items)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks + list(renders.values()):
+            task.cancel()
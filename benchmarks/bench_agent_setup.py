@@ -0,0 +1,60 @@
+"""
+Per-call overhead of preparing the weather-interpretation agent and prompt.
+
+"before" reproduces what interpret_weather_to_music_prompt used to do on every
+call: build an OpenAIProvider, model and Agent and read the prompt templates
+from disk. "after" goes through the agent registry and the prompt cache. No
+request is sent to OpenAI.
+
+    python benchmarks/bench_agent_setup.py --calls 2000
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pydantic_ai import Agent
+from pydantic_ai.models.openai import OpenAIModel
+from pydantic_ai.providers.openai import OpenAIProvider
+
+from config import OPENAI_API_KEY
+from weather_to_prompt import WeatherInterpretation, create_weather_agent, build_weather_prompt
+
+SAMPLE_WEATHER = {
+    "city": "London", "temperature": 15.3, "humidity": 72,
+    "weather_main": "Clouds", "weather_desc": "broken clouds", "wind_speed": 4.6,
+}
+
+def _read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def before():
+    provider = OpenAIProvider(api_key=OPENAI_API_KEY)
+    model = OpenAIModel(model_name="gpt-4", provider=provider)
+    Agent(model=model, result_type=WeatherInterpretation, system_prompt=_read("prompts/weather_music_system.txt"))
+    agent = Agent(model=model, result_type=WeatherInterpretation, system_prompt=_read("prompts/weather_music_system.txt"))
+    prompt = "context\n\n" + _read("prompts/weather_music_base.txt")
+    return agent, prompt
+
+def after():
+    return create_weather_agent(), build_weather_prompt(SAMPLE_WEATHER, "journal", "caption")
+
+def measure(fn, calls):
+    fn()  # warm up imports and caches
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=1000)
+    args = parser.parse_args()
+
+    os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    t_before = measure(before, args.calls)
+    t_after = measure(after, args.calls)
+    print(f"before: {t_before * 1e6:10.1f} µs/call")
+    print(f"after : {t_after * 1e6:10.1f} µs/call  ({t_before / t_after:.0f}x less overhead)")
@@ -0,0 +1,98 @@
+"""
+Image requests: the separate caption → interpretation path against the fused
+single-call mode, in latency and LLM tokens.
+
+For every image, each run makes the two calls of the separate path
+(caption_image_with_gpt4o, then interpret_weather_to_music_prompt with that
+caption) and one interpret_with_image call, alternating which goes first.
+Caches are bypassed so every run reaches the LLM. Tokens are read from the
+sonification_llm_tokens_total counters. This calls the configured OpenAI
+endpoint and spends tokens; point OPENAI_BASE_URL at
+benchmarks/fake_upstreams.py to time the plumbing only.
+
+    python benchmarks/bench_fused.py ./image --runs 5
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prometheus_client import REGISTRY
+
+from image_caption import caption_image_with_gpt4o
+from weather_to_prompt import interpret_weather_to_music_prompt, interpret_with_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+AGENTS = {"separate": ("caption", "weather"), "fused": ("fused",)}
+
+SAMPLE_WEATHER = {
+    "city": "London",
+    "temperature": 15.3,
+    "humidity": 72,
+    "weather_main": "Clouds",
+    "weather_desc": "broken clouds",
+    "wind_speed": 4.6,
+}
+
+def tokens(mode: str) -> dict:
+    counts = {"request": 0.0, "response": 0.0}
+    for agent in AGENTS[mode]:
+        for kind in counts:
+            counts[kind] += REGISTRY.get_sample_value("sonification_llm_tokens_total", {"agent": agent, "kind": kind}) or 0.0
+    return counts
+
+def separate(path: str, journal: str):
+    caption = caption_image_with_gpt4o(path, use_cache=False)
+    return interpret_weather_to_music_prompt(SAMPLE_WEATHER, journal, caption, use_cache=False)
+
+def fused(path: str, journal: str):
+    return interpret_with_image(SAMPLE_WEATHER, journal, path, use_cache=False)
+
+MODES = {"separate": separate, "fused": fused}
+
+def measure(mode: str, path: str, journal: str) -> tuple[float, dict]:
+    before = tokens(mode)
+    start = time.perf_counter()
+    MODES[mode](path, journal)
+    elapsed = time.perf_counter() - start
+    after = tokens(mode)
+    return elapsed, {kind: after[kind] - before[kind] for kind in after}
+
+def main(image_dir: str, runs: int, journal: str):
+    paths = sorted(
+        os.path.join(image_dir, name) for name in os.listdir(image_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        sys.exit(f"No images found in {image_dir}")
+
+    results = {mode: {"seconds": [], "request": 0.0, "response": 0.0} for mode in MODES}
+    for path in paths:
+        for run in range(runs):
+            order = ("separate", "fused") if run % 2 == 0 else ("fused", "separate")
+            for mode in order:
+                seconds, used = measure(mode, path, journal)
+                results[mode]["seconds"].append(seconds)
+                results[mode]["request"] += used["request"]
+                results[mode]["response"] += used["response"]
+
+    calls = len(paths) * runs
+    print(f"{calls} runs per mode ({len(paths)} images x {runs})\n")
+    print(f"{'mode':<10}{'p50 s':>8}{'mean s':>8}{'max s':>8}{'in tok/run':>12}{'out tok/run':>13}")
+    for mode, result in results.items():
+        seconds = result["seconds"]
+        print(f"{mode:<10}{statistics.median(seconds):8.2f}{statistics.mean(seconds):8.2f}{max(seconds):8.2f}"
+              f"{result['request'] / calls:12.0f}{result['response'] / calls:13.0f}")
+
+    saved = statistics.median(results["separate"]["seconds"]) - statistics.median(results["fused"]["seconds"])
+    print(f"\nfused saves {saved:.2f} s at the median")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per image and mode.")
+    parser.add_argument("--journal", default="Walked home through the grey streets; it felt oddly calming.")
+    args = parser.parse_args()
+    main(args.image_dir, args.runs, args.journal)
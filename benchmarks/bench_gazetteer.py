@@ -0,0 +1,184 @@
+"""
+Offline gazetteer: build time, index size, load time, lookup latency, resident
+memory, and agreement with OpenCage.
+
+Use a real GeoNames dump (e.g. cities15000.txt from
+http://download.geonames.org/export/dump/) with --source, or --synthetic N to
+generate N random places plus a few well-known cities in the same format.
+
+Agreement is measured on a sample of location strings (--sample, one per line,
+optionally followed by tab-separated reference lat / lon). With --opencage,
+lines without reference coordinates are geocoded by the live API (needs
+OPENCAGE_API_KEY). A local answer agrees when it is within --agree-km.
+
+    python benchmarks/bench_gazetteer.py --synthetic 200000
+    python benchmarks/bench_gazetteer.py --source ./data/cities15000.txt --sample ./data/locations.txt --opencage
+"""
+import os
+import sys
+import math
+import time
+import random
+import string
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from gazetteer import Gazetteer, GAZETTEER_PATH, GAZETTEER_MIN_CONFIDENCE, FUZZY_PREFIX
+
+# name, country, lat, lon, population (plus smaller namesakes, to exercise disambiguation)
+KNOWN_PLACES = [
+    ("London", "GB", 51.50853, -0.12574, 8961989), ("London", "CA", 42.98339, -81.23304, 346765),
+    ("Paris", "FR", 48.85341, 2.3488, 2138551), ("Paris", "US", 33.66094, -95.55551, 24782),
+    ("Taipei", "TW", 25.04776, 121.53185, 7871900), ("Reykjavík", "IS", 64.13548, -21.89541, 118918),
+    ("Nairobi", "KE", -1.28333, 36.81667, 2750547), ("Lima", "PE", -12.04318, -77.02824, 7737002),
+    ("Osaka", "JP", 34.69374, 135.50218, 2592413), ("Oslo", "NO", 59.91273, 10.74609, 580000),
+    ("Cairo", "EG", 30.06263, 31.24967, 9606916), ("Hanoi", "VN", 21.0245, 105.84117, 8053663),
+    ("Denver", "US", 39.73915, -104.9847, 715522), ("Perth", "AU", -31.95224, 115.8614, 1896548),
+    ("Perth", "GB", 56.39522, -3.43139, 47180), ("Lisbon", "PT", 38.71667, -9.13333, 517802),
+    ("Quito", "EC", -0.22985, -78.52495, 1399814), ("Seoul", "KR", 37.566, 126.9784, 10349312),
+    ("Dakar", "SN", 14.6937, -17.44406, 2476400), ("Tromsø", "NO", 69.6489, 18.95508, 38980),
+    ("Springfield", "US", 39.80172, -89.64371, 116565), ("Springfield", "US", 37.21533, -93.29824, 166810),
+]
+# Default agreement sample with OpenCage's answers (rounded); None = geocode live with --opencage
+DEFAULT_SAMPLE = [
+    ("London", (51.507, -0.128)), ("London, CA", (42.983, -81.233)), ("Paris", (48.857, 2.352)),
+    ("Paris, Texas", (33.661, -95.556)), ("Taipei", (25.038, 121.564)), ("Reykjavik", (64.146, -21.942)),
+    ("Nairobi", (-1.283, 36.817)), ("Lima", (-12.046, -77.043)), ("Osaka", (34.694, 135.502)),
+    ("Oslo", (59.913, 10.739)), ("Cairo", (30.044, 31.236)), ("Hanoi", (21.028, 105.854)),
+    ("Denver", (39.739, -104.985)), ("Perth", (-31.956, 115.861)), ("Lisbon", (38.722, -9.139)),
+    ("Quito", (-0.220, -78.512)), ("Seoul", (37.567, 126.978)), ("Dakar", (14.693, -17.447)),
+    ("Tromso", (69.649, 18.955)), ("Springfield", (39.799, -89.644)), ("Londn", (51.507, -0.128)),
+    ("Reykjavk", (64.146, -21.942)), ("Taipie", (25.038, 121.564)),
+]
+
+def haversine_km(a, b) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(h))
+
+def geonames_row(geonameid, name, country, lat, lon, population, alternates="") -> str:
+    ascii_name = name.encode("ascii", "ignore").decode() or name
+    cols = [str(geonameid), name, ascii_name, alternates, f"{lat:.5f}", f"{lon:.5f}", "P", "PPL", country,
+            "", "", "", "", "", str(population), "", "", "UTC", "2024-01-01"]
+    return "\t".join(cols) + "\n"
+
+def write_synthetic(path: str, n: int):
+    rng = random.Random(0)
+    with open(path, "w", encoding="utf-8") as f:
+        for i, (name, country, lat, lon, population) in enumerate(KNOWN_PLACES):
+            f.write(geonames_row(i, name, country, lat, lon, population))
+        for i in range(n):
+            name = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 12))).title()
+            f.write(geonames_row(len(KNOWN_PLACES) + i, name, rng.choice(["US", "DE", "BR", "IN", "CN"]),
+                                 rng.uniform(-60, 70), rng.uniform(-180, 180), int(rng.paretovariate(1.2) * 100)))
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+def misspell(name: str, rng: random.Random) -> str:
+    # Drop one letter after the shared prefix: the kind of typo the fuzzy path handles
+    if len(name) <= FUZZY_PREFIX + 1:
+        return name
+    i = rng.randrange(FUZZY_PREFIX, len(name))
+    return name[:i] + name[i + 1:]
+
+def time_lookups(gazetteer: Gazetteer, queries: list[str]) -> dict:
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        gazetteer.lookup(query)
+        times.append(time.perf_counter() - start)
+    cuts = statistics.quantiles(times, n=100)
+    return {"p50_us": cuts[49] * 1e6, "p99_us": cuts[98] * 1e6}
+
+def load_sample(path):
+    if not path:
+        return DEFAULT_SAMPLE
+    sample = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if parts[0]:
+                sample.append((parts[0], (float(parts[1]), float(parts[2])) if len(parts) >= 3 else None))
+    return sample
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default=GAZETTEER_PATH, help="GeoNames-style TSV (default: GAZETTEER_PATH).")
+    parser.add_argument("--synthetic", type=int, help="Generate this many random places instead of using --source.")
+    parser.add_argument("--lookups", type=int, default=20000, help="Timed lookups per query kind.")
+    parser.add_argument("--sample", help="Location strings for the agreement check (see above).")
+    parser.add_argument("--opencage", action="store_true", help="Geocode sample lines without coordinates via OpenCage.")
+    parser.add_argument("--agree-km", type=float, default=25.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_gazetteer_") as workdir:
+        source = args.source
+        if args.synthetic is not None:
+            source = os.path.join(workdir, "synthetic.tsv")
+            write_synthetic(source, args.synthetic)
+        if not source:
+            parser.error("pass --source, --synthetic N, or set GAZETTEER_PATH in config.py")
+        index_dir = os.path.join(workdir, "index")
+
+        start = time.perf_counter()
+        Gazetteer(source, index_dir).build()
+        build_s = time.perf_counter() - start
+        index_mb = sum(e.stat().st_size for e in os.scandir(index_dir)) / 1024 ** 2
+
+        rss_before = rss_mb()
+        gazetteer = Gazetteer(source, index_dir)
+        start = time.perf_counter()
+        gazetteer.load()
+        load_ms = (time.perf_counter() - start) * 1000
+        rss_loaded = rss_mb()
+
+        rng = random.Random(1)
+        names = [gazetteer._names[i].decode("utf-8") for i in rng.sample(range(len(gazetteer._lat)), min(2000, len(gazetteer._lat)))]
+        exact = [rng.choice(names) for _ in range(args.lookups)]
+        fuzzy = [misspell(rng.choice(names), rng) for _ in range(args.lookups // 10)]
+        missing = ["".join(rng.choices("xqz", k=8)) for _ in range(args.lookups)]
+        latency = {"exact": time_lookups(gazetteer, exact), "fuzzy": time_lookups(gazetteer, fuzzy),
+                   "miss": time_lookups(gazetteer, missing)}
+        rss_after = rss_mb()
+
+        print(f"source      : {source} ({os.path.getsize(source) / 1024 ** 2:.1f} MB)")
+        print(f"index       : {gazetteer.stats()['places']} places, {gazetteer.stats()['keys']} names, "
+              f"{index_mb:.1f} MB on disk, built in {build_s:.2f}s")
+        print(f"load        : {load_ms:.1f} ms (memory-mapped)")
+        if rss_before is not None:
+            print(f"RSS         : +{rss_loaded - rss_before:.1f} MB after load, +{rss_after - rss_before:.1f} MB after lookups")
+        for kind, result in latency.items():
+            print(f"{kind:<12}: p50 {result['p50_us']:.1f} µs | p99 {result['p99_us']:.1f} µs")
+
+        # === Agreement ===
+        sample = load_sample(args.sample)
+        if args.opencage:
+            from opencage_api import location_text_to_latlon
+            sample = [(text, ref or location_text_to_latlon(text)) for text, ref in sample]
+        local, agreed, compared = 0, 0, 0
+        print(f"\n{'location':<20} {'local':>22} {'conf':>5} {'reference':>22} {'km':>8}")
+        for text, reference in sample:
+            match = gazetteer.lookup(text)
+            confident = match is not None and match.confidence >= GAZETTEER_MIN_CONFIDENCE
+            local += confident
+            distance = haversine_km((match.lat, match.lon), reference) if confident and reference else None
+            if distance is not None:
+                compared += 1
+                agreed += distance <= args.agree_km
+            shown = f"{match.lat:.3f}, {match.lon:.3f}" if match else "-"
+            print(f"{text:<20} {shown:>22} {match.confidence if match else 0:>5.2f} "
+                  f"{f'{reference[0]:.3f}, {reference[1]:.3f}' if reference else '-':>22} "
+                  f"{f'{distance:.1f}' if distance is not None else '-':>8}{'' if confident else '  → OpenCage'}")
+        print(f"\nresolved locally: {local}/{len(sample)}; agreement within {args.agree_km:g} km: {agreed}/{compared}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Wall-clock latency of POST /generate with simulated upstream latencies.
+
+The provider wrappers imported by `pipeline` are replaced with sleeps that mimic
+typical upstream timings, so the benchmark measures only how the pipeline
+schedules its stages. The serial baseline is the sum of all stage latencies,
+i.e. what the handler cost before stages ran concurrently.
+
+    python benchmarks/bench_generate_latency.py --requests 8 --scale 0.1
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+from types import SimpleNamespace
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import api
+import pipeline
+
+# === Simulated upstream latencies (seconds) ===
+STAGE_LATENCY = {
+    "geocode": 0.4,
+    "weather": 0.3,
+    "caption": 3.0,
+    "interpret": 4.0,
+    "audio": 8.0,
+}
+
+def install_fakes(scale: float):
+    def delay(stage):
+        return STAGE_LATENCY[stage] * scale
+
+    async def geocode(location):
+        await asyncio.sleep(delay("geocode"))
+        return 25.0340, 121.5624
+
+    async def weather(lat, lon):
+        await asyncio.sleep(delay("weather"))
+        return {"city": "Taipei", "temperature": 22.5, "humidity": 80,
+                "weather_main": "Rain", "weather_desc": "light rain", "wind_speed": 3.1}
+
+    async def caption(image_path, image_digest=None, **kwargs):
+        await asyncio.sleep(delay("caption"))
+        return "A rainy street viewed from a café window."
+
+    async def interpret(weather, journal="", image_caption=""):
+        await asyncio.sleep(delay("interpret"))
+        return SimpleNamespace(summary="Quiet rain.", mood_keywords=["calm"], suggested_prompt="Ambient rain piano")
+
+    async def audio(prompt, duration=10, filename="", **kwargs):
+        await asyncio.sleep(delay("audio"))
+        return filename
+
+    pipeline.location_text_to_latlon_async = geocode
+    pipeline.get_weather_by_lat_lon_async = weather
+    pipeline.caption_image_with_gpt4o_async = caption
+    pipeline.interpret_weather_to_music_prompt_async = interpret
+    pipeline.text2audio_async = audio
+    pipeline.audio2audio_async = audio
+
+async def run(n_requests: int, scale: float):
+    install_fakes(scale)
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one():
+            start = time.perf_counter()
+            response = await client.post(
+                "/generate",
+                data={"location": "Taipei 101", "journal": "rainy day", "duration": "20"},
+                files={
+                    "image": ("photo.jpg", b"\xff\xd8" + os.urandom(1 << 16), "image/jpeg"),
+                    "reference_audio": ("ref.wav", os.urandom(1 << 16), "audio/wav"),
+                },
+            )
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        latencies = [await one() for _ in range(n_requests)]
+
+    serial = sum(STAGE_LATENCY.values()) * scale
+    median = statistics.median(latencies)
+    print(f"serial baseline : {serial * 1000:8.1f} ms")
+    print(f"/generate median: {median * 1000:8.1f} ms  ({(1 - median / serial) * 100:.1f}% faster)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=0.1, help="Multiply simulated latencies by this factor.")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.scale))
@@ -0,0 +1,160 @@
+"""
+Local GeoIP lookups against the ipinfo.io call they replace: index build time
+and size, load time, lookup latency (uncached and LRU hits), and correctness
+against a plain Python scan of the same ranges.
+
+Use a real database with --source (a GeoLite2-City .mmdb, or CSV range tables
+such as GeoLite2-City-Blocks-IPv4.csv / -IPv6.csv; repeat --source for
+several), or --synthetic N to generate N random IPv4 ranges plus N / 4 IPv6
+ranges in MaxMind's CSV layout. With --ipinfo the same kind of lookup is
+timed against ipinfo.io (network calls; IPINFO_BASE_URL can point at
+benchmarks/fake_upstreams.py instead).
+
+    python benchmarks/bench_geoip.py --synthetic 500000
+    python benchmarks/bench_geoip.py --source ./data/GeoLite2-City.mmdb --ipinfo
+"""
+import os
+import sys
+import time
+import bisect
+import random
+import argparse
+import tempfile
+import ipaddress
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from geoip import GeoIP, GEOIP_PATH
+
+def write_synthetic(path: str, n: int, version: int, rng: random.Random) -> list[tuple[int, int, float, float]]:
+    """Random non-overlapping CIDR blocks; returns (first, last, lat, lon) sorted by first."""
+    bits = 32 if version == 4 else 128
+    network_type = ipaddress.IPv4Network if version == 4 else ipaddress.IPv6Network
+    prefix_range = (16, 28) if version == 4 else (32, 64)
+    blocks = {}
+    while len(blocks) < n:
+        prefix = rng.randint(*prefix_range)
+        first = rng.getrandbits(prefix) << (bits - prefix)
+        blocks.setdefault(first, (prefix, rng.uniform(-60, 70), rng.uniform(-180, 180)))
+    ranges, previous_last = [], -1
+    with open(path, "w") as f:
+        f.write("network,geoname_id,latitude,longitude,accuracy_radius\n")
+        for first in sorted(blocks):
+            prefix, lat, lon = blocks[first]
+            last = first | ((1 << (bits - prefix)) - 1)
+            if first <= previous_last:
+                continue   # nested in the previous block
+            network = network_type((first, prefix))
+            f.write(f"{network},1,{lat:.4f},{lon:.4f},100\n")
+            ranges.append((first, last, lat, lon))
+            previous_last = last
+    return ranges
+
+def reference_lookup(ranges, ip: str):
+    address = ipaddress.ip_address(ip)
+    table = ranges[address.version]
+    i = bisect.bisect_right(table, (int(address), float("inf"))) - 1
+    if i >= 0 and table[i][1] >= int(address):
+        return table[i][2], table[i][3]
+    return None
+
+def random_ip(rng: random.Random, v6_share: float) -> str:
+    while True:
+        address = (ipaddress.IPv6Address(rng.getrandbits(128)) if rng.random() < v6_share
+                   else ipaddress.IPv4Address(rng.getrandbits(32)))
+        if address.is_global:
+            return str(address)
+
+def ip_in_range(rng: random.Random, reference: dict, v6_share: float) -> str:
+    # Private / reserved addresses are never looked up, so only global ones are sampled
+    while True:
+        version = 6 if rng.random() < v6_share else 4
+        first, last, _, _ = rng.choice(reference[version])
+        address = (ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address)(rng.randint(first, last))
+        if address.is_global:
+            return str(address)
+
+def time_lookups(lookup, ips: list[str]) -> dict:
+    times = []
+    for ip in ips:
+        start = time.perf_counter()
+        lookup(ip)
+        times.append(time.perf_counter() - start)
+    cuts = statistics.quantiles(times, n=100)
+    return {"p50_us": cuts[49] * 1e6, "p99_us": cuts[98] * 1e6}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", action="append", help="CSV range table or .mmdb (default: GEOIP_PATH).")
+    parser.add_argument("--synthetic", type=int, help="Generate this many IPv4 ranges instead of using --source.")
+    parser.add_argument("--lookups", type=int, default=20000, help="Timed lookups per kind.")
+    parser.add_argument("--ipinfo", action="store_true", help="Also time ipinfo.io lookups of sample addresses.")
+    parser.add_argument("--ipinfo-calls", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory(prefix="bench_geoip_") as workdir:
+        sources, reference = args.source or GEOIP_PATH, None
+        if args.synthetic is not None:
+            v4, v6 = os.path.join(workdir, "blocks-ipv4.csv"), os.path.join(workdir, "blocks-ipv6.csv")
+            reference = {4: write_synthetic(v4, args.synthetic, 4, rng), 6: write_synthetic(v6, args.synthetic // 4, 6, rng)}
+            sources = [v4, v6]
+        if not sources:
+            parser.error("pass --source, --synthetic N, or set GEOIP_PATH in config.py")
+        index_dir = os.path.join(workdir, "index")
+
+        probe = GeoIP(sources, index_dir)
+        build_s = None
+        if not probe._is_mmdb:
+            start = time.perf_counter()
+            probe.build()
+            build_s = time.perf_counter() - start
+
+        geoip = GeoIP(sources, index_dir, cache_size=args.lookups)
+        start = time.perf_counter()
+        geoip.load()
+        load_ms = (time.perf_counter() - start) * 1000
+
+        # Half the addresses inside known ranges (when they are known), the rest random
+        ips = [random_ip(rng, 0.2) for _ in range(args.lookups)]
+        if reference:
+            for i in range(0, len(ips), 2):
+                ips[i] = ip_in_range(rng, reference, 0.2)
+        uncached = time_lookups(geoip.latlon, ips)
+        cached = time_lookups(geoip.latlon, ips)
+        stats = geoip.stats()
+
+        print(f"sources     : {', '.join(sources if isinstance(sources, list) else [sources])}")
+        if build_s is not None:
+            index_mb = sum(e.stat().st_size for e in os.scandir(index_dir)) / 1024 ** 2
+            print(f"index       : {stats['ipv4_ranges']} IPv4 + {stats['ipv6_ranges']} IPv6 ranges, "
+                  f"{index_mb:.1f} MB on disk, built in {build_s:.2f}s")
+        print(f"load        : {load_ms:.1f} ms (memory-mapped)")
+        print(f"uncached    : p50 {uncached['p50_us']:.1f} µs | p99 {uncached['p99_us']:.1f} µs")
+        print(f"LRU hit     : p50 {cached['p50_us']:.1f} µs | p99 {cached['p99_us']:.1f} µs")
+        print(f"found       : {stats['found']}/{stats['found'] + stats['not_found']} distinct addresses")
+
+        # === Correctness ===
+        if reference:
+            wrong = 0
+            for ip in ips:
+                expected = reference_lookup(reference, ip)
+                got = geoip.latlon(ip)
+                if (expected is None) != (got is None) or (
+                        got and (abs(got[0] - expected[0]) > 1e-3 or abs(got[1] - expected[1]) > 1e-3)):
+                    wrong += 1
+            print(f"correctness : {len(ips) - wrong}/{len(ips)} agree with a Python scan of the ranges")
+
+        # === ipinfo.io, the call this replaces ===
+        if args.ipinfo:
+            from openweather_api import _get, _ipinfo_url, _parse_loc
+            times = []
+            for ip in ips[:args.ipinfo_calls]:
+                start = time.perf_counter()
+                _parse_loc(_get("ipinfo", _ipinfo_url(ip)).json())
+                times.append(time.perf_counter() - start)
+            print(f"ipinfo.io   : p50 {statistics.median(times) * 1000:.1f} ms | max {max(times) * 1000:.1f} ms "
+                  f"over {len(times)} calls")
+
+if __name__ == "__main__":
+    main()
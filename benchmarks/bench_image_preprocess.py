@@ -0,0 +1,64 @@
+"""
+Caption-stage payload size and latency with and without image preprocessing.
+
+For every image in a directory this reports the base64 data-URL size sent to
+OpenAI for the original file and for the downscaled / re-encoded version,
+plus the preprocessing time. With --caption it also runs
+caption_image_with_gpt4o both ways and reports end-to-end latency (this
+calls the real API and spends tokens).
+
+    python benchmarks/bench_image_preprocess.py ./image
+    python benchmarks/bench_image_preprocess.py ./image --caption
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_caption import build_image_input, caption_image_with_gpt4o
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main(image_dir: str, caption: bool):
+    paths = sorted(
+        os.path.join(image_dir, name) for name in os.listdir(image_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not paths:
+        sys.exit(f"No images found in {image_dir}")
+
+    totals = {"raw": 0, "prepared": 0, "raw_s": 0.0, "prepared_s": 0.0}
+    print(f"{'image':32} {'file KB':>9} {'raw URL KB':>11} {'prep URL KB':>12} {'prep ms':>8}", end="")
+    print(f" {'raw cap s':>10} {'prep cap s':>11}" if caption else "")
+    for path in paths:
+        raw = build_image_input(path, preprocess=False)
+        prepared, prep_s = timed(build_image_input, path, True)
+        totals["raw"] += len(raw.url)
+        totals["prepared"] += len(prepared.url)
+        line = (f"{os.path.basename(path)[:32]:32} {os.path.getsize(path) / 1024:9.0f} "
+                f"{len(raw.url) / 1024:11.0f} {len(prepared.url) / 1024:12.0f} {prep_s * 1000:8.1f}")
+        if caption:
+            _, raw_s = timed(caption_image_with_gpt4o, path, False)
+            _, prepared_s = timed(caption_image_with_gpt4o, path, True)
+            totals["raw_s"] += raw_s
+            totals["prepared_s"] += prepared_s
+            line += f" {raw_s:10.2f} {prepared_s:11.2f}"
+        print(line)
+
+    print(f"\npayload: {totals['raw'] / 1024:.0f} KB -> {totals['prepared'] / 1024:.0f} KB "
+          f"({(1 - totals['prepared'] / totals['raw']) * 100:.1f}% smaller)")
+    if caption:
+        print(f"caption latency: {totals['raw_s']:.2f} s -> {totals['prepared_s']:.2f} s total")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir")
+    parser.add_argument("--caption", action="store_true", help="Also measure end-to-end caption latency (calls OpenAI).")
+    args = parser.parse_args()
+    main(args.image_dir, args.caption)
@@ -0,0 +1,272 @@
+"""
+Load test of POST /generate against local fake upstreams.
+
+Starts benchmarks/fake_upstreams.py and `uvicorn api:app` as subprocesses. The
+API runs from a scratch directory whose generated config.py holds dummy keys and
+points every wrapper at the fakes (caches start cold there). /generate is then
+driven at a fixed concurrency and the run reports p50/p95/p99 latency,
+requests per second, response statuses, the calls each fake upstream received
+(and answered with 429) and the server's resident memory.
+
+The scheduler is off by default because the fakes have no quotas. To measure
+it under overload, give a fake a rate limit and turn it on:
+
+    python benchmarks/bench_load.py --set openai.rate=4 --config SCHEDULER_ENABLED=True --config 'SCHEDULER_LIMITS={"openai":{"rate":4}}'
+
+
+Each run is saved as benchmarks/results/<commit>.json; `--baseline` compares
+against an earlier run and exits non-zero when it regressed by more than
+`--max-regression`.
+
+    python benchmarks/bench_load.py --requests 200 --concurrency 16 --scale 0.05
+    python benchmarks/bench_load.py --requests 200 --concurrency 16 --scale 0.05 --baseline 5e98eb2
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+LOCATIONS = ["Taipei 101", "London", "Reykjavik", "Nairobi", "Lima", "Osaka", "Oslo", "Cairo",
+             "Hanoi", "Denver", "Perth", "Lisbon", "Quito", "Seoul", "Dakar", "Tromsø"]
+
+# === Processes ===
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _write_config(workdir: str, upstream: str, extra: list[str]):
+    lines = [
+        'OPENAI_API_KEY = "bench"',
+        'OPENCAGE_API_KEY = "bench"',
+        'OPENWEATHER_API_KEY = "bench"',
+        'STABILITY_API_KEY = "bench"',
+        f'OPENCAGE_BASE_URL = "{upstream}"',
+        f'OPENWEATHER_BASE_URL = "{upstream}"',
+        f'IPINFO_BASE_URL = "{upstream}"',
+        f'STABILITY_BASE_URL = "{upstream}"',
+        f'OPENAI_BASE_URL = "{upstream}/v1"',
+        "SCHEDULER_ENABLED = False",   # the fakes have no quotas unless --set PROVIDER.rate=N
+        *(line.replace("=", " = ", 1) for line in extra),
+    ]
+    with open(os.path.join(workdir, "config.py"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    # Prompts are loaded relative to the working directory
+    os.symlink(os.path.join(ROOT, "prompts"), os.path.join(workdir, "prompts"))
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{' '.join(proc.args)} exited with {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} not ready after {timeout:.0f}s")
+
+class RssSampler(threading.Thread):
+    """Polls a process's resident set size (Linux /proc) and keeps the peak."""
+    def __init__(self, pid: int, interval: float = 0.2):
+        super().__init__(daemon=True)
+        self.pid, self.interval = pid, interval
+        self.peak_mb, self.last_mb = None, None
+        self._stop_event = threading.Event()
+
+    def read_mb(self):
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            return None
+
+    def run(self):
+        while not self._stop_event.is_set():
+            rss = self.read_mb()
+            if rss is not None:
+                self.last_mb = rss
+                self.peak_mb = max(self.peak_mb or 0.0, rss)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+# === Load Driver ===
+async def drive(base_url: str, n_requests: int, concurrency: int, n_locations: int, cacheable: bool, image: bytes):
+    locations = LOCATIONS[:max(1, n_locations)]
+    latencies, statuses = [], {}
+    next_index = 0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None,
+                                 limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def worker():
+            nonlocal next_index
+            while next_index < n_requests:
+                i = next_index
+                next_index += 1
+                data = {"location": random.choice(locations), "duration": "20",
+                        "journal": "" if cacheable else f"bench entry {i} {random.random()}"}
+                files = {"image": ("bench.jpg", image, "image/jpeg")} if image else None
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/generate", data=data, files=files)
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+def summarize(latencies: list[float], statuses: dict, elapsed: float) -> dict:
+    cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    ok = statuses.get("200", 0)
+    return {
+        "requests": len(latencies),
+        "errors": len(latencies) - ok,
+        "statuses": statuses,
+        "p50_ms": cuts[49] * 1000,
+        "p95_ms": cuts[94] * 1000,
+        "p99_ms": cuts[98] * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "rps": ok / elapsed if elapsed else 0.0,
+        "elapsed_s": elapsed,
+    }
+
+# === Results Across Commits ===
+def git_commit() -> tuple[str, bool]:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    commit = git("rev-parse", "--short", "HEAD") or "unknown"
+    dirty = bool(git("status", "--porcelain", "--untracked-files=no"))
+    return commit, dirty
+
+def load_baseline(ref: str) -> dict:
+    path = ref if os.path.exists(ref) else os.path.join(RESULTS_DIR, f"{ref}.json")
+    with open(path) as f:
+        return json.load(f)
+
+# metric -> True if higher is better
+COMPARED = {"p50_ms": False, "p95_ms": False, "p99_ms": False, "rps": True, "peak_rss_mb": False}
+
+def compare(baseline: dict, current: dict, max_regression: float) -> bool:
+    """Print a side-by-side table; returns True if any metric regressed past the threshold."""
+    regressed = False
+    print(f"\n{'metric':<12} {baseline['commit']:>12} {current['commit']:>12} {'change':>9}")
+    for metric, higher_is_better in COMPARED.items():
+        old, new = baseline["results"].get(metric), current["results"].get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = -change if higher_is_better else change
+        flag = "  ❌" if worse > max_regression else ""
+        regressed |= bool(flag)
+        print(f"{metric:<12} {old:>12.1f} {new:>12.1f} {change * 100:>+8.1f}%{flag}")
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=10, help="Requests sent (and discarded) before measuring.")
+    parser.add_argument("--locations", type=int, default=8, help="Distinct locations to draw from.")
+    parser.add_argument("--cacheable", action="store_true", help="Send empty journals so interpretations can be cached.")
+    parser.add_argument("--image", help="Attach this image to every request.")
+    parser.add_argument("--scale", type=float, default=0.05, help="Upstream latency scale (see fake_upstreams.py).")
+    parser.add_argument("--set", action="append", default=[], metavar="PROVIDER.FIELD=VALUE",
+                        help="Upstream profile override, e.g. openai.error_rate=0.01.")
+    parser.add_argument("--config", action="append", default=[], metavar="NAME=VALUE",
+                        help="Extra config.py line for the API, e.g. JOB_WORKERS=8.")
+    parser.add_argument("--baseline", help="Commit id (or results JSON path) to compare against.")
+    parser.add_argument("--max-regression", type=float, default=0.10, help="Allowed relative regression, default 10%%.")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    image = open(args.image, "rb").read() if args.image else b""
+    upstream_port, api_port = _free_port(), _free_port()
+    upstream = f"http://127.0.0.1:{upstream_port}"
+    api_url = f"http://127.0.0.1:{api_port}"
+
+    with tempfile.TemporaryDirectory(prefix="bench_load_") as workdir:
+        _write_config(workdir, upstream, args.config)
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        fakes = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "benchmarks", "fake_upstreams.py"), "--port", str(upstream_port),
+             "--scale", str(args.scale), *(f"--set={s}" for s in args.set)],
+            env=env,
+        )
+        # cwd first on sys.path, so the generated config.py wins over any real one
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api:app", "--port", str(api_port), "--log-level", "warning"],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL,
+        )
+        try:
+            _wait_ready(f"{upstream}/healthz", fakes)
+            _wait_ready(f"{api_url}/cache/stats", server)
+            if args.warmup:
+                asyncio.run(drive(api_url, args.warmup, min(args.warmup, args.concurrency),
+                                  args.locations, args.cacheable, image))
+
+            sampler = RssSampler(server.pid)
+            sampler.start()
+            latencies, statuses, elapsed = asyncio.run(drive(
+                api_url, args.requests, args.concurrency, args.locations, args.cacheable, image
+            ))
+            sampler.stop()
+            upstream_counts = httpx.get(f"{upstream}/healthz").json()["counts"]
+        finally:
+            for proc in (server, fakes):
+                proc.terminate()
+                proc.wait(timeout=10)
+
+    results = summarize(latencies, statuses, elapsed)
+    results["peak_rss_mb"] = sampler.peak_mb
+    results["end_rss_mb"] = sampler.last_mb
+    results["upstreams"] = upstream_counts
+    commit, dirty = git_commit()
+    run = {"commit": commit + ("-dirty" if dirty else ""), "timestamp": time.time(), "params": vars(args), "results": results}
+
+    print(f"commit      : {run['commit']}")
+    print(f"requests    : {results['requests']} ({results['errors']} errors) at concurrency {args.concurrency}")
+    print(f"latency     : p50 {results['p50_ms']:.1f} ms | p95 {results['p95_ms']:.1f} ms | p99 {results['p99_ms']:.1f} ms")
+    print(f"throughput  : {results['rps']:.2f} req/s")
+    print(f"statuses    : {', '.join(f'{status} × {n}' for status, n in sorted(statuses.items()))}")
+    print("upstreams   : " + ", ".join(f"{provider} {c['calls']} ({c['rate_limited']} × 429)"
+                                      for provider, c in upstream_counts.items() if c["calls"]))
+    if sampler.peak_mb is not None:
+        print(f"server RSS  : peak {sampler.peak_mb:.1f} MB, end {sampler.last_mb:.1f} MB")
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{run['commit']}.json")
+        with open(path, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"💾 Saved {os.path.relpath(path, ROOT)}")
+
+    if args.baseline:
+        if compare(load_baseline(args.baseline), run, args.max_regression):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Reference-audio preprocessing for audio2audio: upload size and time, raw vs. prepared.
+
+Uses the given file, or synthesizes a long 48 kHz / 24-bit stereo WAV (the
+kind of reference that used to be uploaded as-is). The file is prepared
+`--runs` times for each duration, and the prepared size is compared with the
+original at an assumed uplink speed. No API calls are made.
+
+    python benchmarks/bench_reference_audio.py --seconds 180 --duration 20 --duration 60
+    python benchmarks/bench_reference_audio.py ./audio/synth_loop.wav --uplink-mbps 10
+"""
+import os
+import sys
+import time
+import wave
+import argparse
+import tempfile
+import statistics
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import audio_preprocess
+
+def synthesize(path: str, seconds: float, rate: int = 48000):
+    t = np.arange(int(seconds * rate)) / rate
+    signal = np.stack([np.sin(2 * np.pi * 220 * t), np.sin(2 * np.pi * 330 * t)], axis=1) * 0.5
+    ints = (signal * (2 ** 23 - 1)).astype("<i4")
+    pcm24 = np.frombuffer(ints.tobytes(), np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(3)
+        wav.setframerate(rate)
+        wav.writeframes(pcm24)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("reference", nargs="?", help="Reference file; a synthetic WAV is used if omitted.")
+    parser.add_argument("--seconds", type=float, default=180, help="Length of the synthetic reference.")
+    parser.add_argument("--duration", type=int, action="append", help="Requested audio duration(s), default 20.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--uplink-mbps", type=float, default=20.0, help="Assumed upload bandwidth.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_reference_") as workdir:
+        reference = args.reference
+        if not reference:
+            reference = os.path.join(workdir, "reference.wav")
+            synthesize(reference, args.seconds)
+        raw_bytes = os.path.getsize(reference)
+        upload_s = lambda size: size * 8 / (args.uplink_mbps * 1e6)
+
+        print(f"reference : {reference} ({raw_bytes / 1024 ** 2:.1f} MB)")
+        print(f"output    : {audio_preprocess.OUTPUT_FORMAT}, {audio_preprocess.REFERENCE_SAMPLE_RATE} Hz, "
+              f"{audio_preprocess.REFERENCE_CHANNELS} ch (ffmpeg {'found' if audio_preprocess.FFMPEG else 'not found'})")
+        print(f"\n{'duration':>8} {'prep ms':>9} {'bytes':>12} {'ratio':>7} {'upload s':>9} {'raw upload s':>13}")
+        for duration in args.duration or [20]:
+            out_path = os.path.join(workdir, f"prepared_{duration}.{audio_preprocess.OUTPUT_FORMAT}")
+            times = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                audio_preprocess.prepare_reference(reference, out_path, duration)
+                times.append(time.perf_counter() - start)
+            size = os.path.getsize(out_path)
+            print(f"{duration:>7}s {statistics.median(times) * 1000:>9.1f} {size:>12,} {raw_bytes / size:>6.1f}x "
+                  f"{upload_s(size):>9.2f} {upload_s(raw_bytes):>13.2f}")
+
+if __name__ == "__main__":
+    main()
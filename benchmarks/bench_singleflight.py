@@ -0,0 +1,126 @@
+"""
+Thundering herd: upstream calls made by a burst of identical /generate requests,
+with and without single-flight coalescing.
+
+For each mode a fresh benchmarks/fake_upstreams.py and `uvicorn api:app` are
+started from a scratch directory (cold caches, SINGLEFLIGHT_ENABLED set in the
+generated config.py). `--burst` requests for the same location are then sent at
+once, `--rounds` times with a pause in between, so every round after the first
+also measures what the caches already absorb. The run reports the calls each
+fake upstream received, the coalesced counts from /cache/stats and latency.
+
+    python benchmarks/bench_singleflight.py --burst 50 --rounds 3 --scale 0.2
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROVIDERS = ("opencage", "openweather", "openai")
+
+# === Processes ===
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _write_config(workdir: str, upstream: str, singleflight: bool):
+    lines = [f'{name} = "bench"' for name in
+             ("OPENAI_API_KEY", "OPENCAGE_API_KEY", "OPENWEATHER_API_KEY", "STABILITY_API_KEY")]
+    lines += [f'{name}_BASE_URL = "{upstream}"' for name in ("OPENCAGE", "OPENWEATHER", "IPINFO", "STABILITY")]
+    lines += [f'OPENAI_BASE_URL = "{upstream}/v1"', f"SINGLEFLIGHT_ENABLED = {singleflight}",
+              "WARMUP_ON_STARTUP = False", "SCHEDULER_ENABLED = False"]
+    with open(os.path.join(workdir, "config.py"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.symlink(os.path.join(ROOT, "prompts"), os.path.join(workdir, "prompts"))
+
+def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{' '.join(proc.args)} exited with {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} not ready after {timeout:.0f}s")
+
+# === Burst Driver ===
+async def burst(api_url: str, n: int, location: str) -> list[float]:
+    async with httpx.AsyncClient(base_url=api_url, timeout=None, limits=httpx.Limits(max_connections=n)) as client:
+        async def one():
+            start = time.perf_counter()
+            response = await client.post("/generate", data={"location": location, "journal": "", "duration": "20"})
+            response.raise_for_status()
+            return time.perf_counter() - start
+        return list(await asyncio.gather(*(one() for _ in range(n))))
+
+def run_mode(args, singleflight: bool) -> dict:
+    upstream_port, api_port = _free_port(), _free_port()
+    upstream, api_url = f"http://127.0.0.1:{upstream_port}", f"http://127.0.0.1:{api_port}"
+    with tempfile.TemporaryDirectory(prefix="bench_singleflight_") as workdir:
+        _write_config(workdir, upstream, singleflight)
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        fakes = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "benchmarks", "fake_upstreams.py"), "--port", str(upstream_port),
+             "--scale", str(args.scale), *(f"--set={s}" for s in args.set)],
+            env=env,
+        )
+        # cwd first on sys.path, so the generated config.py wins over any real one
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api:app", "--port", str(api_port), "--log-level", "warning"],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL,
+        )
+        try:
+            _wait_ready(f"{upstream}/healthz", fakes)
+            _wait_ready(f"{api_url}/cache/stats", server)
+            latencies = []
+            for round_index in range(args.rounds):
+                if round_index:
+                    time.sleep(args.pause)
+                latencies += asyncio.run(burst(api_url, args.burst, args.location))
+            counts = httpx.get(f"{upstream}/healthz").json()["counts"]
+            coalesced = httpx.get(f"{api_url}/cache/stats").json()["singleflight"]
+        finally:
+            for proc in (server, fakes):
+                proc.terminate()
+                proc.wait(timeout=10)
+    return {
+        "calls": {provider: counts[provider]["calls"] for provider in PROVIDERS},
+        "coalesced": {group: stats["coalesced"] for group, stats in coalesced.items()},
+        "p50_ms": statistics.median(latencies) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst", type=int, default=50, help="Concurrent identical requests per round.")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--pause", type=float, default=1.0, help="Seconds between rounds.")
+    parser.add_argument("--location", default="Reykjavik")
+    parser.add_argument("--scale", type=float, default=0.2, help="Upstream latency scale (see fake_upstreams.py).")
+    parser.add_argument("--set", action="append", default=["stability.median=0.5", "stability.p99=1"],
+                        metavar="PROVIDER.FIELD=VALUE", help="Upstream profile override.")
+    args = parser.parse_args()
+
+    results = {mode: run_mode(args, mode == "single-flight") for mode in ("off", "single-flight")}
+    total = args.burst * args.rounds
+    print(f"{total} requests for {args.location!r} ({args.rounds} bursts of {args.burst})\n")
+    print(f"{'mode':<14}" + "".join(f"{p + ' calls':>18}" for p in PROVIDERS) + f"{'p50 ms':>10}{'max ms':>10}")
+    for mode, result in results.items():
+        print(f"{mode:<14}" + "".join(f"{result['calls'][p]:>18}" for p in PROVIDERS)
+              + f"{result['p50_ms']:>10.0f}{result['max_ms']:>10.0f}")
+    print(f"\ncoalesced: {results['single-flight']['coalesced']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Cold-start cost of `import api` and `import ui`, checked against a tracked budget.
+
+Each module is imported N times in a fresh interpreter. The median wall time of
+the import is reported, and the run checks that the heavy dependencies that
+should load on first use or in warmup (pydantic_ai, openai, gradio) were not
+imported, and that the import opened, listed or created nothing in the
+working directory (caches and stores load on first use or in warmup). One extra `python -X importtime` run breaks the time down by
+top-level package. For the API it also times `uvicorn api:app` from spawn to
+the first answered request.
+
+Runs happen in a scratch directory with a dummy config.py, so no keys are
+needed. It is seeded with a populated caption log (`--caption-entries`) so
+the timings reflect a deployment that has been running for a while, not an
+empty one. Budgets live in benchmarks/startup_budget.json as multiples of a
+bare `import fastapi` timed the same way on the same host, so they hold on
+slower or busier machines; the script exits non-zero when a median is over
+budget or a lazy dependency was imported. `--update-budget` rewrites the
+file from this run plus `--headroom`.
+
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --runs 9 --update-budget
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_PATH = os.path.join(ROOT, "benchmarks", "startup_budget.json")
+
+MODULES = ("api", "ui")
+BASELINE = "fastapi"   # budgets are relative to importing this alone
+LAZY = ("pydantic_ai", "openai", "gradio")
+
+# Audit events for file system access under the working directory; the
+# generated config.py and bytecode caches are the only expected ones
+TIMED_IMPORT = """
+import os, sys, json, time
+cwd, touched = os.getcwd() + os.sep, set()
+def audit(event, args):
+    if event in ("open", "os.mkdir", "os.listdir", "os.scandir", "sqlite3.connect") and isinstance(args[0], str):
+        path = os.path.abspath(args[0])
+        if path.startswith(cwd) and "__pycache__" not in path and os.path.basename(path) != "config.py":
+            touched.add(os.path.relpath(path, cwd))
+sys.addaudithook(audit)
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [m for m in {lazy!r} if m in sys.modules], "touched": sorted(touched)}}))
+"""
+
+# === Scratch Environment ===
+def _write_config(workdir: str):
+    lines = [f'{name} = "bench"' for name in
+             ("OPENAI_API_KEY", "OPENCAGE_API_KEY", "OPENWEATHER_API_KEY", "STABILITY_API_KEY")]
+    lines.append("WARMUP_ON_STARTUP = False")   # measure startup alone, not the warmup thread
+    with open(os.path.join(workdir, "config.py"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.symlink(os.path.join(ROOT, "prompts"), os.path.join(workdir, "prompts"))
+
+def _seed_caches(workdir: str, caption_entries: int):
+    """A caption log of `caption_entries` lines at the default CAPTION_CACHE_PATH."""
+    os.makedirs(os.path.join(workdir, "cache"), exist_ok=True)
+    with open(os.path.join(workdir, "cache", "captions.jsonl"), "w", encoding="utf-8") as f:
+        for i in range(caption_entries):
+            f.write(json.dumps({"sha256": f"{i:064x}", "phash": i * 2654435761 % 2 ** 64,
+                                "caption": f"A seeded caption number {i} for the startup benchmark"}) + "\n")
+
+def _python(workdir: str, *args: str) -> subprocess.CompletedProcess:
+    # cwd first on sys.path, so the generated config.py wins over any real one
+    return subprocess.run(
+        [sys.executable, *args], cwd=workdir, capture_output=True, text=True, check=True,
+        env=dict(os.environ, PYTHONPATH=ROOT),
+    )
+
+# === Measurements ===
+def timed_import(workdir: str, module: str) -> dict:
+    out = _python(workdir, "-c", TIMED_IMPORT.format(module=module, lazy=LAZY)).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+def import_breakdown(workdir: str, module: str) -> dict[str, float]:
+    """Self time (ms) per top-level package from one `-X importtime` run."""
+    stderr = _python(workdir, "-X", "importtime", "-c", f"import {module}").stderr
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _cumulative, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0.0) + int(self_us) / 1000
+    return totals
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def time_to_ready(workdir: str, timeout: float = 60.0) -> float:
+    """Seconds from spawning `uvicorn api:app` until /cache/stats answers."""
+    port = _free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level", "warning"],
+        cwd=workdir, env=dict(os.environ, PYTHONPATH=ROOT), stdout=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {server.returncode}")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/cache/stats", timeout=1.0).status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.01)
+        raise TimeoutError(f"API not ready after {timeout:.0f}s")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+# === Budget ===
+def relative(measured: dict) -> dict:
+    """import_ms / ready_ms as multiples of the baseline import measured alongside them."""
+    return {metric.replace("_ms", "_x"): measured[metric] / measured["baseline_ms"]
+            for metric in ("import_ms", "ready_ms") if measured.get(metric) is not None}
+
+def check(results: dict, budget: dict) -> list[str]:
+    failures = []
+    for module, measured in results.items():
+        ratios = relative(measured)
+        for metric, limit in budget.get(module, {}).items():
+            value = ratios.get(metric)
+            if value is not None and value > limit:
+                failures.append(f"{module} {metric} {value:.2f}x > budget {limit:.2f}x "
+                                f"({measured[metric.replace('_x', '_ms')]:.0f} ms, import {BASELINE} "
+                                f"{measured['baseline_ms']:.0f} ms)")
+        for name in measured["eager_lazy_modules"]:
+            failures.append(f"{module} imports {name} at startup")
+        for path in measured["startup_file_io"]:
+            failures.append(f"{module} touches {path} at import")
+    return failures
+
+def update_budget(results: dict, headroom: float):
+    budget = {
+        module: {metric: round(ratio * (1 + headroom), 2) for metric, ratio in relative(measured).items()}
+        for module, measured in results.items()
+    }
+    with open(BUDGET_PATH, "w") as f:
+        json.dump(budget, f, indent=2)
+        f.write("\n")
+    print(f"💾 Saved {os.path.relpath(BUDGET_PATH, ROOT)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module (median is reported).")
+    parser.add_argument("--modules", nargs="+", default=list(MODULES), choices=MODULES)
+    parser.add_argument("--top", type=int, default=8, help="Packages shown in the importtime breakdown.")
+    parser.add_argument("--caption-entries", type=int, default=200_000,
+                        help="Lines in the seeded caption log, default 200000; 0 starts with empty caches.")
+    parser.add_argument("--no-serve", action="store_true", help="Skip the uvicorn time-to-ready measurement.")
+    parser.add_argument("--update-budget", action="store_true", help="Rewrite the budget file from this run.")
+    parser.add_argument("--headroom", type=float, default=0.5, help="Slack added by --update-budget, default 50%%.")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as workdir:
+        _write_config(workdir)
+        _seed_caches(workdir, args.caption_entries)
+        for module in args.modules:
+            # Baseline imports alternate with the module's, so both see the same machine load
+            runs, baseline = [], []
+            for _ in range(args.runs):
+                baseline.append(timed_import(workdir, BASELINE)["seconds"])
+                runs.append(timed_import(workdir, module))
+            measured = {
+                "import_ms": statistics.median(run["seconds"] for run in runs) * 1000,
+                "baseline_ms": statistics.median(baseline) * 1000,
+                "eager_lazy_modules": sorted({name for run in runs for name in run["loaded"]}),
+                "startup_file_io": sorted({path for run in runs for path in run["touched"]}),
+            }
+            if module == "api" and not args.no_serve:
+                measured["ready_ms"] = statistics.median(time_to_ready(workdir) for _ in range(args.runs)) * 1000
+            results[module] = measured
+            ratios = relative(measured)
+
+            print(f"\nimport {module:<4}: median {measured['import_ms']:.0f} ms over {args.runs} runs "
+                  f"({ratios['import_x']:.2f}x import {BASELINE}, {measured['baseline_ms']:.0f} ms)")
+            if "ready_ms" in measured:
+                print(f"uvicorn    : ready in {measured['ready_ms']:.0f} ms ({ratios['ready_x']:.2f}x)")
+            print(f"lazy deps  : {', '.join(measured['eager_lazy_modules']) or 'none imported'}")
+            print(f"file I/O   : {', '.join(measured['startup_file_io']) or 'none at import'}")
+            breakdown = sorted(import_breakdown(workdir, module).items(), key=lambda item: -item[1])
+            for package, ms in breakdown[:args.top]:
+                print(f"  {package:<24} {ms:>8.1f} ms")
+
+    if args.update_budget:
+        update_budget(results, args.headroom)
+        return
+
+    if not os.path.exists(BUDGET_PATH):
+        print(f"\n⚠️ No budget at {os.path.relpath(BUDGET_PATH, ROOT)}; run with --update-budget to create one")
+        return
+    with open(BUDGET_PATH) as f:
+        failures = check(results, json.load(f))
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("\n✅ Within startup budget")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Local stand-ins for every upstream API: OpenCage, OpenWeather, ipinfo, OpenAI
+chat completions and Stable Audio, with configurable latency and error rates.
+
+Latencies are log-normal, described per provider by their median and p99;
+`error_rate` is the fraction of calls answered with HTTP 503, and a non-zero
+`rate` (calls per second) answers calls above that rate with HTTP 429, like a
+provider's quota. OpenAI calls are
+answered with a `final_result` tool call whose arguments are generated from the
+request's JSON schema, so `WeatherInterpretation` and `ImageCaption` both parse.
+
+    python benchmarks/fake_upstreams.py --port 8900 --scale 0.1 --set openai.median=1.5 --set stability.error_rate=0.02
+
+Point the app at it from config.py:
+
+    OPENCAGE_BASE_URL = OPENWEATHER_BASE_URL = IPINFO_BASE_URL = STABILITY_BASE_URL = "http://127.0.0.1:8900"
+    OPENAI_BASE_URL = "http://127.0.0.1:8900/v1"
+"""
+import os
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+# === Default latency / error profiles (seconds) ===
+DEFAULT_PROFILES = {
+    "opencage":    {"median": 0.15, "p99": 0.6,  "error_rate": 0.0, "rate": 0},
+    "openweather": {"median": 0.10, "p99": 0.5,  "error_rate": 0.0, "rate": 0},
+    "ipinfo":      {"median": 0.05, "p99": 0.3,  "error_rate": 0.0, "rate": 0},
+    "openai":      {"median": 2.5,  "p99": 8.0,  "error_rate": 0.0, "rate": 0},
+    "stability":   {"median": 8.0,  "p99": 20.0, "error_rate": 0.0, "rate": 0},
+}
+AUDIO_BYTES = 512 * 1024   # size of each fake render
+
+Z_99 = 2.326  # standard-normal quantile of the 99th percentile
+
+def sample_latency(profile: dict, scale: float = 1.0) -> float:
+    median, p99 = profile["median"], max(profile["p99"], profile["median"])
+    if median <= 0:
+        return 0.0
+    sigma = math.log(p99 / median) / Z_99
+    return random.lognormvariate(math.log(median), sigma) * scale
+
+def parse_overrides(pairs) -> dict:
+    """`["openai.median=1.5", ...]` -> profiles with those fields replaced."""
+    profiles = {name: dict(profile) for name, profile in DEFAULT_PROFILES.items()}
+    for pair in pairs or []:
+        key, value = pair.split("=", 1)
+        provider, field = key.split(".", 1)
+        profiles[provider][field] = float(value)
+    return profiles
+
+# === Structured-output Faking ===
+def fake_value(schema: dict, defs: dict, name: str = "value"):
+    """A value that validates against a (pydantic-generated) JSON schema."""
+    if "$ref" in schema:
+        schema = defs[schema["$ref"].rsplit("/", 1)[-1]]
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            return fake_value(schema[key][0], defs, name)
+    kind = schema.get("type", "string")
+    if kind == "object":
+        return {prop: fake_value(sub, defs, prop) for prop, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [fake_value(schema.get("items", {}), defs, name) for _ in range(3)]
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "boolean":
+        return False
+    return f"fake {name} {uuid.uuid4().hex[:8]}"  # unique, so downstream caches keyed on it still miss
+
+def chat_completion(body: dict) -> dict:
+    message = {"role": "assistant", "content": None}
+    tools = body.get("tools") or []
+    if tools:
+        function = tools[0]["function"]
+        schema = function.get("parameters", {})
+        arguments = fake_value(schema, schema.get("$defs", {}))
+        message["tool_calls"] = [{
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {"name": function["name"], "arguments": json.dumps(arguments)},
+        }]
+        finish_reason = "tool_calls"
+    else:
+        message["content"] = "fake completion"
+        finish_reason = "stop"
+
+    prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+    completion_tokens = len(json.dumps(message)) // 4
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+def _coords_for(text: str) -> tuple[float, float]:
+    # Stable per place name, so distinct names land in distinct weather cells
+    digest = hashlib.sha256(text.casefold().encode("utf-8")).digest()
+    lat = int.from_bytes(digest[:4], "big") / 2 ** 32 * 140 - 70
+    lon = int.from_bytes(digest[4:8], "big") / 2 ** 32 * 360 - 180
+    return round(lat, 6), round(lon, 6)
+
+# === App ===
+def create_app(profiles: dict = DEFAULT_PROFILES, scale: float = 1.0, audio_bytes: int = AUDIO_BYTES) -> FastAPI:
+    app = FastAPI(title="Fake upstreams")
+    audio = os.urandom(audio_bytes)
+    counts = {name: {"calls": 0, "errors": 0, "rate_limited": 0} for name in profiles}
+    buckets = {name: [max(1.0, profile.get("rate", 0)), time.monotonic()] for name, profile in profiles.items()}
+
+    def over_rate(provider: str) -> bool:
+        rate = profiles[provider].get("rate", 0)
+        if not rate:
+            return False
+        bucket, now = buckets[provider], time.monotonic()
+        bucket[0] = min(max(1.0, rate), bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return True
+        bucket[0] -= 1
+        return False
+
+    async def simulate(provider: str):
+        """Sleep for a sampled latency; returns an error response if this call should fail."""
+        profile = profiles[provider]
+        counts[provider]["calls"] += 1
+        if over_rate(provider):
+            counts[provider]["rate_limited"] += 1
+            return JSONResponse(status_code=429, content={"error": f"fake {provider} rate limit"})
+        await asyncio.sleep(sample_latency(profile, scale))
+        if random.random() < profile.get("error_rate", 0.0):
+            counts[provider]["errors"] += 1
+            return JSONResponse(status_code=503, content={"error": f"fake {provider} failure"})
+        return None
+
+    @app.get("/healthz")
+    def healthz():
+        return {"ok": True, "counts": counts}
+
+    @app.get("/geocode/v1/json")
+    async def opencage(q: str = ""):
+        if error := await simulate("opencage"):
+            return error
+        lat, lng = _coords_for(q)
+        return {"results": [{"geometry": {"lat": lat, "lng": lng}}]}
+
+    @app.get("/data/2.5/weather")
+    async def openweather(lat: float = 0.0, lon: float = 0.0, q: str = ""):
+        if error := await simulate("openweather"):
+            return error
+        return {
+            "name": q or f"Cell {lat:.1f},{lon:.1f}",
+            "main": {"temp": round(random.uniform(-5, 35), 1), "humidity": random.randint(20, 100)},
+            "weather": [{"main": "Rain", "description": "light rain"}],
+            "wind": {"speed": round(random.uniform(0, 12), 1)},
+        }
+
+    @app.get("/json")
+    async def ipinfo():
+        if error := await simulate("ipinfo"):
+            return error
+        return {"ip": "203.0.113.7", "loc": "25.0340,121.5624"}
+
+    @app.get("/{ip}/json")
+    async def ipinfo_for(ip: str):
+        if error := await simulate("ipinfo"):
+            return error
+        lat, lng = _coords_for(ip)
+        return {"ip": ip, "loc": f"{lat:.4f},{lng:.4f}"}
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        body = await request.json()
+        if error := await simulate("openai"):
+            return error
+        return chat_completion(body)
+
+    @app.post("/v2beta/audio/stable-audio-2/{mode}")
+    async def stability(mode: str, request: Request):
+        await request.body()
+        if error := await simulate("stability"):
+            return error
+        return Response(content=audio, media_type="audio/mpeg")
+
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every sampled latency by this factor.")
+    parser.add_argument("--set", action="append", metavar="PROVIDER.FIELD=VALUE",
+                        help="Override a profile field, e.g. openai.median=1.5 or stability.error_rate=0.05.")
+    parser.add_argument("--audio-bytes", type=int, default=AUDIO_BYTES)
+    args = parser.parse_args()
+    app = create_app(parse_overrides(args.set), args.scale, args.audio_bytes)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import threading
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from utils import get_setting
+
+# === Configuration (override any of these in config.py) ===
+CACHE_PATH   = get_setting("CAPTION_CACHE_PATH", "./cache/captions.jsonl")
+MAX_DISTANCE = get_setting("CAPTION_CACHE_MAX_DISTANCE", 6)   # Hamming bits out of 64
+MAX_ENTRIES  = get_setting("CAPTION_CACHE_MAX_ENTRIES", 500_000)   # kept when the log is compacted
+
+HASH_SIZE = 8  # 8x8 gradient bits -> one uint64 per image
+
+def dhash(image_path: str) -> int:
+    """64-bit difference hash: sign of horizontal gradients on a 9x8 grayscale thumbnail."""
+    with Image.open(image_path) as image:
+        image.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+        image = ImageOps.exif_transpose(image).convert("L")
+        image = image.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR)
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).reshape(-1)
+    return int(np.packbits(bits).view(">u8")[0])
+
+if hasattr(np, "bitwise_count"):
+    _popcount = np.bitwise_count
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(values: np.ndarray) -> np.ndarray:
+        return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+class CaptionCache:
+    """
+    Caption cache keyed on the exact SHA-256 of the upload and, as a fallback,
+    on a 64-bit dHash so recompressed or resized copies of a photo also hit.
+
+    Perceptual hashes live in one contiguous uint64 array (8 bytes per entry,
+    plus a 4-byte row -> caption index); a near-duplicate lookup is a single
+    vectorized XOR + popcount over it.
+
+    Entries are appended to a JSON-lines file. The file is replayed on first
+    use (or by warmup), not on import. When more than a tenth of it is
+    superseded or torn lines, or images beyond `max_entries`, the replay
+    rewrites it with the newest `max_entries` captions, so the log does not
+    grow without bound across restarts.
+    """
+    def __init__(self, path: Optional[str] = CACHE_PATH, max_distance: int = MAX_DISTANCE,
+                 max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self._exact: dict[str, int] = {}
+        self._hashes = np.zeros(1024, dtype=np.uint64)  # perceptual hashes, first `_hash_count` rows used
+        self._owners = np.zeros(1024, dtype=np.int32)   # row -> index into _captions
+        self._hash_count = 0
+        self._captions: list[str] = []
+        self._loaded = False
+        self._load_lock = threading.Lock()   # held for the whole (possibly slow) replay
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "near_hits": 0, "misses": 0, "lookup_seconds": 0.0}
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self):
+        """Replay (and if needed compact) the log. Safe to call repeatedly; blocking on first call."""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            if self.path and os.path.exists(self.path):
+                self._replay()
+            self._loaded = True
+
+    def lookup(self, sha256: Optional[str], phash: Optional[int]) -> Optional[str]:
+        self.load()
+        start = time.perf_counter()
+        with self._lock:
+            caption, kind = self._find(sha256, phash)
+            self._stats[kind] += 1
+            self._stats["lookup_seconds"] += time.perf_counter() - start
+        return caption
+
+    def add(self, sha256: str, phash: Optional[int], caption: str):
+        self.load()
+        with self._lock:
+            self._append(sha256, phash, caption)
+            if self.path:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"sha256": sha256, "phash": phash, "caption": caption}) + "\n")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._captions), loaded=self._loaded)
+        lookups = stats["exact_hits"] + stats["near_hits"] + stats["misses"]
+        stats["hit_ratio"] = (stats["exact_hits"] + stats["near_hits"]) / lookups if lookups else 0.0
+        stats["avg_lookup_ms"] = stats.pop("lookup_seconds") * 1000 / lookups if lookups else 0.0
+        return stats
+
+    # === Internals (caller holds the lock) ===
+    def _find(self, sha256, phash):
+        index = self._exact.get(sha256) if sha256 else None
+        if index is not None:
+            return self._captions[index], "exact_hits"
+        if phash is None or self._hash_count == 0:
+            return None, "misses"
+        distances = _popcount(self._hashes[:self._hash_count] ^ np.uint64(phash))
+        best = int(np.argmin(distances))
+        if distances[best] <= self.max_distance:
+            return self._captions[self._owners[best]], "near_hits"
+        return None, "misses"
+
+    def _append(self, sha256, phash, caption):
+        index = len(self._captions)
+        self._captions.append(caption)
+        self._exact[sha256] = index
+        if phash is None:
+            return  # still reachable through the exact index
+        row = self._hash_count
+        if row == len(self._hashes):
+            self._hashes = np.concatenate([self._hashes, np.zeros(row, dtype=np.uint64)])
+            self._owners = np.concatenate([self._owners, np.zeros(row, dtype=np.int32)])
+        self._hashes[row] = np.uint64(phash)
+        self._owners[row] = index
+        self._hash_count += 1
+
+    def _replay(self):
+        # Called with _load_lock held, before anything else can touch the arrays
+        latest, lines = {}, 0   # sha256 -> (phash, caption); insertion order = age of the last write
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                lines += 1
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn write from an earlier crash
+                latest.pop(entry["sha256"], None)
+                latest[entry["sha256"]] = (entry.get("phash"), entry["caption"])
+        kept = list(latest.items())[-self.max_entries:]
+        for sha256, (phash, caption) in kept:
+            self._append(sha256, phash, caption)
+        if lines - len(kept) > len(kept) // 10:   # some slack, so a full log isn't rewritten every start
+            self._rewrite(kept)
+            print(f"🧹 Compacted caption cache: {lines} lines → {len(kept)} entries")
+
+    def _rewrite(self, entries):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for sha256, (phash, caption) in entries:
+                f.write(json.dumps({"sha256": sha256, "phash": phash, "caption": caption}) + "\n")
+        os.replace(temp_path, self.path)   # atomic: a crash leaves the old log intact
+
+# Process-wide instance used by image_caption; the log is replayed on first use (or by warmup)
+caption_cache = CaptionCache()
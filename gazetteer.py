@@ -0,0 +1,270 @@
+import time
+import bisect
+import difflib
+import argparse
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from array_index import ArrayIndex
+from geocode_cache import normalize_key
+from utils import get_setting
+
+# === Configuration (override any of these in config.py) ===
+GAZETTEER_PATH             = get_setting("GAZETTEER_PATH", None)   # GeoNames-style TSV, e.g. cities15000.txt; None = disabled
+GAZETTEER_INDEX_DIR        = get_setting("GAZETTEER_INDEX_DIR", "./cache/gazetteer")
+GAZETTEER_ALTERNATE_NAMES  = get_setting("GAZETTEER_ALTERNATE_NAMES", True)
+GAZETTEER_MIN_CONFIDENCE   = get_setting("GAZETTEER_MIN_CONFIDENCE", 0.85)   # below this, OpenCage is asked
+GAZETTEER_FUZZY_CUTOFF     = get_setting("GAZETTEER_FUZZY_CUTOFF", 0.85)     # difflib ratio for misspellings
+GAZETTEER_FUZZY_CANDIDATES = get_setting("GAZETTEER_FUZZY_CANDIDATES", 5000)
+
+INDEX_VERSION = 1
+FUZZY_PREFIX = 3   # a misspelled name must still share its first letters with the real one
+QUALIFIER_PENALTY = 0.5   # "Paris, Texas": qualifiers other than a country code can't be checked here
+COUNTRY_ALIASES = {"UK": "GB"}
+
+# GeoNames columns (http://download.geonames.org/export/dump/readme.txt)
+COL_NAME, COL_ASCII, COL_ALTERNATES, COL_LAT, COL_LON, COL_COUNTRY, COL_POPULATION = 1, 2, 3, 4, 5, 8, 14
+
+@dataclass
+class GazetteerMatch:
+    lat: float
+    lon: float
+    name: str
+    country: str
+    population: int
+    confidence: float   # 0..1: name similarity x the top candidate's share of population
+    method: str         # "exact" | "fuzzy"
+
+class _Keys:
+    """Sorted UTF-8 keys concatenated in one buffer, indexable (and so bisectable) like a list."""
+    def __init__(self, blob, offsets: np.ndarray):
+        self.blob = blob          # mmap (or bytes): slicing returns bytes without numpy overhead
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> bytes:
+        return self.blob[self.offsets[i]:self.offsets[i + 1]]
+
+class Gazetteer:
+    """
+    Offline geocoder over a GeoNames-style TSV.
+
+    The TSV is compiled once into flat arrays under `index_dir`: the
+    normalized names (plus alternate names) sorted and concatenated into one
+    byte buffer with an offsets array, a key -> place array, and per-place
+    coordinates, country and population. Later loads memory-map those files,
+    so startup costs a few page faults rather than a parse. The index is
+    rebuilt when the TSV's size or mtime changes (see array_index.py).
+
+    Exact names are found by bisecting the sorted keys. Misspellings fall back
+    to difflib over the keys sharing the first FUZZY_PREFIX letters. When a
+    name belongs to several places, the most populous one wins, with the
+    confidence scaled by its share of their combined population.
+    """
+    def __init__(
+        self,
+        source: Optional[str] = GAZETTEER_PATH,
+        index_dir: str = GAZETTEER_INDEX_DIR,
+        alternate_names: bool = GAZETTEER_ALTERNATE_NAMES,
+        fuzzy_cutoff: float = GAZETTEER_FUZZY_CUTOFF,
+        fuzzy_candidates: int = GAZETTEER_FUZZY_CANDIDATES,
+    ):
+        self.source = source
+        self.index_dir = index_dir
+        self.alternate_names = alternate_names
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.fuzzy_candidates = fuzzy_candidates
+        self._loaded = False
+        self._load_lock = threading.Lock()   # held for the whole (possibly slow) build
+        self._lock = threading.Lock()
+        self._stats = {"lookups": 0, "exact": 0, "fuzzy": 0, "misses": 0, "low_confidence": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.source)
+
+    # === Index Build ===
+    def _index(self) -> ArrayIndex:
+        return ArrayIndex(self.index_dir, [self.source],
+                          {"version": INDEX_VERSION, "alternate_names": self.alternate_names})
+
+    def build(self):
+        """Parse the TSV and write the index files; meta.json is written last and marks it complete."""
+        start = time.perf_counter()
+        lat, lon, population, country, names = [], [], [], [], []
+        entries = set()  # (key, place)
+        with open(self.source, encoding="utf-8") as f:
+            for line in f:
+                cols = line.rstrip("\n").split("\t")
+                if len(cols) <= COL_POPULATION or line.startswith("#"):
+                    continue
+                place = len(lat)
+                lat.append(float(cols[COL_LAT]))
+                lon.append(float(cols[COL_LON]))
+                population.append(int(cols[COL_POPULATION] or 0))
+                country.append(cols[COL_COUNTRY])
+                names.append(cols[COL_NAME])
+                variants = [cols[COL_NAME], cols[COL_ASCII]]
+                if self.alternate_names and cols[COL_ALTERNATES]:
+                    variants += cols[COL_ALTERNATES].split(",")
+                for variant in variants:
+                    key = normalize_key(variant)
+                    if key:
+                        entries.add((key.encode("utf-8"), place))
+
+        entries = sorted(entries)
+        offsets = np.zeros(len(entries) + 1, dtype=np.int64)
+        np.cumsum([len(key) for key, _ in entries], out=offsets[1:])
+        name_bytes = [name.encode("utf-8") for name in names]
+        name_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in name_bytes], out=name_offsets[1:])
+
+        arrays = {
+            "key_offsets": offsets,
+            "key_place": np.array([place for _, place in entries], dtype=np.int32),
+            "lat": np.array(lat, dtype=np.float32),
+            "lon": np.array(lon, dtype=np.float32),
+            "population": np.array(population, dtype=np.int64),
+            "country": np.array(country, dtype="S2"),
+            "name_offsets": name_offsets,
+        }
+        blobs = {"keys": b"".join(key for key, _ in entries), "names": b"".join(name_bytes)}
+        self._index().write(arrays, blobs, places=len(lat), keys=len(entries))
+        print(f"✅ Built gazetteer index: {len(lat)} places, {len(entries)} names "
+              f"in {time.perf_counter() - start:.1f}s")
+
+    def load(self):
+        """Memory-map the index, building it first if missing or stale. Safe to call repeatedly."""
+        if self._loaded or not self.enabled:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            index = self._index()
+            if not index.current():
+                self.build()
+            load = index.array
+            self._keys = _Keys(index.blob("keys"), load("key_offsets"))
+            self._names = _Keys(index.blob("names"), load("name_offsets"))
+            self._key_place = load("key_place")
+            self._lat, self._lon = load("lat"), load("lon")
+            self._population, self._country = load("population"), load("country")
+            self._loaded = True
+
+    # === Lookup ===
+    def _key_range(self, prefix: bytes) -> tuple[int, int]:
+        # 0xFF never occurs in UTF-8, so it sorts after every key with this prefix
+        return bisect.bisect_left(self._keys, prefix), bisect.bisect_left(self._keys, prefix + b"\xff")
+
+    def _exact(self, key: str) -> list[int]:
+        encoded = key.encode("utf-8")
+        lo = bisect.bisect_left(self._keys, encoded)
+        hi = bisect.bisect_right(self._keys, encoded, lo)
+        return [int(p) for p in self._key_place[lo:hi]]
+
+    def _fuzzy(self, key: str) -> tuple[list[int], float]:
+        # Narrow the prefix until the candidate range is small enough to score
+        for length in range(FUZZY_PREFIX, len(key) + 1):
+            lo, hi = self._key_range(key[:length].encode("utf-8"))
+            if hi - lo <= self.fuzzy_candidates:
+                break
+        else:
+            return [], 0.0
+
+        matcher = difflib.SequenceMatcher(b=key, autojunk=False)
+        best_ratio, best = 0.0, []
+        for i in range(lo, hi):
+            matcher.set_seq1(self._keys[i].decode("utf-8"))
+            if matcher.real_quick_ratio() < self.fuzzy_cutoff or matcher.quick_ratio() < self.fuzzy_cutoff:
+                continue
+            ratio = matcher.ratio()
+            if ratio > best_ratio and ratio >= self.fuzzy_cutoff:
+                best_ratio, best = ratio, [i]
+            elif ratio == best_ratio and best:
+                best.append(i)
+        return sorted({int(self._key_place[i]) for i in best}), best_ratio
+
+    def _match(self, places: list[int], similarity: float, method: str) -> GazetteerMatch:
+        weights = self._population[places].astype(np.float64) + 1
+        top = int(np.argmax(weights))
+        place = places[top]
+        return GazetteerMatch(
+            lat=round(float(self._lat[place]), 5),   # stored as float32: ~1 m
+            lon=round(float(self._lon[place]), 5),
+            name=self._names[place].decode("utf-8"),
+            country=self._country[place].decode("ascii"),
+            population=int(self._population[place]),
+            confidence=similarity * float(weights[top] / weights.sum()),
+            method=method,
+        )
+
+    def lookup(self, location_text: str) -> Optional[GazetteerMatch]:
+        """Best local match for a place name ("London", "Paris, FR", "Reykjavik"), or None."""
+        if not self.enabled:
+            return None
+        self.load()
+        head, _, qualifier = location_text.partition(",")
+        key = normalize_key(head)
+        if not key:
+            return None
+
+        places, similarity, method = self._exact(key), 1.0, "exact"
+        if not places:
+            (places, similarity), method = self._fuzzy(key), "fuzzy"
+
+        qualifier = qualifier.strip().upper()
+        if places and qualifier:
+            code = COUNTRY_ALIASES.get(qualifier, qualifier).encode("ascii", "ignore")
+            in_country = [p for p in places if self._country[p] == code]
+            if in_country:
+                places = in_country
+            else:
+                similarity *= QUALIFIER_PENALTY
+
+        with self._lock:
+            self._stats["lookups"] += 1
+            self._stats[method if places else "misses"] += 1
+        return self._match(places, similarity, method) if places else None
+
+    def latlon(self, location_text: str, min_confidence: float = GAZETTEER_MIN_CONFIDENCE) -> Optional[tuple[float, float]]:
+        """(lat, lon) when the local match is confident enough to skip OpenCage, else None."""
+        match = self.lookup(location_text)
+        if match is None:
+            return None
+        if match.confidence < min_confidence:
+            with self._lock:
+                self._stats["low_confidence"] += 1
+            return None
+        return match.lat, match.lon
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, enabled=self.enabled, loaded=self._loaded)
+        if self._loaded:
+            stats.update(places=len(self._lat), keys=len(self._keys))
+        return stats
+
+# Process-wide instance used by opencage_api; the index is loaded on first use (or by warmup)
+gazetteer = Gazetteer()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the gazetteer index and/or look up places.")
+    parser.add_argument("names", nargs="*", help="Place names to look up.")
+    parser.add_argument("--source", default=GAZETTEER_PATH, help="GeoNames-style TSV (default: GAZETTEER_PATH).")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index even if it is current.")
+    args = parser.parse_args()
+
+    gazetteer = Gazetteer(args.source)
+    if not gazetteer.enabled:
+        parser.error("no gazetteer source: pass --source or set GAZETTEER_PATH in config.py")
+    if args.rebuild:
+        gazetteer.build()
+    gazetteer.load()
+    for name in args.names:
+        match = gazetteer.lookup(name)
+        print(f"📍 {name}: {match}" if match else f"❌ {name}: not found")
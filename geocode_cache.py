@@ -0,0 +1,181 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from utils import get_setting
+
+# === Configuration (override any of these in config.py) ===
+CACHE_PATH       = get_setting("GEOCODE_CACHE_PATH", "./cache/geocode.sqlite3")
+MEMORY_ENTRIES   = get_setting("GEOCODE_CACHE_MEMORY_ENTRIES", 2048)
+DISK_ENTRIES     = get_setting("GEOCODE_CACHE_DISK_ENTRIES", 100_000)
+TTL              = get_setting("GEOCODE_CACHE_TTL", 30 * 24 * 3600)   # found places barely move
+NEGATIVE_TTL     = get_setting("GEOCODE_CACHE_NEGATIVE_TTL", 24 * 3600)
+
+EVICT_EVERY = 256  # stores between disk eviction sweeps
+
+MISS = object()  # sentinel: None is a valid (negative) cached result
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+def normalize_key(location_text: str) -> str:
+    """
+    Collapse spelling variants of the same place to one key.
+
+    "Taipei 101", "taipei 101 " and "Taipei101" all become "taipei101":
+    Unicode is NFKC-normalized and case-folded, then whitespace and
+    punctuation are dropped entirely.
+    """
+    text = unicodedata.normalize("NFKC", location_text).casefold()
+    return _NON_WORD.sub("", text)
+
+class GeocodeCache:
+    """
+    Two-level geocoding cache: an in-memory LRU in front of a SQLite table
+    that survives restarts. Both levels honour TTLs, and "not found" results
+    are cached too (with a shorter TTL) so typos don't hit the upstream API.
+    The SQLite file is opened on first use (or by `connect`), not at import.
+    """
+    def __init__(
+        self,
+        path: Optional[str] = CACHE_PATH,
+        memory_entries: int = MEMORY_ENTRIES,
+        disk_entries: int = DISK_ENTRIES,
+        ttl: float = TTL,
+        negative_ttl: float = NEGATIVE_TTL,
+    ):
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._memory: "OrderedDict[str, Tuple[Optional[Tuple[float, float]], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "negative_hits": 0, "misses": 0, "stores": 0}
+
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None   # opened on first use, not at import
+
+    def connect(self) -> Optional[sqlite3.Connection]:
+        """Open (and if needed create) the SQLite level; None when disabled."""
+        with self._lock:
+            return self._connection()
+
+    def get_memory(self, location_text: str):
+        """
+        The in-memory level alone: no I/O, so it is safe on the event loop.
+        MISS only means "not in memory"; ask `get` (in a thread) for the disk.
+        """
+        key = normalize_key(location_text)
+        with self._lock:
+            return self._memory_get(key, time.time())
+
+    def get(self, location_text: str):
+        """Return the cached (lat, lon), None for a cached "not found", or MISS."""
+        key = normalize_key(location_text)
+        now = time.time()
+        with self._lock:
+            value = self._memory_get(key, now)
+            if value is not MISS:
+                return value
+
+            db = self._connection()
+            if db is not None:
+                row = db.execute(
+                    "SELECT lat, lon, expires_at FROM geocode WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[2] > now:
+                    value = (row[0], row[1]) if row[0] is not None else None
+                    db.execute("UPDATE geocode SET accessed_at = ? WHERE key = ?", (now, key))
+                    self._remember(key, value, row[2])
+                    self._record_hit("disk_hits", value)
+                    return value
+
+            self._stats["misses"] += 1
+            return MISS
+
+    def set(self, location_text: str, value: Optional[Tuple[float, float]]):
+        key = normalize_key(location_text)
+        now = time.time()
+        expires_at = now + (self.ttl if value is not None else self.negative_ttl)
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self._stats["stores"] += 1
+            db = self._connection()
+            if db is not None:
+                lat, lon = value if value is not None else (None, None)
+                db.execute(
+                    "INSERT OR REPLACE INTO geocode (key, lat, lon, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, lat, lon, expires_at, now),
+                )
+                if self._stats["stores"] % EVICT_EVERY == 0:
+                    self._evict_disk()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_ratio"] = hits / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM geocode")
+
+    # === Internals (caller holds the lock) ===
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self._db is None and self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                " key TEXT PRIMARY KEY, lat REAL, lon REAL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS geocode_accessed ON geocode (accessed_at)")
+            self._db = db
+        return self._db
+
+    def _memory_get(self, key, now):
+        entry = self._memory.get(key)
+        if entry is None:
+            return MISS
+        value, expires_at = entry
+        if expires_at <= now:
+            del self._memory[key]
+            return MISS
+        self._memory.move_to_end(key)
+        self._record_hit("memory_hits", value)
+        return value
+
+    def _record_hit(self, level: str, value):
+        self._stats[level] += 1
+        if value is None:
+            self._stats["negative_hits"] += 1
+
+    def _remember(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        # Drop expired rows first, then the least recently used beyond the bound
+        self._db.execute("DELETE FROM geocode WHERE expires_at <= ?", (time.time(),))
+        self._db.execute(
+            "DELETE FROM geocode WHERE key IN ("
+            " SELECT key FROM geocode ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.disk_entries,),
+        )
+
+# Process-wide instance used by opencage_api
+geocode_cache = GeocodeCache()
@@ -0,0 +1,276 @@
+import csv
+import time
+import argparse
+import ipaddress
+import threading
+from collections import OrderedDict
+from typing import Iterable, Mapping, Optional, Union
+
+import numpy as np
+
+from array_index import ArrayIndex
+from utils import get_setting
+
+# === Configuration (override any of these in config.py) ===
+GEOIP_PATH       = get_setting("GEOIP_PATH", None)    # .mmdb, or CSV range table(s); None = disabled
+GEOIP_INDEX_DIR  = get_setting("GEOIP_INDEX_DIR", "./cache/geoip")
+GEOIP_CACHE_SIZE = get_setting("GEOIP_CACHE_SIZE", 4096)   # addresses remembered (LRU)
+TRUSTED_PROXIES  = get_setting("TRUSTED_PROXIES", ("127.0.0.1/32", "::1/128"))   # may set X-Forwarded-For
+
+INDEX_VERSION = 1
+LAT_COLUMNS = ("latitude", "lat")
+LON_COLUMNS = ("longitude", "lon", "lng")
+U64 = (1 << 64) - 1
+
+IPAddress = Union[ipaddress.IPv4Address, ipaddress.IPv6Address]
+
+# === Client Address ===
+_trusted = [ipaddress.ip_network(network, strict=False) for network in TRUSTED_PROXIES]
+
+def _parse(ip: str) -> Optional[IPAddress]:
+    try:
+        return ipaddress.ip_address(ip.strip())
+    except ValueError:
+        return None
+
+def _is_trusted(address: IPAddress) -> bool:
+    return any(address in network for network in _trusted)
+
+def client_ip(peer: Optional[str], headers: Optional[Mapping[str, str]] = None) -> Optional[str]:
+    """
+    The address a request came from. `X-Forwarded-For` is walked from the
+    right only while each hop was added by a TRUSTED_PROXIES address, so a
+    client cannot choose its own location by sending the header itself.
+    """
+    address = _parse(peer) if peer else None
+    if address is None:
+        return None
+    forwarded = (headers or {}).get("x-forwarded-for", "")
+    hops = [hop for hop in forwarded.split(",") if hop.strip()]
+    while hops and _is_trusted(address):
+        hop = _parse(hops.pop())
+        if hop is None:
+            break
+        address = hop
+    return str(address)
+
+def is_public(ip: Optional[str]) -> bool:
+    address = _parse(ip) if ip else None
+    return address is not None and address.is_global
+
+# === Range Table Build ===
+def _column(header: list[str], names: tuple) -> Optional[int]:
+    lowered = [name.strip().lower() for name in header]
+    return next((lowered.index(name) for name in names if name in lowered), None)
+
+def _ranges(path: str) -> Iterable[tuple[int, int, int, float, float]]:
+    """(version, first, last, lat, lon) per row of a CSV with a header: `network` (CIDR) or
+    `start_ip` / `end_ip`, plus latitude / longitude (MaxMind GeoLite2-City-Blocks, IPinfo, DB-IP style)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        network_col = _column(header, ("network", "cidr"))
+        start_col, end_col = _column(header, ("start_ip", "ip_start")), _column(header, ("end_ip", "ip_end"))
+        lat_col, lon_col = _column(header, LAT_COLUMNS), _column(header, LON_COLUMNS)
+        if lat_col is None or lon_col is None or (network_col is None and None in (start_col, end_col)):
+            raise ValueError(f"{path}: need a network (or start_ip / end_ip) column and latitude / longitude")
+        for row in reader:
+            try:
+                lat, lon = float(row[lat_col]), float(row[lon_col])
+                if network_col is not None:
+                    network = ipaddress.ip_network(row[network_col], strict=False)
+                    first, last = network.network_address, network.broadcast_address
+                else:
+                    first, last = ipaddress.ip_address(row[start_col]), ipaddress.ip_address(row[end_col])
+            except (ValueError, IndexError):
+                continue   # rows without coordinates (anonymous / satellite blocks) or malformed
+            if first.version == last.version:
+                yield first.version, int(first), int(last), lat, lon
+
+class GeoIP:
+    """
+    Offline IP → (lat, lon) lookup.
+
+    A `.mmdb` file (MaxMind GeoLite2 / GeoIP2 City, or any database with
+    latitude / longitude) is read with the optional `maxminddb` package in
+    mmap mode. CSV range tables are compiled once into sorted arrays under
+    `index_dir` (IPv4 as uint32, IPv6 as two uint64 halves), memory-mapped
+    on later loads and binary-searched; the index is rebuilt when a source's
+    size or mtime changes (see array_index.py). Ranges are expected not to overlap, as in those
+    databases.
+
+    Results, including misses, are kept in an LRU of `cache_size` addresses.
+    Private, loopback and otherwise non-global addresses are never looked up.
+    """
+    def __init__(
+        self,
+        source: Union[str, list, tuple, None] = GEOIP_PATH,
+        index_dir: str = GEOIP_INDEX_DIR,
+        cache_size: int = GEOIP_CACHE_SIZE,
+    ):
+        self.sources = [source] if isinstance(source, str) else list(source or [])
+        self.index_dir = index_dir
+        self.cache_size = cache_size
+        self._reader = None
+        self._loaded = False
+        self._load_lock = threading.Lock()   # held for the whole (possibly slow) build
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Optional[tuple[float, float]]]" = OrderedDict()
+        self._stats = {"lookups": 0, "cache_hits": 0, "found": 0, "not_found": 0, "not_public": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.sources)
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def _is_mmdb(self) -> bool:
+        return len(self.sources) == 1 and self.sources[0].endswith(".mmdb")
+
+    # === Index Build ===
+    def _index(self) -> ArrayIndex:
+        return ArrayIndex(self.index_dir, self.sources, {"version": INDEX_VERSION})
+
+    def build(self):
+        """Parse the CSV range tables and write the index; meta.json is written last and marks it complete."""
+        start = time.perf_counter()
+        rows = {4: [], 6: []}
+        for source in self.sources:
+            for version, first, last, lat, lon in _ranges(source):
+                rows[version].append((first, last, lat, lon))
+        for table in rows.values():
+            table.sort()
+
+        arrays = {
+            "v4_first": np.array([r[0] for r in rows[4]], dtype=np.uint32),
+            "v4_last": np.array([r[1] for r in rows[4]], dtype=np.uint32),
+            "v4_lat": np.array([r[2] for r in rows[4]], dtype=np.float32),
+            "v4_lon": np.array([r[3] for r in rows[4]], dtype=np.float32),
+            "v6_first_hi": np.array([r[0] >> 64 for r in rows[6]], dtype=np.uint64),
+            "v6_first_lo": np.array([r[0] & U64 for r in rows[6]], dtype=np.uint64),
+            "v6_last_hi": np.array([r[1] >> 64 for r in rows[6]], dtype=np.uint64),
+            "v6_last_lo": np.array([r[1] & U64 for r in rows[6]], dtype=np.uint64),
+            "v6_lat": np.array([r[2] for r in rows[6]], dtype=np.float32),
+            "v6_lon": np.array([r[3] for r in rows[6]], dtype=np.float32),
+        }
+        self._index().write(arrays, ipv4_ranges=len(rows[4]), ipv6_ranges=len(rows[6]))
+        print(f"✅ Built GeoIP index: {len(rows[4])} IPv4 + {len(rows[6])} IPv6 ranges "
+              f"in {time.perf_counter() - start:.1f}s")
+
+    def load(self):
+        """Open the database, building the range index first if missing or stale. Safe to call repeatedly."""
+        if self._loaded or not self.enabled:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            if self._is_mmdb:
+                import maxminddb   # optional dependency, only needed for .mmdb files
+                self._reader = maxminddb.open_database(self.sources[0], maxminddb.MODE_MMAP)
+            else:
+                index = self._index()
+                if not index.current():
+                    self.build()
+                load = index.array
+                self._v4 = {name: load(f"v4_{name}") for name in ("first", "last", "lat", "lon")}
+                self._v6 = {name: load(f"v6_{name}") for name in ("first_hi", "first_lo", "last_hi", "last_lo", "lat", "lon")}
+            self._loaded = True
+
+    # === Lookup ===
+    def _find_v4(self, value: int) -> Optional[tuple[float, float]]:
+        table = self._v4
+        i = int(np.searchsorted(table["first"], np.uint32(value), side="right")) - 1
+        if i < 0 or int(table["last"][i]) < value:
+            return None
+        return float(table["lat"][i]), float(table["lon"][i])
+
+    def _find_v6(self, value: int) -> Optional[tuple[float, float]]:
+        table = self._v6
+        hi, lo = np.uint64(value >> 64), np.uint64(value & U64)
+        # Last range starting at or before (hi, lo): bisect the high halves, then the low halves among equals
+        start = int(np.searchsorted(table["first_hi"], hi, side="left"))
+        end = int(np.searchsorted(table["first_hi"], hi, side="right"))
+        i = start + int(np.searchsorted(table["first_lo"][start:end], lo, side="right")) - 1
+        if i < 0 or (int(table["last_hi"][i]) << 64 | int(table["last_lo"][i])) < value:
+            return None
+        return float(table["lat"][i]), float(table["lon"][i])
+
+    def _find_mmdb(self, address: IPAddress) -> Optional[tuple[float, float]]:
+        record = self._reader.get(address) or {}
+        location = record.get("location", record)
+        lat = next((location[k] for k in LAT_COLUMNS if location.get(k) not in (None, "")), None)
+        lon = next((location[k] for k in LON_COLUMNS if location.get(k) not in (None, "")), None)
+        return (float(lat), float(lon)) if lat is not None and lon is not None else None
+
+    def _find(self, address: IPAddress) -> Optional[tuple[float, float]]:
+        if self._reader is not None:
+            return self._find_mmdb(address)
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if address.version == 4:
+            return self._find_v4(int(address))
+        return self._find_v6(int(address))
+
+    def latlon(self, ip: Optional[str]) -> Optional[tuple[float, float]]:
+        """(lat, lon) of a public address from the local database, or None."""
+        if not self.enabled or not ip:
+            return None
+        with self._lock:
+            self._stats["lookups"] += 1
+            if ip in self._cache:
+                self._cache.move_to_end(ip)
+                self._stats["cache_hits"] += 1
+                return self._cache[ip]
+
+        address = _parse(ip)
+        if address is None or not address.is_global:
+            self._count("not_public")
+            return None
+        self.load()
+        found = self._find(address)
+        if found is not None:
+            found = round(found[0], 5), round(found[1], 5)   # stored as float32: ~1 m
+
+        with self._lock:
+            self._stats["found" if found else "not_found"] += 1
+            self._cache[ip] = found
+            self._cache.move_to_end(ip)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return found
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, enabled=self.enabled, loaded=self._loaded, cached=len(self._cache))
+        stats["hit_ratio"] = stats["cache_hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        if self._loaded and self._reader is None:
+            stats.update(ipv4_ranges=len(self._v4["first"]), ipv6_ranges=len(self._v6["first_hi"]))
+        return stats
+
+    # === Internals ===
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+# Process-wide instance used by openweather_api; the database is opened on first use (or by warmup)
+geoip = GeoIP()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the GeoIP range index and/or look up addresses.")
+    parser.add_argument("ips", nargs="*", help="Addresses to look up.")
+    parser.add_argument("--source", action="append", help="CSV range table or .mmdb (default: GEOIP_PATH).")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index even if it is current.")
+    args = parser.parse_args()
+
+    geoip = GeoIP(args.source or GEOIP_PATH)
+    if not geoip.enabled:
+        parser.error("no GeoIP source: pass --source or set GEOIP_PATH in config.py")
+    if args.rebuild and not geoip._is_mmdb:
+        geoip.build()
+    geoip.load()
+    for ip in args.ips:
+        found = geoip.latlon(ip)
+        print(f"📍 {ip}: {found[0]}, {found[1]}" if found else f"❌ {ip}: not found")
@@ -0,0 +1,58 @@
+import asyncio
+import weakref
+from typing import Optional
+
+import httpx
+
+from utils import get_setting
+from metrics import event_hooks, async_event_hooks
+
+# === Configuration (override any of these in config.py) ===
+CONNECT_TIMEOUT     = get_setting("HTTP_CONNECT_TIMEOUT", 5.0)
+READ_TIMEOUT        = get_setting("HTTP_READ_TIMEOUT", 15.0)
+LONG_READ_TIMEOUT   = get_setting("HTTP_LONG_READ_TIMEOUT", 300.0)  # Stable Audio renders
+MAX_CONNECTIONS     = get_setting("HTTP_MAX_CONNECTIONS", 100)
+MAX_KEEPALIVE       = get_setting("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20)
+KEEPALIVE_EXPIRY    = get_setting("HTTP_KEEPALIVE_EXPIRY", 30.0)
+
+DEFAULT_TIMEOUT = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+LONG_TIMEOUT    = httpx.Timeout(LONG_READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+_limits = httpx.Limits(
+    max_connections=MAX_CONNECTIONS,
+    max_keepalive_connections=MAX_KEEPALIVE,
+    keepalive_expiry=KEEPALIVE_EXPIRY,
+)
+
+# httpx keeps one connection pool per origin inside each client, so a single
+# client per process (per event loop for async) gives us per-host keep-alive.
+_client: Optional[httpx.Client] = None
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+def get_client() -> httpx.Client:
+    """Shared blocking client used by the sync wrappers."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.Client(timeout=DEFAULT_TIMEOUT, limits=_limits, event_hooks=event_hooks())
+    return _client
+
+def get_async_client() -> httpx.AsyncClient:
+    """Shared async client for the running event loop (connections cannot cross loops)."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(timeout=DEFAULT_TIMEOUT, limits=_limits, event_hooks=async_event_hooks())
+        _async_clients[loop] = client
+    return client
+
+def close():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+async def aclose():
+    """Close the pool bound to the running loop; call on application shutdown."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
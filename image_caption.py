@@ -1,51 +1,120 @@
-import os
+import asyncio
 import mimetypes
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 from base64 import b64encode
-from pydantic_ai import Agent
-from pydantic_ai.models.openai import OpenAIModel
-from pydantic_ai.providers.openai import OpenAIProvider
 from pydantic import BaseModel
 
-from utils  import load_prompt
-from config import OPENAI_API_KEY
+from agents import get_agent
+from utils  import file_digest
+from image_preprocess import prepare_image, PREPROCESS_IMAGES, DECODE_ERRORS
+from caption_cache    import caption_cache, dhash
+import metrics
+import resilience
+
+if TYPE_CHECKING:
+    from pydantic_ai import Agent, ImageUrl
 
 class ImageCaption(BaseModel):
     description: str
 
-def caption_image_with_gpt4o(image_path: str) -> str:
-    api_key = OPENAI_API_KEY
+def create_caption_agent() -> "Agent":
+    return get_agent(
+        "caption",
+        model_name="gpt-4o",
+        result_type=ImageCaption,
+        prompt_path="prompts/image_caption.txt"
+    )
 
+def _read_raw(image_path: str) -> tuple[bytes, Optional[str]]:
     with open(image_path, "rb") as f:
         image_data = f.read()
-    b64_image = b64encode(image_data).decode("utf-8")
     mime_type, _ = mimetypes.guess_type(image_path)
-    image_url = f"data:{mime_type};base64,{b64_image}"
+    return image_data, mime_type
 
-    provider = OpenAIProvider(api_key=api_key)
-    model  = OpenAIModel(model_name="gpt-4o", provider=provider)
+def build_image_input(image_path: str, preprocess: bool = PREPROCESS_IMAGES) -> "ImageUrl":
+    """
+    Encode an image as a data URL. With `preprocess`, the image is first
+    downscaled and re-encoded (see image_preprocess.py); files Pillow cannot
+    decode are sent as-is.
+    """
+    image_data, mime_type = None, None
+    if preprocess:
+        try:
+            image_data, mime_type = prepare_image(image_path)
+        except DECODE_ERRORS as e:
+            print(f"⚠️ Image preprocessing skipped ({e}); sending original file")
+    if image_data is None:
+        image_data, mime_type = _read_raw(image_path)
+    from pydantic_ai import ImageUrl
 
-    
-    agent = Agent(
-        model=model,
-        result_type=ImageCaption,
-        system_prompt=load_prompt("prompts/image_caption.txt")
-    )
+    b64_image = b64encode(image_data).decode("utf-8")
+    return ImageUrl(url=f"data:{mime_type};base64,{b64_image}")
 
+def cache_keys(image_path: str, image_digest: Optional[str] = None) -> tuple[str, Optional[int]]:
+    """(SHA-256, dHash) for the caption cache; dHash is None if Pillow cannot decode the file."""
+    caption_cache.load()   # the first call replays the log; the async paths run this in a thread
+    sha256 = image_digest or file_digest(image_path)
+    try:
+        phash = dhash(image_path)
+    except DECODE_ERRORS:
+        phash = None
+    return sha256, phash
 
+def _degrade(error: Exception) -> str:
+    # The caption only enriches the prompt, so an unavailable LLM just drops it
+    if not resilience.is_upstream_failure(error):
+        raise error
+    print(f"⚠️ Captioning unavailable ({error}); continuing without a caption")
+    return ""
 
-    user_input = {
-        "type": "image_url",
-        "image_url": {"url": image_url}
-    }
+def caption_image_with_gpt4o(
+    image_path: str,
+    preprocess: bool = PREPROCESS_IMAGES,
+    image_digest: Optional[str] = None,
+    use_cache: bool = True,
+) -> str:
+    if use_cache:
+        sha256, phash = cache_keys(image_path, image_digest)
+        cached = caption_cache.lookup(sha256, phash)
+        if cached is not None:
+            return cached
 
-    result = agent.run_sync(
-        messages=[
-            {"role": "user", "content": [user_input]}
-        ]
-    )
+    agent = create_caption_agent()
+    image_input = build_image_input(image_path, preprocess)
+    try:
+        result = resilience.call("openai", lambda timeout: agent.run_sync([image_input], model_settings={"timeout": timeout}))
+    except Exception as e:
+        return _degrade(e)
+    metrics.record_usage("caption", result.usage())
+    description = result.data.description
+    if use_cache:
+        caption_cache.add(sha256, phash, description)
+    return description
+
+async def caption_image_with_gpt4o_async(
+    image_path: str,
+    preprocess: bool = PREPROCESS_IMAGES,
+    image_digest: Optional[str] = None,
+    use_cache: bool = True,
+) -> str:
+    # Hashing, decoding and resizing are CPU-bound, keep them off the event loop
+    if use_cache:
+        sha256, phash = await asyncio.to_thread(cache_keys, image_path, image_digest)
+        cached = caption_cache.lookup(sha256, phash)
+        if cached is not None:
+            return cached
 
-    return result.data.description
+    agent = create_caption_agent()
+    image_input = await asyncio.to_thread(build_image_input, image_path, preprocess)
+    try:
+        result = await resilience.call_async("openai", lambda timeout: agent.run([image_input], model_settings={"timeout": timeout}))
+    except Exception as e:
+        return _degrade(e)
+    metrics.record_usage("caption", result.usage())
+    description = result.data.description
+    if use_cache:
+        caption_cache.add(sha256, phash, description)
+    return description
 
 if __name__ == "__main__":
     caption = caption_image_with_gpt4o("./image/test.jpg")
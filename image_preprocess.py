@@ -0,0 +1,43 @@
+from io import BytesIO
+
+from PIL import Image, ImageOps
+
+from utils import get_setting
+
+# === Configuration (override any of these in config.py) ===
+PREPROCESS_IMAGES = get_setting("CAPTION_PREPROCESS_IMAGES", True)
+IMAGE_MAX_SIDE    = get_setting("CAPTION_IMAGE_MAX_SIDE", 1024)   # long side in pixels
+IMAGE_FORMAT      = get_setting("CAPTION_IMAGE_FORMAT", "JPEG")   # "JPEG" or "WEBP"
+IMAGE_QUALITY     = get_setting("CAPTION_IMAGE_QUALITY", 85)
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+# What Pillow raises for files it cannot (or will not) decode. Images over
+# twice Image.MAX_IMAGE_PIXELS raise DecompressionBombError, not an OSError
+DECODE_ERRORS = (OSError, Image.DecompressionBombError)
+
+def prepare_image(
+    image_path: str,
+    max_side: int = IMAGE_MAX_SIDE,
+    image_format: str = IMAGE_FORMAT,
+    quality: int = IMAGE_QUALITY,
+) -> tuple[bytes, str]:
+    """
+    Downscale and re-encode an image for the vision model.
+
+    The EXIF orientation is applied to the pixels and the metadata is then
+    dropped, the long side is limited to `max_side`, and the result is
+    encoded as JPEG or WebP at `quality`. Returns (encoded bytes, mime type).
+    """
+    image_format = image_format.upper()
+    with Image.open(image_path) as image:
+        # JPEG only: decode at a reduced DCT scale that is still >= max_side
+        image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+        buffer = BytesIO()
+        image.save(buffer, format=image_format, quality=quality)
+    return buffer.getvalue(), MIME_TYPES[image_format]
@@ -0,0 +1,110 @@
+import math
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from utils import get_setting
+from geocode_cache import normalize_key
+
+# === Configuration (override any of these in config.py) ===
+TTL            = get_setting("INTERPRETATION_CACHE_TTL", 30 * 60)     # seconds a cached interpretation is reused
+VARIANTS       = get_setting("INTERPRETATION_CACHE_VARIANTS", 1)      # interpretations kept (and rotated) per bucket
+MAX_BUCKETS    = get_setting("INTERPRETATION_CACHE_MAX_BUCKETS", 10_000)
+TEMP_BAND      = get_setting("INTERPRETATION_TEMP_BAND", 3.0)         # °C
+HUMIDITY_BAND  = get_setting("INTERPRETATION_HUMIDITY_BAND", 10)      # %
+WIND_BAND      = get_setting("INTERPRETATION_WIND_BAND", 2.0)         # m/s
+KEY_BY_CITY    = get_setting("INTERPRETATION_KEY_BY_CITY", True)      # False = share buckets across cities
+
+def _band(value, width) -> int:
+    return math.floor(float(value) / width) if width else float(value)
+
+def _text_hash(text: Optional[str]) -> str:
+    """Hash of the text with case and whitespace normalized; empty text maps to ''."""
+    text = " ".join((text or "").split()).casefold()
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16] if text else ""
+
+class InterpretationCache:
+    """
+    TTL cache for LLM interpretations keyed on bucketed inputs.
+
+    Weather readings are canonicalized into temperature / humidity / wind
+    bands plus the condition text, and journal / caption text into
+    normalized hashes, so near-identical requests share one bucket.
+    Each bucket keeps up to `variants` interpretations: until it is full a
+    lookup misses (and the caller adds a fresh one), afterwards lookups
+    rotate through the stored variants round-robin.
+    """
+    def __init__(
+        self,
+        ttl: float = TTL,
+        variants: int = VARIANTS,
+        max_buckets: int = MAX_BUCKETS,
+        temp_band: float = TEMP_BAND,
+        humidity_band: float = HUMIDITY_BAND,
+        wind_band: float = WIND_BAND,
+        key_by_city: bool = KEY_BY_CITY,
+    ):
+        self.ttl = ttl
+        self.variants = max(1, variants)
+        self.max_buckets = max_buckets
+        self.temp_band = temp_band
+        self.humidity_band = humidity_band
+        self.wind_band = wind_band
+        self.key_by_city = key_by_city
+        self._buckets: "OrderedDict[str, dict]" = OrderedDict()  # key -> {"variants": [(value, stored_at)], "next": int}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0}
+
+    def key_for(self, weather: dict, journal: Optional[str] = "", image_caption: Optional[str] = "") -> str:
+        parts = [
+            normalize_key(weather.get("city") or "") if self.key_by_city else "*",
+            _band(weather["temperature"], self.temp_band),
+            _band(weather["humidity"], self.humidity_band),
+            _band(weather["wind_speed"], self.wind_band),
+            normalize_key(weather.get("weather_main") or ""),
+            normalize_key(weather.get("weather_desc") or ""),
+            _text_hash(journal),
+            _text_hash(image_caption),
+        ]
+        return "|".join(str(part) for part in parts)
+
+    def lookup(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket["variants"] = [v for v in bucket["variants"] if now - v[1] < self.ttl]
+                if len(bucket["variants"]) >= self.variants:
+                    value, _ = bucket["variants"][bucket["next"] % len(bucket["variants"])]
+                    bucket["next"] += 1
+                    self._buckets.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+            self._stats["misses"] += 1
+            return None
+
+    def add(self, key: str, value: Any):
+        with self._lock:
+            bucket = self._buckets.setdefault(key, {"variants": [], "next": 0})
+            bucket["variants"].append((value, time.time()))
+            del bucket["variants"][:-self.variants]
+            self._buckets.move_to_end(key)
+            self._stats["stores"] += 1
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, buckets=len(self._buckets), variants=self.variants)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+# Process-wide instance used by weather_to_prompt
+interpretation_cache = InterpretationCache()
@@ -0,0 +1,200 @@
+import os
+import sys
+import shlex
+import time
+import uuid
+import asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from utils import get_setting
+
+# === Configuration (override any of these in config.py) ===
+JOB_WORKERS     = get_setting("JOB_WORKERS", 4)          # concurrent pipelines
+JOB_QUEUE_DEPTH = get_setting("JOB_QUEUE_DEPTH", 100)    # queued jobs before POST /jobs is refused
+JOB_RESULT_TTL  = get_setting("JOB_RESULT_TTL", 3600)    # seconds a finished job stays queryable
+
+class QueueFull(Exception):
+    pass
+
+class QueueNotShared(Exception):
+    """Jobs live in one process's memory, but the server runs several processes."""
+    status_code = 503
+
+def _workers_flag(args: list) -> Optional[str]:
+    """The last `--workers N` / `--workers=N` / `-w N` / `-wN` in `args`."""
+    count = None
+    for i, arg in enumerate(args):
+        if arg.startswith("--workers="):
+            count = arg.split("=", 1)[1]
+        elif arg in ("--workers", "-w") and i + 1 < len(args):
+            count = args[i + 1]
+        elif arg.startswith("-w") and arg[2:].isdigit():
+            count = arg[2:]
+    return count
+
+def server_processes(argv: Optional[list] = None, environ=None) -> int:
+    """
+    Worker processes the server was started with: uvicorn / gunicorn
+    `--workers` (or gunicorn's `-w`, also via GUNICORN_CMD_ARGS), else
+    WEB_CONCURRENCY, else 1. A gunicorn.conf.py is not read, which is why
+    job ids also carry the process that owns them (see JobQueue.foreign).
+    """
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+    count = environ.get("WEB_CONCURRENCY")
+    launcher = " ".join(argv[:1])
+    if "gunicorn" in launcher:
+        count = _workers_flag(shlex.split(environ.get("GUNICORN_CMD_ARGS", ""))) or count
+    if "uvicorn" in launcher or "gunicorn" in launcher:
+        count = _workers_flag(argv[1:]) or count
+    try:
+        return max(int(count or 1), 1)
+    except ValueError:
+        return 1
+
+@dataclass
+class Job:
+    id: str
+    status: str = "queued"  # queued | running | done | error
+    stages: dict = field(default_factory=dict)
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def update_stage(self, stage: str, status: str):
+        entry = self.stages.setdefault(stage, {"status": "pending"})
+        entry["status"] = status
+        if status == "running":
+            entry["started_at"] = time.time()
+        elif status in ("done", "error"):
+            entry["finished_at"] = time.time()
+            if "started_at" in entry:
+                entry["seconds"] = round(entry["finished_at"] - entry["started_at"], 3)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stages": self.stages,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+JobRunner = Callable[[Job], Awaitable[dict]]
+
+class JobQueue:
+    """
+    Bounded FIFO of jobs served by a fixed pool of asyncio workers.
+
+    `submit` never blocks: it raises QueueFull once `depth` jobs are waiting,
+    so bursts are absorbed up to the configured depth while upstream
+    concurrency never exceeds `workers`.
+
+    Jobs live in this process's memory, so the server must run as a single
+    process: with `uvicorn --workers N` a GET /jobs/{id} could reach a
+    process that never saw the job. When several server processes are
+    configured `start` warns and `submit` raises QueueNotShared. Job ids
+    are prefixed with a per-process token, so a lookup that lands on the
+    wrong process (or follows a restart) is told apart from an unknown id
+    by `foreign`.
+    """
+    def __init__(self, workers: int = JOB_WORKERS, depth: int = JOB_QUEUE_DEPTH, result_ttl: float = JOB_RESULT_TTL):
+        self.workers = workers
+        self.depth = depth
+        self.result_ttl = result_ttl
+        self._jobs: dict[str, Job] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self.process = uuid.uuid4().hex[:8]   # prefixes every job id issued here
+        self.processes = 1
+
+    async def start(self):
+        self.processes = server_processes()
+        if self.processes > 1:
+            print(f"⚠️ The job queue is per process, but the server runs {self.processes} worker processes; "
+                  "/jobs and progressive mode are disabled (run a single process and raise JOB_WORKERS instead)")
+        self._queue = asyncio.Queue(maxsize=self.depth)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def shared(self) -> bool:
+        """Whether every request reaches this process, so a job can be polled."""
+        return self.processes == 1
+
+    def ensure_shared(self):
+        if not self.shared:
+            raise QueueNotShared(
+                f"Background jobs are unavailable: the server runs {self.processes} worker processes "
+                "and a job's status would only be known to one of them"
+            )
+
+    def submit(self, runner: JobRunner, stages=(), on_finish: Optional[Callable[[], None]] = None) -> Job:
+        if self._queue is None:
+            raise RuntimeError("JobQueue.start() has not been called")
+        self.ensure_shared()
+        self._prune()
+        job = Job(id=f"{self.process}-{uuid.uuid4().hex}", stages={stage: {"status": "pending"} for stage in stages})
+        try:
+            self._queue.put_nowait((job, runner, on_finish))
+        except asyncio.QueueFull:
+            raise QueueFull(f"Job queue is full ({self.depth} waiting)")
+        self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def foreign(self, job_id: str) -> bool:
+        """Whether `job_id` is shaped like an id issued by another process (or before a restart)."""
+        process, _, rest = job_id.partition("-")
+        return process != self.process and len(process) == len(self.process) and len(rest) == 32
+
+    def stats(self) -> dict:
+        counts = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "depth": self.depth,
+            "shared": self.shared,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "jobs": counts,
+        }
+
+    # === Internals ===
+    async def _worker(self):
+        while True:
+            job, runner, on_finish = await self._queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                job.result = await runner(job)
+                job.status = "done"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "error"
+            finally:
+                job.finished_at = time.time()
+                if on_finish:
+                    on_finish()
+                self._queue.task_done()
+
+    def _prune(self):
+        cutoff = time.time() - self.result_ttl
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+# Process-wide instance used by the API
+job_queue = JobQueue()
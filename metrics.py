@@ -0,0 +1,186 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from utils import get_setting
+
+# === Configuration (override any of these in config.py) ===
+METRICS_PORT = get_setting("METRICS_PORT", None)   # standalone exporter for ui.py; None = disabled
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Upstream hosts -> provider label
+PROVIDERS = {
+    "api.opencagedata.com": "opencage",
+    "api.openweathermap.org": "openweather",
+    "ipinfo.io": "ipinfo",
+    "api.openai.com": "openai",
+    "api.stability.ai": "stability",
+}
+
+# === Metrics ===
+STAGE_SECONDS = Histogram(
+    "sonification_stage_seconds", "Time spent in each pipeline stage", ["stage"], buckets=STAGE_BUCKETS
+)
+STAGE_ERRORS = Counter(
+    "sonification_stage_errors_total", "Pipeline stages that raised, by exception type", ["stage", "error"]
+)
+STAGE_IN_FLIGHT = Gauge(
+    "sonification_stage_in_flight", "Pipeline stages currently running", ["stage"]
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "sonification_requests_in_flight", "Requests currently being handled"
+)
+UPSTREAM_RESPONSES = Counter(
+    "sonification_upstream_responses_total", "Responses from upstream APIs by provider and HTTP status", ["provider", "status"]
+)
+UPSTREAM_SECONDS = Histogram(
+    "sonification_upstream_seconds", "Time until upstream response headers arrive", ["provider"], buckets=STAGE_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "sonification_llm_tokens_total", "Tokens used by LLM calls, by agent and kind (request / response)", ["agent", "kind"]
+)
+LLM_CALLS = Counter(
+    "sonification_llm_calls_total", "LLM runs by agent (a run may take several model requests)", ["agent"]
+)
+
+# Per-request (stage, seconds) list; tasks spawned by the request share it
+_timings: ContextVar[Optional[list]] = ContextVar("stage_timings", default=None)
+
+# === Stage Timing ===
+def observe(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+@contextmanager
+def stage(name: str):
+    """Time a block as one pipeline stage; usable from sync and async code alike."""
+    in_flight = STAGE_IN_FLIGHT.labels(name)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        STAGE_ERRORS.labels(name, type(e).__name__).inc()
+        raise
+    finally:
+        in_flight.dec()
+        observe(name, time.perf_counter() - start)
+
+@contextmanager
+def track_request():
+    """Collect the stage timings of one request; yields the list for `server_timing`."""
+    timings = []
+    token = _timings.set(timings)
+    REQUESTS_IN_FLIGHT.inc()
+    try:
+        yield timings
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+        _timings.reset(token)
+
+def server_timing(timings: list) -> str:
+    """Format timings as a Server-Timing header value; repeated stages are summed."""
+    totals = {}
+    for name, seconds in timings:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
+
+# === LLM Usage ===
+def record_usage(agent: str, usage):
+    """Count one pydantic_ai run's `usage()` under the agent's name."""
+    LLM_CALLS.labels(agent).inc()
+    LLM_TOKENS.labels(agent, "request").inc(usage.request_tokens or 0)
+    LLM_TOKENS.labels(agent, "response").inc(usage.response_tokens or 0)
+
+# === httpx Event Hooks ===
+def _on_request(request):
+    request.extensions["metrics_start"] = time.perf_counter()
+
+def _on_response(response):
+    request = response.request
+    provider = PROVIDERS.get(request.url.host, request.url.host)
+    UPSTREAM_RESPONSES.labels(provider, str(response.status_code)).inc()
+    start = request.extensions.get("metrics_start")
+    if start is not None:
+        UPSTREAM_SECONDS.labels(provider).observe(time.perf_counter() - start)
+
+async def _on_request_async(request):
+    _on_request(request)
+
+async def _on_response_async(response):
+    _on_response(response)
+
+def event_hooks() -> dict:
+    return {"request": [_on_request], "response": [_on_response]}
+
+def async_event_hooks() -> dict:
+    return {"request": [_on_request_async], "response": [_on_response_async]}
+
+# === Cache / Queue Collector ===
+class _CacheCollector:
+    """Reads the cache, job-queue, circuit-breaker, single-flight and scheduler stats at scrape time."""
+    def collect(self):
+        # Imported lazily so importing metrics never drags in the caches
+        from geocode_cache import geocode_cache
+        from geoip import geoip
+        from weather_cache import weather_cache
+        from caption_cache import caption_cache
+        from interpretation_cache import interpretation_cache
+        from audio_store import audio_store, reference_store
+        from jobs import job_queue
+        import resilience
+        import scheduler
+        import singleflight
+
+        ratios = GaugeMetricFamily("sonification_cache_hit_ratio", "Cache hit ratio since startup", labels=["cache"])
+        ratios.add_metric(["geocode"], geocode_cache.stats()["hit_ratio"])
+        ratios.add_metric(["geoip"], geoip.stats()["hit_ratio"])
+        ratios.add_metric(["weather"], weather_cache.stats()["totals"]["hit_ratio"])
+        ratios.add_metric(["caption"], caption_cache.stats()["hit_ratio"])
+        ratios.add_metric(["interpretation"], interpretation_cache.stats()["hit_ratio"])
+        ratios.add_metric(["audio"], audio_store.stats()["hit_ratio"])
+        ratios.add_metric(["reference_audio"], reference_store.stats()["hit_ratio"])
+        yield ratios
+
+        yield GaugeMetricFamily("sonification_jobs_queued", "Jobs waiting for a worker", value=job_queue.stats()["queued"])
+
+        circuits = GaugeMetricFamily("sonification_circuit_open", "1 while a provider's circuit breaker is open", labels=["provider"])
+        for provider, stats in resilience.stats().items():
+            circuits.add_metric([provider], 0.0 if stats["state"] == "closed" else 1.0)
+        yield circuits
+
+        coalesced = CounterMetricFamily(
+            "sonification_singleflight_coalesced", "Calls that shared another caller's in-flight upstream call", labels=["group"]
+        )
+        for group, stats in singleflight.stats().items():
+            coalesced.add_metric([group], stats["coalesced"])
+        yield coalesced
+
+        waiting = GaugeMetricFamily("sonification_scheduler_waiting", "Calls queued for a provider's rate / concurrency limit", labels=["provider"])
+        rejected = CounterMetricFamily("sonification_scheduler_rejected", "Calls refused before reaching the provider", labels=["provider", "status"])
+        for provider, stats in scheduler.stats().items():
+            waiting.add_metric([provider], stats["waiting"])
+            rejected.add_metric([provider, "429"], stats["rejected_429"])
+            rejected.add_metric([provider, "503"], stats["rejected_503"] + stats["timed_out"])
+        yield waiting
+        yield rejected
+
+REGISTRY.register(_CacheCollector())
+
+# === Export ===
+def render() -> tuple[bytes, str]:
+    """Prometheus text exposition of every metric, with its content type."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+def serve(port: Optional[int] = METRICS_PORT):
+    """Start a standalone /metrics server (for processes without the API, e.g. ui.py)."""
+    if port:
+        start_http_server(port)
+        print(f"📈 Metrics on http://localhost:{port}/metrics")
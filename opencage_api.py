@@ -1,30 +1,26 @@
-import requests
+import asyncio
 from typing import Optional, Tuple
 
 from config import OPENCAGE_API_KEY
+from http_client import get_client, get_async_client
+from geocode_cache import geocode_cache, normalize_key, MISS
+from gazetteer import gazetteer
+from singleflight import geocode_flight
+from utils import get_setting
+import resilience
 
-def location_text_to_latlon(
-    location_text: str,
-) -> Optional[Tuple[float, float]]:
-    """
-    Convert a human-readable location description to latitude and longitude.
+OPENCAGE_BASE_URL = get_setting("OPENCAGE_BASE_URL", "https://api.opencagedata.com")
+OPENCAGE_URL = f"{OPENCAGE_BASE_URL}/geocode/v1/json"
 
-    Args:
-        location_text (str): e.g., "Taipei 101", "Golden Gate Bridge"
-        api_key (str, optional): OpenCage API key. Defaults to OPENCAGE_KEY env var.
-
-    Returns:
-        (lat, lon) tuple or None if not found
-    """
-
-    url = "https://api.opencagedata.com/geocode/v1/json"
-    params = {
+# === Shared Request / Response Handling ===
+def _build_params(location_text: str) -> dict:
+    return {
         "q": location_text,
         "key": OPENCAGE_API_KEY,
         "limit": 1,
     }
 
-    response = requests.get(url, params=params)
+def _parse_response(response) -> Optional[Tuple[float, float]]:
     if response.status_code != 200:
         raise RuntimeError(f"Geocoding failed: {response.status_code}, {response.text}")
 
@@ -35,9 +31,79 @@ def location_text_to_latlon(
     else:
         return None
 
+def location_text_to_latlon(
+    location_text: str,
+) -> Optional[Tuple[float, float]]:
+    """
+    Convert a human-readable location description to latitude and longitude.
+
+    Args:
+        location_text (str): e.g., "Taipei 101", "Golden Gate Bridge"
+
+    Returns:
+        (lat, lon) tuple or None if not found
+
+    Names the offline gazetteer (GAZETTEER_PATH) resolves confidently never
+    reach OpenCage, and concurrent lookups of the same place share one call.
+    """
+    local = gazetteer.latlon(location_text)
+    if local:
+        return local
+
+    cached = geocode_cache.get(location_text)
+    if cached is not MISS:
+        return cached
+
+    return geocode_flight.do(normalize_key(location_text), lambda: _geocode(location_text))
+
+def _geocode(location_text: str) -> Optional[Tuple[float, float]]:
+    params = _build_params(location_text)
+
+    def fetch(timeout):
+        response = get_client().get(OPENCAGE_URL, params=params, timeout=timeout)
+        return resilience.raise_for_retryable("opencage", response)
+
+    response = resilience.call("opencage", fetch)
+    latlon = _parse_response(response)
+    geocode_cache.set(location_text, latlon)
+    return latlon
+
+async def location_text_to_latlon_async(
+    location_text: str,
+) -> Optional[Tuple[float, float]]:
+    """
+    Async version of `location_text_to_latlon`, safe to await from the API event loop.
+    """
+    if gazetteer.enabled:
+        # A thread: the first call may load the index, and fuzzy matching is CPU work
+        local = await asyncio.to_thread(gazetteer.latlon, location_text)
+        if local:
+            return local
+
+    # Memory hits are answered inline; SQLite reads and writes go to a thread
+    cached = geocode_cache.get_memory(location_text)
+    if cached is MISS:
+        cached = await asyncio.to_thread(geocode_cache.get, location_text)
+    if cached is not MISS:
+        return cached
+
+    return await geocode_flight.do_async(normalize_key(location_text), lambda: _geocode_async(location_text))
+
+async def _geocode_async(location_text: str) -> Optional[Tuple[float, float]]:
+    params = _build_params(location_text)
+
+    async def fetch(timeout):
+        response = await get_async_client().get(OPENCAGE_URL, params=params, timeout=timeout)
+        return resilience.raise_for_retryable("opencage", response)
+
+    response = await resilience.call_async("opencage", fetch)
+    latlon = _parse_response(response)
+    await asyncio.to_thread(geocode_cache.set, location_text, latlon)
+    return latlon
+
 if __name__ == "__main__":
     coords = location_text_to_latlon("Taipei 101")
     if coords:
         print(f"📍 Coordinates: {coords}")
     else:
-        print("❌ Location not found")
\ No newline at end of file
+        print("❌ Location not found")
@@ -1,8 +1,19 @@
-import requests
-
 # === Configuration ===
+import asyncio
 from config import OPENWEATHER_API_KEY
+from http_client import get_client, get_async_client
+from weather_cache import weather_cache
+from singleflight import weather_flight
+from geoip import geoip, is_public
+from utils import get_setting
+import metrics
+import resilience
+import scheduler
 UNITS = "metric"
+OPENWEATHER_BASE_URL = get_setting("OPENWEATHER_BASE_URL", "https://api.openweathermap.org")
+IPINFO_BASE_URL      = get_setting("IPINFO_BASE_URL", "https://ipinfo.io")
+WEATHER_URL = f"{OPENWEATHER_BASE_URL}/data/2.5/weather"
+IPINFO_URL  = f"{IPINFO_BASE_URL}/json"
 
 # === Shared Weather Parser ===
 def parse_weather_data(data):
@@ -15,34 +26,128 @@ def parse_weather_data(data):
         "wind_speed": data["wind"]["speed"]
     }
 
-# === Get weather by city name ===
-def get_weather_by_city(city):
-    url = "https://api.openweathermap.org/data/2.5/weather"
-    params = {"q": city, "appid": OPENWEATHER_API_KEY, "units": UNITS}
-    response = requests.get(url, params=params)
-    if response.ok:
+def _handle_response(response, label):
+    if 200 <= response.status_code < 300:
         return parse_weather_data(response.json())
-    print(f"❌ API Error (city): {response.status_code}, {response.text}")
+    print(f"❌ API Error ({label}): {response.status_code}, {response.text}")
     return None
 
+def _parse_loc(loc_data):
+    loc_str = loc_data.get("loc")  # e.g., "25.0340,121.5624"
+    lat_str, lon_str = loc_str.split(",")
+    return float(lat_str), float(lon_str)
+
+def _ipinfo_url(ip):
+    # Without a public client address (no request, or a LAN / localhost client)
+    # ipinfo locates the server, which is then also where the client is
+    return f"{IPINFO_BASE_URL}/{ip}/json" if is_public(ip) else IPINFO_URL
+
+# === Resilient GET (timeouts, retries, hedging, circuit breaker per provider) ===
+def _get(provider, url, params=None):
+    def attempt(timeout):
+        response = get_client().get(url, params=params, timeout=timeout)
+        return resilience.raise_for_retryable(provider, response)
+    return resilience.call(provider, attempt)
+
+async def _get_async(provider, url, params=None):
+    async def attempt(timeout):
+        response = await get_async_client().get(url, params=params, timeout=timeout)
+        return resilience.raise_for_retryable(provider, response)
+    return await resilience.call_async(provider, attempt)
+
+def _degraded(key, error):
+    """Serve the last reading for `key`, however old, while OpenWeather is failing."""
+    stale = weather_cache.peek(key) if resilience.is_upstream_failure(error) else None
+    if stale is None:
+        raise error
+    print(f"⚠️ Serving cached weather for {key} ({error})")
+    return stale
+
+# === Get weather by city name ===
+def _fetch_by_city(city):
+    params = {"q": city, "appid": OPENWEATHER_API_KEY, "units": UNITS}
+    return _handle_response(_get("openweather", WEATHER_URL, params), "city")
+
+async def _fetch_by_city_async(city):
+    params = {"q": city, "appid": OPENWEATHER_API_KEY, "units": UNITS}
+    return _handle_response(await _get_async("openweather", WEATHER_URL, params), "city")
+
+def get_weather_by_city(city):
+    key = weather_cache.city_key(city)
+    try:
+        return weather_cache.get_or_fetch(key, lambda: weather_flight.do(key, lambda: _fetch_by_city(city)))
+    except Exception as e:
+        return _degraded(key, e)
+
+async def get_weather_by_city_async(city):
+    key = weather_cache.city_key(city)
+    try:
+        return await weather_cache.get_or_fetch_async(
+            key, lambda: weather_flight.do_async(key, lambda: _fetch_by_city_async(city))
+        )
+    except Exception as e:
+        return _degraded(key, e)
+
 # === Get weather by lat/lon ===
-def get_weather_by_lat_lon(lat, lon):
-    url = "https://api.openweathermap.org/data/2.5/weather"
+def _fetch_by_lat_lon(lat, lon):
     params = {"lat": lat, "lon": lon, "appid": OPENWEATHER_API_KEY, "units": UNITS}
-    response = requests.get(url, params=params)
-    if response.ok:
-        return parse_weather_data(response.json())
-    print(f"❌ API Error (lat/lon): {response.status_code}, {response.text}")
-    return None
+    return _handle_response(_get("openweather", WEATHER_URL, params), "lat/lon")
+
+async def _fetch_by_lat_lon_async(lat, lon):
+    params = {"lat": lat, "lon": lon, "appid": OPENWEATHER_API_KEY, "units": UNITS}
+    return _handle_response(await _get_async("openweather", WEATHER_URL, params), "lat/lon")
+
+# Nearby coordinates share one geohash cell, so they share one cached reading
+# (and concurrent misses on a cell share one request)
+def get_weather_by_lat_lon(lat, lon):
+    key = weather_cache.cell_for(lat, lon)
+    try:
+        return weather_cache.get_or_fetch(key, lambda: weather_flight.do(key, lambda: _fetch_by_lat_lon(lat, lon)))
+    except Exception as e:
+        return _degraded(key, e)
+
+async def get_weather_by_lat_lon_async(lat, lon):
+    key = weather_cache.cell_for(lat, lon)
+    try:
+        return await weather_cache.get_or_fetch_async(
+            key, lambda: weather_flight.do_async(key, lambda: _fetch_by_lat_lon_async(lat, lon))
+        )
+    except Exception as e:
+        return _degraded(key, e)
 
 # === Get weather using IP geolocation ===
-def get_weather_by_ip():
+# `ip` is the client's address (see geoip.client_ip). The local GeoIP database
+# (GEOIP_PATH) answers without a network call; ipinfo.io is asked otherwise.
+def get_weather_by_ip(ip=None):
+    try:
+        with metrics.stage("ip_lookup"):
+            latlon = geoip.latlon(ip)
+            if latlon is None:
+                loc_response = _get("ipinfo", _ipinfo_url(ip))
+                loc_response.raise_for_status()
+                latlon = _parse_loc(loc_response.json())
+        lat, lon = latlon
+        return get_weather_by_lat_lon(lat, lon)
+    except (resilience.UpstreamUnavailable, scheduler.Overloaded):
+        raise
+    except Exception as e:
+        print(f"❌ Error getting location by IP: {e}")
+        return None
+
+async def get_weather_by_ip_async(ip=None):
     try:
-        loc_response = requests.get("https://ipinfo.io/json")
-        loc_response.raise_for_status()
-        loc_str = loc_response.json().get("loc")  # e.g., "25.0340,121.5624"
-        lat_str, lon_str = loc_str.split(",")
-        return get_weather_by_lat_lon(float(lat_str), float(lon_str))
+        with metrics.stage("ip_lookup"):
+            if geoip.enabled and not geoip.loaded:
+                await asyncio.to_thread(geoip.load)   # the first load may build the index
+            latlon = geoip.latlon(ip)
+            if latlon is None:
+                loc_response = await _get_async("ipinfo", _ipinfo_url(ip))
+                loc_response.raise_for_status()
+                latlon = _parse_loc(loc_response.json())
+        lat, lon = latlon
+        return await get_weather_by_lat_lon_async(lat, lon)
+    except (resilience.UpstreamUnavailable, scheduler.Overloaded):
+        raise
     except Exception as e:
         print(f"❌ Error getting location by IP: {e}")
         return None
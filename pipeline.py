@@ -0,0 +1,303 @@
+import os
+import random
+import asyncio
+import inspect
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, Union
+
+from image_caption     import caption_image_with_gpt4o_async, create_caption_agent
+from opencage_api      import location_text_to_latlon_async
+from openweather_api   import get_weather_by_lat_lon_async, get_weather_by_ip_async
+from weather_to_prompt import interpret_weather_to_music_prompt_async, interpret_with_image_async, create_weather_agent, create_fused_agent
+from stableaudio_api   import text2audio_async, audio2audio_async
+from uploads           import SavedUpload
+from utils             import get_setting, load_prompt
+from gazetteer         import gazetteer
+from geoip             import geoip
+from geocode_cache     import geocode_cache
+from caption_cache     import caption_cache
+import metrics
+import resilience
+
+MAX_DURATION = 180
+MAX_SEED     = 4294967294
+
+# === Configuration (override any of these in config.py) ===
+PREVIEW_DURATION = get_setting("PREVIEW_DURATION", 10)   # seconds of audio in the progressive-mode preview
+PREVIEW_STEPS    = get_setting("PREVIEW_STEPS", 30)      # diffusion steps for the preview (full renders use 50)
+WARMUP_ON_STARTUP = get_setting("WARMUP_ON_STARTUP", True)  # build agents in the background at startup
+INTERPRETATION_MODE = get_setting("INTERPRETATION_MODE", "separate")   # default for requests that don't choose
+
+# separate: caption (gpt-4o) alongside the weather, then interpretation (gpt-4)
+# fused:    one gpt-4o call interprets weather, journal and image together
+INTERPRETATION_MODES = ("separate", "fused")
+
+PROMPTS = ("prompts/image_caption.txt", "prompts/weather_music_system.txt", "prompts/weather_music_base.txt",
+           "prompts/weather_music_fused.txt")
+
+STAGES = ("geocode", "weather", "caption", "interpret", "audio")
+
+class StageError(Exception):
+    """A pipeline stage failed in a way that maps to a specific HTTP status."""
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+# on_stage(stage, status) with status in "running" | "done" | "skipped" | "error"
+StageCallback = Callable[[str, str], None]
+UploadSource = Union[None, SavedUpload, Awaitable[Optional[SavedUpload]]]
+
+# === Warmup ===
+def warmup():
+    """
+    Import pydantic_ai / openai and build both agents and their HTTP client
+    ahead of the first request, read the prompts, map the gazetteer and
+    GeoIP indexes, open the geocode cache and replay the caption cache.
+    Blocking; the API runs it in a thread after startup so the server accepts
+    connections immediately.
+    """
+    try:
+        with metrics.stage("warmup"):
+            create_caption_agent()
+            create_weather_agent()
+            create_fused_agent()
+            for path in PROMPTS:
+                load_prompt(path)
+            gazetteer.load()
+            geoip.load()
+            geocode_cache.connect()
+            caption_cache.load()
+    except Exception as e:
+        print(f"⚠️ Warmup failed, the rest happens on first use: {e}")
+        return
+    print("✅ Warmed up")
+
+async def _gather(*awaitables):
+    """
+    asyncio.gather, except that a failure cancels the siblings still running:
+    a caption must not keep billing (or read a deleted upload) after the
+    request already failed on its location.
+    """
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+async def _resolve(source: UploadSource) -> Optional[SavedUpload]:
+    # Uploads may still be streaming to disk when the pipeline starts
+    return await source if inspect.isawaitable(source) else source
+
+class _Tracker:
+    def __init__(self, on_stage: Optional[StageCallback]):
+        self.on_stage = on_stage
+
+    def report(self, stage: str, status: str):
+        if self.on_stage:
+            self.on_stage(stage, status)
+
+    async def run(self, stage: str, awaitable):
+        self.report(stage, "running")
+        try:
+            with metrics.stage(stage):
+                result = await awaitable
+        except BaseException:
+            self.report(stage, "error")
+            raise
+        self.report(stage, "done")
+        return result
+
+# === Pipeline Stages ===
+async def fetch_weather(location: Optional[str], tracker: Optional[_Tracker] = None, client_ip: Optional[str] = None):
+    """Geocode → weather for a location string, or weather at the client's IP when empty."""
+    tracker = tracker or _Tracker(None)
+    if location:
+        latlon = await tracker.run("geocode", location_text_to_latlon_async(location))
+        if not latlon:
+            raise StageError(400, "Invalid location")
+        lat, lon = latlon
+        weather = await tracker.run("weather", get_weather_by_lat_lon_async(lat, lon))
+        latlon_str = f"{lat:.4f}, {lon:.4f}"
+    else:
+        tracker.report("geocode", "skipped")
+        weather = await tracker.run("weather", get_weather_by_ip_async(client_ip))
+        latlon_str = "Detected via IP"
+
+    if not weather:
+        raise StageError(500, "Weather fetch failed")
+    return weather, latlon_str
+
+async def caption_image(image: UploadSource, tracker: Optional[_Tracker] = None) -> str:
+    tracker = tracker or _Tracker(None)
+    image = await _resolve(image)
+    if not image:
+        tracker.report("caption", "skipped")
+        return ""
+    return await tracker.run("caption", caption_image_with_gpt4o_async(image.path, image_digest=image.sha256))
+
+async def generate_audio(prompt: str, duration: int, reference: Optional[SavedUpload] = None, seed: int = 0, steps: int = 50):
+    """Render audio for a prompt; returns (stored path, generation mode)."""
+    duration = min(duration, MAX_DURATION)
+    if reference:
+        path = await audio2audio_async(
+            prompt=prompt,
+            audio_path=reference.path,
+            duration=duration,
+            seed=seed,
+            steps=steps,
+            reference_digest=reference.sha256,
+        )
+        return path, "audio2audio"
+    path = await text2audio_async(prompt=prompt, duration=duration, seed=seed, steps=steps)
+    return path, "text2audio"
+
+def _check_mode(mode: Optional[str]) -> str:
+    mode = mode or INTERPRETATION_MODE
+    if mode not in INTERPRETATION_MODES:
+        raise StageError(400, f"interpretation_mode must be one of {', '.join(INTERPRETATION_MODES)}")
+    return mode
+
+async def _interpret_fused(weather, journal, image: SavedUpload, tracker):
+    # The caption comes out of the interpretation call, so both stages run (and end) together
+    tracker.report("caption", "running")
+    try:
+        result = await interpret_with_image_async(weather, journal or "", image.path, image_digest=image.sha256)
+    except BaseException:
+        tracker.report("caption", "error")
+        raise
+    tracker.report("caption", "done")
+    return result
+
+async def _interpret(location, journal, image, reference, tracker, mode="separate", client_ip=None):
+    """Every stage before audio: (weather, latlon_str, image_caption, interpretation, reference)."""
+    if mode == "fused":
+        (weather, latlon_str), image = await _gather(fetch_weather(location, tracker, client_ip), _resolve(image))
+        if image:
+            result, reference = await _gather(
+                tracker.run("interpret", _interpret_fused(weather, journal, image, tracker)),
+                _resolve(reference),
+            )
+            return weather, latlon_str, result.description, result, reference
+        tracker.report("caption", "skipped")   # no image: nothing to fuse
+        image_caption = ""
+    else:
+        (weather, latlon_str), image_caption = await _gather(
+            fetch_weather(location, tracker, client_ip),
+            caption_image(image, tracker),
+        )
+
+    result, reference = await _gather(
+        tracker.run("interpret", interpret_weather_to_music_prompt_async(
+            weather=weather,
+            journal=journal or "",
+            image_caption=image_caption or ""
+        )),
+        _resolve(reference),
+    )
+    return weather, latlon_str, image_caption, result, reference
+
+# === Full Pipeline ===
+async def run_pipeline(
+    location: Optional[str] = None,
+    journal: Optional[str] = None,
+    duration: int = 20,
+    image: UploadSource = None,
+    reference: UploadSource = None,
+    on_stage: Optional[StageCallback] = None,
+    interpretation_mode: Optional[str] = None,
+    client_ip: Optional[str] = None,
+) -> dict:
+    """
+    Run every stage for one request and return the API response payload.
+
+    Image captioning runs alongside geocode → weather, and the reference audio
+    is resolved while the LLM builds the prompt. In fused `interpretation_mode`
+    the caption and the prompt come from one multimodal call after the weather
+    instead. Every upstream call shares one REQUEST_DEADLINE budget.
+    """
+    tracker = _Tracker(on_stage)
+    mode = _check_mode(interpretation_mode)
+
+    with resilience.deadline():
+        weather, latlon_str, image_caption, result, reference = await _interpret(
+            location, journal, image, reference, tracker, mode, client_ip
+        )
+        audio_path, gen_mode = await tracker.run(
+            "audio", generate_audio(result.suggested_prompt, duration, reference)
+        )
+
+    return build_response(latlon_str, image_caption, weather, result, audio_path, gen_mode)
+
+# === Progressive Mode ===
+@dataclass
+class RenderPlan:
+    """Everything the full-length render needs once the preview has been returned."""
+    prompt: str
+    duration: int
+    seed: int
+    reference: Optional[SavedUpload] = None
+
+async def run_preview(
+    location: Optional[str] = None,
+    journal: Optional[str] = None,
+    duration: int = 20,
+    image: UploadSource = None,
+    reference: UploadSource = None,
+    on_stage: Optional[StageCallback] = None,
+    interpretation_mode: Optional[str] = None,
+    client_ip: Optional[str] = None,
+) -> tuple[dict, RenderPlan]:
+    """
+    Progressive mode, phase one: run every stage up to a short, low-step
+    preview and return it with the plan for `render_full`. Both renders use
+    the same prompt and an explicit seed, so the full track sounds like the preview.
+    """
+    tracker = _Tracker(on_stage)
+    mode = _check_mode(interpretation_mode)
+
+    with resilience.deadline():
+        weather, latlon_str, image_caption, result, reference = await _interpret(
+            location, journal, image, reference, tracker, mode, client_ip
+        )
+        plan = RenderPlan(
+            prompt=result.suggested_prompt,
+            duration=min(duration, MAX_DURATION),
+            seed=random.randint(1, MAX_SEED),
+            reference=reference,
+        )
+        audio_path, gen_mode = await tracker.run("preview", generate_audio(
+            plan.prompt, min(PREVIEW_DURATION, plan.duration), reference, seed=plan.seed, steps=PREVIEW_STEPS
+        ))
+
+    response = build_response(latlon_str, image_caption, weather, result, audio_path, gen_mode)
+    response.update(preview=True, seed=plan.seed)
+    return response, plan
+
+async def render_full(plan: RenderPlan, on_stage: Optional[StageCallback] = None) -> dict:
+    """Progressive mode, phase two: the full-duration, full-step render."""
+    tracker = _Tracker(on_stage)
+    with resilience.deadline():
+        audio_path, gen_mode = await tracker.run(
+            "audio", generate_audio(plan.prompt, plan.duration, plan.reference, seed=plan.seed)
+        )
+    return {
+        "audio_url": f"/audio/{os.path.basename(audio_path)}",
+        "mode": gen_mode,
+        "duration": plan.duration,
+        "seed": plan.seed,
+    }
+
+def build_response(latlon_str, image_caption, weather, result, audio_path, gen_mode) -> dict:
+    return {
+        "location": latlon_str,
+        "image_caption": image_caption,
+        "weather_summary": f"{weather['city']} | {weather['temperature']}C | {weather['weather_desc']}",
+        "mood_keywords": result.mood_keywords,
+        "summary": result.summary,
+        "prompt": result.suggested_prompt,
+        "mode": gen_mode,
+        "audio_url": f"/audio/{os.path.basename(audio_path)}"
+    }
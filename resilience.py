@@ -0,0 +1,290 @@
+import time
+import random
+import asyncio
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import httpx
+
+from utils import get_setting
+import scheduler
+
+# === Configuration (override any of these in config.py) ===
+REQUEST_DEADLINE = get_setting("REQUEST_DEADLINE", 300.0)   # seconds for one whole /generate pipeline
+RETRY_STATUSES   = get_setting("RETRY_STATUSES", (408, 425, 429, 500, 502, 503, 504))
+
+@dataclass(frozen=True)
+class Policy:
+    timeout: float                         # per attempt, capped by the request deadline
+    retries: int = 0                       # extra attempts after the first
+    backoff: float = 0.2                   # base delay; attempt n sleeps uniform(0, backoff * 2**n)
+    backoff_max: float = 2.0
+    hedge_after: Optional[float] = None    # async only: start a second attempt if the first is this slow
+    failure_threshold: int = 5             # consecutive failures that open the circuit
+    reset_after: float = 30.0              # seconds the circuit stays open before a trial call
+
+DEFAULT_POLICIES = {
+    "opencage":    Policy(timeout=5.0,   retries=2, hedge_after=0.8),
+    "openweather": Policy(timeout=5.0,   retries=2, hedge_after=0.8),
+    "ipinfo":      Policy(timeout=3.0,   retries=1, hedge_after=0.5),
+    # The OpenAI SDK already retries internally, so only the breaker and deadline apply
+    "openai":      Policy(timeout=60.0,  retries=0),
+    # Renders are slow and billed: one retry, never hedged
+    "stability":   Policy(timeout=240.0, retries=1, backoff=1.0, backoff_max=5.0),
+}
+
+# e.g. RESILIENCE_POLICIES = {"openweather": {"hedge_after": 0.3}, "stability": {"retries": 0}}
+POLICIES = {
+    name: replace(policy, **get_setting("RESILIENCE_POLICIES", {}).get(name, {}))
+    for name, policy in DEFAULT_POLICIES.items()
+}
+
+# === Errors ===
+class UpstreamUnavailable(Exception):
+    """An upstream could not be used for this request; maps to an HTTP status."""
+    status_code = 503
+
+class CircuitOpen(UpstreamUnavailable):
+    status_code = 503
+
+class DeadlineExceeded(UpstreamUnavailable):
+    status_code = 504
+
+class UpstreamHTTPError(Exception):
+    """Retryable HTTP status from an upstream (see RETRY_STATUSES)."""
+    def __init__(self, provider: str, status_code: int, message: str = ""):
+        super().__init__(f"{provider} returned HTTP {status_code}{': ' + message if message else ''}")
+        self.status_code = status_code
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """True for errors caused by the upstream (network, timeouts, 429/5xx), not by our input."""
+    if isinstance(error, (UpstreamUnavailable, scheduler.Overloaded, httpx.TransportError, TimeoutError)):
+        return True
+    if getattr(error, "status_code", None) in RETRY_STATUSES:
+        return True  # UpstreamHTTPError, pydantic_ai ModelHTTPError
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError")  # openai SDK
+
+def raise_for_retryable(provider: str, response: httpx.Response) -> httpx.Response:
+    if response.status_code in RETRY_STATUSES:
+        raise UpstreamHTTPError(provider, response.status_code)
+    return response
+
+# === Deadlines ===
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+@contextmanager
+def deadline(seconds: float = REQUEST_DEADLINE):
+    """Bound everything called inside (including spawned tasks) to `seconds`; nested deadlines only shrink."""
+    current = _deadline.get()
+    new = time.monotonic() + seconds
+    token = _deadline.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining() -> Optional[float]:
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+def _attempt_timeout(policy: Policy) -> float:
+    left = remaining()
+    if left is None:
+        return policy.timeout
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return min(policy.timeout, left)
+
+def _backoff_delay(policy: Policy, attempt: int) -> float:
+    delay = random.uniform(0, min(policy.backoff_max, policy.backoff * 2 ** attempt))
+    left = remaining()
+    if left is not None and delay >= left:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return delay
+
+# === Circuit Breaker ===
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker: `failure_threshold` failures in a row open it
+    for `reset_after` seconds, during which calls fail fast. The first call
+    after that is a trial (half-open); its outcome closes or re-opens it.
+    """
+    def __init__(self, name: str, failure_threshold: int, reset_after: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "failures": 0, "retries": 0, "hedges": 0, "short_circuits": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self._opened_at >= self.reset_after else "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half_open" and self._trial_running):
+                self._stats["short_circuits"] += 1
+                raise CircuitOpen(f"{self.name} is unavailable (circuit open)")
+            if state == "half_open":
+                self._trial_running = True
+            self._stats["calls"] += 1
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._stats["failures"] += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_running:
+                    self._stats["opened"] += 1
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+    def abandon(self):
+        """A call was cancelled before it finished; let the next call be the trial."""
+        with self._lock:
+            self._trial_running = False
+
+    def count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, state=self.state, consecutive_failures=self._failures)
+
+_breakers = {
+    name: CircuitBreaker(name, policy.failure_threshold, policy.reset_after)
+    for name, policy in POLICIES.items()
+}
+
+def stats() -> dict:
+    return {name: breaker.stats() for name, breaker in _breakers.items()}
+
+# === Calls ===
+T = TypeVar("T")
+
+def _admitted_timeout(timeout: float, slot: scheduler.Slot) -> float:
+    # Time spent queued in the scheduler comes out of the attempt's timeout
+    return max(timeout - slot.waited, 0.001)
+
+def call(provider: str, fn: Callable[[float], T]) -> T:
+    """
+    Run `fn(timeout)` under the provider's policy: circuit breaker, deadline,
+    and bounded retries with jittered backoff on upstream failures. Every
+    attempt first waits for the provider's scheduler (rate / concurrency
+    limits); a refusal there is raised as-is, without retrying.
+    """
+    policy, breaker = POLICIES[provider], _breakers[provider]
+    for attempt in range(policy.retries + 1):
+        timeout = _attempt_timeout(policy)
+        breaker.allow()
+        try:
+            slot = scheduler.acquire(provider, remaining())
+        except BaseException:
+            breaker.abandon()
+            raise
+        try:
+            result = fn(_admitted_timeout(timeout, slot))
+        except Exception as e:
+            if not is_upstream_failure(e):
+                breaker.record_success()  # the upstream answered; the problem is on our side
+                raise
+            breaker.record_failure()
+            if attempt == policy.retries:
+                raise
+            breaker.count("retries")
+            slot.release()
+            time.sleep(_backoff_delay(policy, attempt))
+        except BaseException:
+            breaker.abandon()
+            raise
+        else:
+            breaker.record_success()
+            return result
+        finally:
+            slot.release()
+
+async def _holding(slot: scheduler.Slot, awaitable: Awaitable[T]) -> T:
+    try:
+        return await awaitable
+    finally:
+        slot.release()
+
+async def _hedged(fn: Callable[[float], Awaitable[T]], timeout: float, hedge_after: float, breaker: CircuitBreaker) -> T:
+    tasks = {asyncio.ensure_future(fn(timeout))}
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            slot = scheduler.try_acquire(breaker.name)   # a hedge that would have to queue is skipped
+            if slot is not None:
+                breaker.count("hedges")
+                tasks.add(asyncio.ensure_future(_holding(slot, fn(max(timeout - hedge_after, 0.001)))))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()  # the slower attempt, or both if we were cancelled
+
+async def call_async(provider: str, fn: Callable[[float], Awaitable[T]]) -> T:
+    """
+    Async version of `call`. Each attempt is also cut off at its timeout, and
+    providers with `hedge_after` get a second concurrent attempt when the first
+    is slow; whichever succeeds first wins.
+    """
+    policy, breaker = POLICIES[provider], _breakers[provider]
+    for attempt in range(policy.retries + 1):
+        timeout = _attempt_timeout(policy)
+        breaker.allow()
+        try:
+            slot = await scheduler.acquire_async(provider, remaining())
+        except BaseException:
+            breaker.abandon()
+            raise
+        timeout = _admitted_timeout(timeout, slot)
+        try:
+            if policy.hedge_after is not None and policy.hedge_after < timeout:
+                awaitable = _hedged(fn, timeout, policy.hedge_after, breaker)
+            else:
+                awaitable = fn(timeout)
+            result = await asyncio.wait_for(awaitable, timeout)
+        except Exception as e:
+            if not is_upstream_failure(e):
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            if attempt == policy.retries:
+                if isinstance(e, TimeoutError) and remaining() is not None and remaining() <= 0:
+                    raise DeadlineExceeded("Request deadline exceeded") from e
+                raise
+            breaker.count("retries")
+            slot.release()
+            await asyncio.sleep(_backoff_delay(policy, attempt))
+        except BaseException:
+            breaker.abandon()
+            raise
+        else:
+            breaker.record_success()
+            return result
+        finally:
+            slot.release()
@@ -0,0 +1,309 @@
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from utils import get_setting
+
+# === Configuration (override any of these in config.py) ===
+SCHEDULER_ENABLED = get_setting("SCHEDULER_ENABLED", True)
+QUEUE_BUDGETS     = get_setting("SCHEDULER_QUEUE_BUDGETS", {"interactive": 2.0, "batch": 30.0})   # seconds
+
+PRIORITIES = ("interactive", "batch")   # served in this order
+
+@dataclass(frozen=True)
+class Limits:
+    rate: Optional[float] = None          # calls per second (token bucket); None = unlimited
+    burst: Optional[float] = None         # bucket size; defaults to max(1, rate)
+    concurrency: Optional[int] = None     # calls in flight at once; None = unlimited
+    typical: float = 1.0                  # seconds per call, until calls have been measured
+
+# Stay under each provider's published limits; lower them to match your plan
+DEFAULT_LIMITS = {
+    "opencage":    Limits(rate=15,  concurrency=16, typical=0.3),    # paid plans: 15+ req/s
+    "openweather": Limits(rate=10,  burst=20, concurrency=16, typical=0.3),   # 600 calls/min
+    "ipinfo":      Limits(rate=None, concurrency=16, typical=0.2),
+    "openai":      Limits(rate=8,   concurrency=32, typical=3.0),    # 500 RPM
+    "stability":   Limits(rate=15,  concurrency=16, typical=15.0),   # 150 requests / 10 s
+}
+
+# e.g. SCHEDULER_LIMITS = {"openai": {"rate": 3}, "stability": {"concurrency": 4}}
+LIMITS = {
+    name: replace(limits, **get_setting("SCHEDULER_LIMITS", {}).get(name, {}))
+    for name, limits in DEFAULT_LIMITS.items()
+}
+
+SERVICE_SMOOTHING = 0.2   # EWMA weight of the newest call duration
+
+# === Errors ===
+class Overloaded(Exception):
+    """
+    Refused before calling the upstream because the projected queue wait is
+    over budget: 429 when the provider's rate limit is the bottleneck, 503
+    when all of its concurrency slots are busy. Carries a Retry-After hint.
+    """
+    def __init__(self, provider: str, status_code: int, retry_after: float):
+        reason = "rate limit reached" if status_code == 429 else "is too busy"
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"{provider} {reason}; retry in {self.retry_after}s")
+        self.status_code = status_code
+
+# === Priority ===
+_priority: ContextVar[str] = ContextVar("priority", default="interactive")
+
+@contextmanager
+def priority(name: str):
+    """Run everything inside (including spawned tasks) in priority class `name`."""
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority {name!r}; expected one of {PRIORITIES}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+# === Slots ===
+class Slot:
+    """Permission for one upstream call; release it when the call is over."""
+    __slots__ = ("_queue", "_started", "waited")
+
+    def __init__(self, queue: Optional["ProviderQueue"], waited: float = 0.0):
+        self._queue = queue
+        self._started = time.monotonic()
+        self.waited = waited
+
+    def release(self):
+        queue, self._queue = self._queue, None
+        if queue is not None:
+            queue._release(time.monotonic() - self._started)
+
+class _Waiter:
+    __slots__ = ("rank", "seq", "event", "loop", "future", "granted", "abandoned")
+
+    def __init__(self, rank: int, seq: int, loop: Optional[asyncio.AbstractEventLoop]):
+        self.rank, self.seq = rank, seq
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+        self.event = None if loop else threading.Event()
+        self.granted = False
+        self.abandoned = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.rank, self.seq) < (other.rank, other.seq)
+
+    def wake(self):
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        else:
+            self.event.set()
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+# === Per-provider Queue ===
+class ProviderQueue:
+    """
+    Token bucket plus concurrency limit for one provider, with a priority
+    queue in front of both.
+
+    A call is admitted immediately when nobody of equal or higher priority is
+    waiting and both a token and a slot are free. Otherwise its wait is
+    projected from the queue ahead of it, the refill rate and the measured
+    call duration; if that exceeds the priority's budget (or the request's
+    remaining deadline) it is refused at once with `Overloaded` instead of
+    queueing. Interactive callers are always served before batch callers.
+    """
+    def __init__(self, name: str, limits: Limits, budgets: dict = QUEUE_BUDGETS):
+        self.name = name
+        self.limits = limits
+        self.budgets = budgets
+        self.burst = limits.burst or max(1.0, limits.rate or 1.0)
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        self._active = 0
+        self._service = limits.typical
+        self._waiters: list[_Waiter] = []
+        self._queued = [0] * len(PRIORITIES)
+        self._seq = itertools.count()
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        self._stats = {"admitted": 0, "queued": 0, "rejected_429": 0, "rejected_503": 0, "timed_out": 0,
+                       "wait_seconds": 0.0}
+
+    # === Acquire ===
+    def acquire(self, max_wait: Optional[float] = None) -> Slot:
+        waiter, budget = self._enqueue(max_wait, loop=None)
+        if waiter is None:
+            return Slot(self)
+        start = time.monotonic()
+        waiter.event.wait(budget)
+        return self._settle(waiter, start, budget)
+
+    async def acquire_async(self, max_wait: Optional[float] = None) -> Slot:
+        waiter, budget = self._enqueue(max_wait, loop=asyncio.get_running_loop())
+        if waiter is None:
+            return Slot(self)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), budget)
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        return self._settle(waiter, start, budget)
+
+    def try_acquire(self) -> Optional[Slot]:
+        """A slot only if one is free right now (for hedged attempts, which must not queue)."""
+        with self._lock:
+            self._refill()
+            if any(self._queued) or not self._available():
+                return None
+            self._take()
+        return Slot(self)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refill()
+            stats = dict(self._stats, active=self._active, waiting=sum(self._queued),
+                         tokens=round(self._tokens, 2), service_ms=round(self._service * 1000, 1),
+                         rate=self.limits.rate, concurrency=self.limits.concurrency)
+        stats["wait_seconds"] = round(stats["wait_seconds"], 3)
+        return stats
+
+    # === Internals (call with self._lock held unless noted) ===
+    def _enqueue(self, max_wait, loop):
+        rank = PRIORITIES.index(_priority.get())
+        budget = self.budgets.get(PRIORITIES[rank], 0.0)
+        if max_wait is not None:
+            budget = min(budget, max(max_wait, 0.0))
+        with self._lock:
+            self._refill()
+            if not self._waiters_ahead(rank) and self._available():
+                self._take()
+                return None, budget
+            rate_wait, busy_wait = self._projected_wait(rank)
+            if max(rate_wait, busy_wait) > budget:
+                status = 429 if rate_wait >= busy_wait else 503
+                self._stats[f"rejected_{status}"] += 1
+                raise Overloaded(self.name, status, max(rate_wait, busy_wait))
+            waiter = _Waiter(rank, next(self._seq), loop)
+            heapq.heappush(self._waiters, waiter)
+            self._queued[rank] += 1
+            self._stats["queued"] += 1
+            self._dispatch()
+        return waiter, budget
+
+    def _settle(self, waiter: _Waiter, start: float, budget: float) -> Slot:
+        """After waiting (locks itself): the slot if granted, else drop out of the queue and refuse."""
+        waited = time.monotonic() - start
+        with self._lock:
+            self._stats["wait_seconds"] += waited
+            if not waiter.granted:
+                self._drop(waiter)
+                self._stats["timed_out"] += 1
+        if not waiter.granted:
+            raise Overloaded(self.name, 503, budget or self._service)
+        return Slot(self, waited)
+
+    def _abandon(self, waiter: _Waiter):
+        """The waiting caller was cancelled (locks itself); hand back a slot granted meanwhile."""
+        with self._lock:
+            granted = waiter.granted
+            if not granted:
+                self._drop(waiter)
+        if granted:
+            Slot(self).release()
+
+    def _drop(self, waiter: _Waiter):
+        waiter.abandoned = True   # lazily removed from the heap by _dispatch
+        self._queued[waiter.rank] -= 1
+        self._dispatch()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.limits.rate:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.limits.rate)
+        self._refilled_at = now
+
+    def _available(self) -> bool:
+        if self.limits.concurrency and self._active >= self.limits.concurrency:
+            return False
+        return not self.limits.rate or self._tokens >= 1
+
+    def _take(self):
+        if self.limits.rate:
+            self._tokens -= 1
+        self._active += 1
+        self._stats["admitted"] += 1
+
+    def _waiters_ahead(self, rank: int) -> int:
+        return sum(self._queued[:rank + 1])
+
+    def _projected_wait(self, rank: int) -> tuple[float, float]:
+        """Seconds until a new caller of `rank` would get a token, and a free slot."""
+        position = self._waiters_ahead(rank) + 1
+        rate_wait = max(0.0, (position - self._tokens) / self.limits.rate) if self.limits.rate else 0.0
+        busy_wait = 0.0
+        if self.limits.concurrency:
+            short = position - (self.limits.concurrency - self._active)
+            if short > 0:
+                busy_wait = short * self._service / self.limits.concurrency
+        return rate_wait, busy_wait
+
+    def _dispatch(self):
+        """Grant tokens and slots to waiters in priority order while both are available."""
+        self._refill()
+        while self._waiters:
+            waiter = self._waiters[0]
+            if waiter.abandoned:
+                heapq.heappop(self._waiters)
+                continue
+            if not self._available():
+                if self.limits.rate and self._tokens < 1 and self._timer is None:
+                    # Nothing else will wake the queue when only tokens are missing
+                    self._timer = threading.Timer((1 - self._tokens) / self.limits.rate, self._tick)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            heapq.heappop(self._waiters)
+            self._queued[waiter.rank] -= 1
+            self._take()
+            waiter.granted = True
+            waiter.wake()
+
+    def _tick(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def _release(self, seconds: float):
+        with self._lock:
+            self._active -= 1
+            self._service += SERVICE_SMOOTHING * (seconds - self._service)
+            self._dispatch()
+
+_queues = {name: ProviderQueue(name, limits) for name, limits in LIMITS.items()}
+
+# === Entry Points (used by resilience.call / call_async for every attempt) ===
+def acquire(provider: str, max_wait: Optional[float] = None) -> Slot:
+    queue = _queues.get(provider)
+    return queue.acquire(max_wait) if SCHEDULER_ENABLED and queue else Slot(None)
+
+async def acquire_async(provider: str, max_wait: Optional[float] = None) -> Slot:
+    queue = _queues.get(provider)
+    return await queue.acquire_async(max_wait) if SCHEDULER_ENABLED and queue else Slot(None)
+
+def try_acquire(provider: str) -> Optional[Slot]:
+    queue = _queues.get(provider)
+    return queue.try_acquire() if SCHEDULER_ENABLED and queue else Slot(None)
+
+def stats() -> dict:
+    return {name: queue.stats() for name, queue in _queues.items()} if SCHEDULER_ENABLED else {}
@@ -0,0 +1,133 @@
+import asyncio
+import threading
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+from utils import get_setting
+
+# === Configuration (override any of these in config.py) ===
+SINGLEFLIGHT_ENABLED = get_setting("SINGLEFLIGHT_ENABLED", True)
+
+T = TypeVar("T")
+
+class _Call:
+    """One in-flight sync call; followers block on `done`."""
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class _Flight:
+    """One in-flight async call, run as a task so no single caller owns it."""
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class Group:
+    """
+    Coalesces concurrent calls with the same key into one upstream call.
+
+    The first caller for a key (the leader) runs the function; everyone who
+    asks for that key while it is still running waits for it and receives the
+    same result, or the same exception. Nothing is remembered afterwards:
+    that is the caches' job, which only help once the first call finished.
+
+    Sync and async calls are tracked separately. An async call runs in its own
+    task, in the leader's context (deadline, stage timings); a waiter that is
+    cancelled just stops waiting, and the call is cancelled only when its
+    last waiter is gone.
+    """
+    def __init__(self, name: str, enabled: bool = SINGLEFLIGHT_ENABLED):
+        self.name = name
+        self.enabled = enabled
+        self._calls: dict[Hashable, _Call] = {}
+        self._flights: dict[tuple, _Flight] = {}   # (event loop, key) -> flight
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "coalesced": 0, "errors": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        if not self.enabled:
+            return fn()
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats["calls"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            self._count("errors")
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        if not self.enabled:
+            return await fn()
+        flight_key = (asyncio.get_running_loop(), key)
+        with self._lock:
+            flight = self._flights.get(flight_key)
+            if flight is None:
+                flight = self._flights[flight_key] = _Flight(asyncio.ensure_future(fn()))
+                flight.task.add_done_callback(lambda task: self._land(flight_key, flight))
+                self._stats["calls"] += 1
+            else:
+                self._stats["coalesced"] += 1
+            flight.waiters += 1
+
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            with self._lock:
+                flight.waiters -= 1
+                abandoned = flight.waiters == 0 and not flight.task.done()
+                if abandoned and self._flights.get(flight_key) is flight:
+                    del self._flights[flight_key]   # later callers start a fresh call
+            if abandoned:
+                flight.task.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats, in_flight=len(self._calls) + len(self._flights), enabled=self.enabled)
+        requests = stats["calls"] + stats["coalesced"]
+        stats["coalesced_ratio"] = stats["coalesced"] / requests if requests else 0.0
+        return stats
+
+    # === Internals ===
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _land(self, flight_key: tuple, flight: _Flight):
+        with self._lock:
+            if self._flights.get(flight_key) is flight:
+                del self._flights[flight_key]
+        if not flight.task.cancelled() and flight.task.exception() is not None:
+            self._count("errors")
+
+# Process-wide groups, one per upstream lookup that concurrent requests tend to repeat
+geocode_flight        = Group("geocode")
+weather_flight        = Group("weather")
+interpretation_flight = Group("interpretation")
+
+_groups = (geocode_flight, weather_flight, interpretation_flight)
+
+def stats() -> dict:
+    return {group.name: group.stats() for group in _groups}
@@ -1,13 +1,208 @@
 import os
+import time
+import shutil
+import asyncio
 import argparse
-import requests
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+import httpx
 
 from config import STABILITY_API_KEY
+from http_client import get_client, get_async_client, CONNECT_TIMEOUT
+from audio_store import audio_store, reference_store, generation_key
+from utils       import file_digest, get_setting
+import audio_preprocess
+import metrics
+import resilience
+
+STABILITY_BASE_URL = get_setting("STABILITY_BASE_URL", "https://api.stability.ai")
+TEXT2AUDIO_URL  = f"{STABILITY_BASE_URL}/v2beta/audio/stable-audio-2/text-to-audio"
+AUDIO2AUDIO_URL = f"{STABILITY_BASE_URL}/v2beta/audio/stable-audio-2/audio-to-audio"
+
+# === Shared Request / Response Handling ===
+def _headers() -> dict:
+    if not STABILITY_API_KEY:
+        raise ValueError("Missing Stability API key. Pass it explicitly or set STABILITY_KEY env var.")
+    return {"Authorization": f"Bearer {STABILITY_API_KEY}", "Accept": "audio/*"}
+
+def _form_fields(data: dict) -> dict:
+    # Stability only accepts multipart/form-data, so every field is sent as a form part
+    return {key: (None, str(value)) for key, value in data.items()}
+
+def _deliver(path: str, filename: Optional[str]) -> str:
+    """Copy a stored file to an explicitly requested filename, if any."""
+    if filename and os.path.abspath(filename) != os.path.abspath(path):
+        shutil.copyfile(path, filename)
+        return filename
+    return path
+
+def _render_timeout(seconds: float) -> httpx.Timeout:
+    # The attempt budget comes from the resilience policy / request deadline
+    return httpx.Timeout(seconds, connect=min(CONNECT_TIMEOUT, seconds))
+
+def _raise_for_status(response):
+    if response.status_code in resilience.RETRY_STATUSES:
+        raise resilience.UpstreamHTTPError("stability", response.status_code, response.text)
+    raise Exception(f"HTTP {response.status_code}: {response.text}")
+
+# Responses are streamed to a scratch file in the store and committed once
+# complete, so a full render is never held in memory.
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+def _save_stream(response, key: str, output_format: str, filename: Optional[str]) -> str:
+    if not 200 <= response.status_code < 300:
+        response.read()
+        _raise_for_status(response)
+
+    temp_path = audio_store.temp_path(key, output_format)
+    write_seconds = 0.0  # disk time only, not time spent waiting on the download
+    try:
+        with open(temp_path, "wb") as f:
+            for chunk in response.iter_bytes(DOWNLOAD_CHUNK_SIZE):
+                start = time.perf_counter()
+                f.write(chunk)
+                write_seconds += time.perf_counter() - start
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    start = time.perf_counter()
+    path = _deliver(audio_store.put(temp_path, key, output_format), filename)
+    metrics.observe("file_write", write_seconds + time.perf_counter() - start)
+    return path
+
+async def _save_stream_async(response, key: str, output_format: str, filename: Optional[str]) -> str:
+    if not 200 <= response.status_code < 300:
+        await response.aread()
+        _raise_for_status(response)
+
+    temp_path = audio_store.temp_path(key, output_format)
+    write_seconds = 0.0  # disk time only, not time spent waiting on the download
+    try:
+        with open(temp_path, "wb") as f:
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                start = time.perf_counter()
+                await asyncio.to_thread(f.write, chunk)
+                write_seconds += time.perf_counter() - start
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    start = time.perf_counter()
+    path = audio_store.put(temp_path, key, output_format)
+    path = await asyncio.to_thread(_deliver, path, filename)
+    metrics.observe("file_write", write_seconds + time.perf_counter() - start)
+    return path
+
+# === Reference Preprocessing ===
+# The reference is trimmed / looped to the requested duration, downmixed,
+# resampled and re-encoded before upload (see audio_preprocess.py). Prepared
+# clips are cached by input digest + parameters; decoding runs in a process
+# pool so it never blocks the event loop.
+_PREP_ERRORS = (audio_preprocess.UnsupportedReference, subprocess.CalledProcessError, BrokenProcessPool, OSError, ValueError)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process that runs an event loop and worker threads is unsafe
+            _pool = ProcessPoolExecutor(audio_preprocess.REFERENCE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def _reset_pool(pool: ProcessPoolExecutor):
+    """Drop a pool whose worker died; the next reference gets a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def shutdown_reference_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+def reference_key(digest: str, duration: int) -> str:
+    """Identifies the uploaded reference: the prepared clip's cache key, or the raw digest."""
+    if not audio_preprocess.PREPROCESS_REFERENCE:
+        return digest
+    return generation_key(reference=digest, duration=duration, **audio_preprocess.preprocess_params())
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _commit_reference(audio_path: str, temp_path: str, key: str) -> str:
+    path = reference_store.put(temp_path, key, audio_preprocess.OUTPUT_FORMAT)
+    before, after = os.path.getsize(audio_path), os.path.getsize(path)
+    print(f"✂️ Prepared reference: {before / 1024:.0f} KB → {after / 1024:.0f} KB")
+    return path
+
+def _prepared_reference(audio_path: str, key: str, duration: int) -> str:
+    """Path to upload for `audio_path`; falls back to the original if it cannot be prepared."""
+    if not audio_preprocess.PREPROCESS_REFERENCE:
+        return audio_path
+    cached = reference_store.get(key, audio_preprocess.OUTPUT_FORMAT)
+    if cached:
+        return cached
+
+    temp_path = reference_store.temp_path(key, audio_preprocess.OUTPUT_FORMAT)
+    try:
+        with metrics.stage("reference_prep"):
+            audio_preprocess.prepare_reference(audio_path, temp_path, duration)
+    except _PREP_ERRORS as e:
+        _discard(temp_path)
+        print(f"⚠️ Reference preprocessing failed, uploading the original: {e}")
+        return audio_path
+    except BaseException:
+        _discard(temp_path)
+        raise
+    return _commit_reference(audio_path, temp_path, key)
+
+async def _prepared_reference_async(audio_path: str, key: str, duration: int) -> str:
+    if not audio_preprocess.PREPROCESS_REFERENCE:
+        return audio_path
+    cached = reference_store.get(key, audio_preprocess.OUTPUT_FORMAT)
+    if cached:
+        return cached
+
+    temp_path = reference_store.temp_path(key, audio_preprocess.OUTPUT_FORMAT)
+    try:
+        with metrics.stage("reference_prep"):
+            if audio_preprocess.REFERENCE_WORKERS:
+                pool = _get_pool()
+                try:
+                    await asyncio.get_running_loop().run_in_executor(
+                        pool, audio_preprocess.prepare_reference, audio_path, temp_path, duration
+                    )
+                except BrokenProcessPool:
+                    _reset_pool(pool)
+                    raise
+            else:
+                await asyncio.to_thread(audio_preprocess.prepare_reference, audio_path, temp_path, duration)
+    except _PREP_ERRORS as e:
+        _discard(temp_path)
+        print(f"⚠️ Reference preprocessing failed, uploading the original: {e}")
+        return audio_path
+    except BaseException:
+        _discard(temp_path)
+        raise
+    return await asyncio.to_thread(_commit_reference, audio_path, temp_path, key)
 
 def text2audio(
     prompt: str,
     duration: int = 10,
-    filename: str = "./audio/text2audio.mp3",
+    filename: Optional[str] = None,
     seed: int = 0,
     steps: int = 50,
     cfg_scale: float = 7.0,
@@ -19,40 +214,87 @@ def text2audio(
     Args:
         prompt (str): Descriptive prompt for generation.
         duration (int): Desired length of the output audio (in seconds).
-        filename (str): Output filename to save the generated audio.
+        filename (str, optional): Also copy the result here; by default the path inside the audio store is returned.
         seed (int): Random seed for reproducibility.
         steps (int): Number of generation steps.
         cfg_scale (float): Prompt adherence strength.
         output_format (str): Output file format ('mp3' or 'wav').
         stability_key (str): API key for Stability AI; uses STABILITY_KEY env var if not provided.
 
+    Identical requests are served from the content-addressed audio store
+    without calling the API again.
+
     Returns:
         str: Path to the saved audio file.
     """
-    if not STABILITY_API_KEY:
-        raise ValueError("Missing Stability API key. Pass it explicitly or set STABILITY_KEY env var.")
-    response = requests.post(
-        "https://api.stability.ai/v2beta/audio/stable-audio-2/text-to-audio",
-        headers={"Authorization": f"Bearer {STABILITY_API_KEY}", "Accept": "audio/*"},
-        files={"image": None},
-        data={
-            "prompt" : prompt,
-            "duration": duration,
-            "seed": seed,
-            "steps": steps,
-            "cfg_scale" : cfg_scale,
-            "output_format": output_format,
-        }
-    )
+    data = {
+        "prompt" : prompt,
+        "duration": duration,
+        "seed": seed,
+        "steps": steps,
+        "cfg_scale" : cfg_scale,
+        "output_format": output_format,
+    }
+    key = generation_key(mode="text2audio", **data)
+    cached = audio_store.get(key, output_format)
+    if cached:
+        print(f"♻️ Reusing stored audio: {cached}")
+        return _deliver(cached, filename)
 
-    if not response.ok:
-        raise Exception(f"HTTP {response.status_code}: {response.text}")
+    def render(timeout):
+        with get_client().stream(
+            "POST",
+            TEXT2AUDIO_URL,
+            headers=_headers(),
+            files=_form_fields(data),
+            timeout=_render_timeout(timeout),
+        ) as response:
+            return _save_stream(response, key, output_format, filename)
 
-    with open(filename, "wb") as f:
-        f.write(response.content)
+    path = resilience.call("stability", render)
+    print(f"✅ Saved generated audio to: {path}")
+    return path
 
-    print(f"✅ Saved generated audio to: {filename}")
-    return filename
+
+async def text2audio_async(
+    prompt: str,
+    duration: int = 10,
+    filename: Optional[str] = None,
+    seed: int = 0,
+    steps: int = 50,
+    cfg_scale: float = 7.0,
+    output_format: str = "mp3"
+) -> str:
+    """
+    Async version of `text2audio`; file writes run in a worker thread.
+    """
+    data = {
+        "prompt" : prompt,
+        "duration": duration,
+        "seed": seed,
+        "steps": steps,
+        "cfg_scale" : cfg_scale,
+        "output_format": output_format,
+    }
+    key = generation_key(mode="text2audio", **data)
+    cached = audio_store.get(key, output_format)
+    if cached:
+        print(f"♻️ Reusing stored audio: {cached}")
+        return await asyncio.to_thread(_deliver, cached, filename)
+
+    async def render(timeout):
+        async with get_async_client().stream(
+            "POST",
+            TEXT2AUDIO_URL,
+            headers=_headers(),
+            files=_form_fields(data),
+            timeout=_render_timeout(timeout),
+        ) as response:
+            return await _save_stream_async(response, key, output_format, filename)
+
+    path = await resilience.call_async("stability", render)
+    print(f"✅ Saved generated audio to: {path}")
+    return path
 
 
 
@@ -60,12 +302,13 @@ def audio2audio(
     prompt: str,
     audio_path: str,
     duration: int = 10,
-    filename: str = "./audio/audio2audio.mp3",
+    filename: Optional[str] = None,
     seed: int = 0,
     steps: int = 50,
     cfg_scale: float = 7.0,
     strength: float = 1.0,
     output_format: str = "mp3",
+    reference_digest: Optional[str] = None,
 ) -> str:
     """
     Generate new audio from an existing audio file using Stability AI's Audio-to-Audio API.
@@ -74,47 +317,106 @@ def audio2audio(
         prompt (str): Descriptive generation prompt.
         audio_path (str): Path to input audio file (.wav or .mp3).
         duration (int): Desired output length in seconds.
-        filename (str): Output filename for the generated audio.
+        filename (str, optional): Also copy the result here; by default the path inside the audio store is returned.
         seed (int): Random seed for reproducibility.
         steps (int): Number of generation steps.
         cfg_scale (float): Prompt adherence strength.
         strength (float): Degree of transformation (0.0 to 1.0).
         output_format (str): Output file format ('mp3' or 'wav').
+        reference_digest (str, optional): SHA-256 of `audio_path` if already known; saves re-reading the file.
         stability_key (str): API key for Stability; falls back to STABILITY_KEY env variable.
 
+    Identical requests are served from the content-addressed audio store
+    without calling the API again.
+
     Returns:
         str: Path to the saved audio file.
     """
-    if not STABILITY_API_KEY:
-        raise ValueError("Missing Stability API key. Pass it explicitly or set STABILITY_KEY env var.")
+    data = {
+        "prompt": prompt,
+        "duration": duration,
+        "seed": seed,
+        "steps": steps,
+        "cfg_scale": cfg_scale,
+        "output_format": output_format,
+        "strength": strength,
+    }
+    reference = reference_key(reference_digest or file_digest(audio_path), duration)
+    key = generation_key(mode="audio2audio", reference=reference, **data)
+    cached = audio_store.get(key, output_format)
+    if cached:
+        print(f"♻️ Reusing stored audio: {cached}")
+        return _deliver(cached, filename)
 
-    with open(audio_path, "rb") as audio_file:
-        response = requests.post(
-            "https://api.stability.ai/v2beta/audio/stable-audio-2/audio-to-audio",
-            headers={
-                "Authorization": f"Bearer {STABILITY_API_KEY}",
-                "Accept": "audio/*",
-            },
+    upload_path = _prepared_reference(audio_path, reference, duration)
+    def render(timeout):
+        # Reopened per attempt so a retry re-sends the whole file
+        with open(upload_path, "rb") as audio_file, get_client().stream(
+            "POST",
+            AUDIO2AUDIO_URL,
+            headers=_headers(),
             files={"audio": audio_file},
-            data={
-                "prompt": prompt,
-                "duration": duration,
-                "seed": seed,
-                "steps": steps,
-                "cfg_scale": cfg_scale,
-                "output_format": output_format,
-                "strength": strength,
-            },
-        )
+            data={key: str(value) for key, value in data.items()},
+            timeout=_render_timeout(timeout),
+        ) as response:
+            return _save_stream(response, key, output_format, filename)
+
+    path = resilience.call("stability", render)
+    print(f"✅ Saved transformed audio to: {path}")
+    return path
 
-    if not response.ok:
-        raise Exception(f"HTTP {response.status_code}: {response.text}")
 
-    with open(filename, "wb") as f:
-        f.write(response.content)
+async def audio2audio_async(
+    prompt: str,
+    audio_path: str,
+    duration: int = 10,
+    filename: Optional[str] = None,
+    seed: int = 0,
+    steps: int = 50,
+    cfg_scale: float = 7.0,
+    strength: float = 1.0,
+    output_format: str = "mp3",
+    reference_digest: Optional[str] = None,
+) -> str:
+    """
+    Async version of `audio2audio`; the reference is streamed from disk and the result written in a worker thread.
+    """
+    data = {
+        "prompt": prompt,
+        "duration": duration,
+        "seed": seed,
+        "steps": steps,
+        "cfg_scale": cfg_scale,
+        "output_format": output_format,
+        "strength": strength,
+    }
+    if reference_digest is None:
+        reference_digest = await asyncio.to_thread(file_digest, audio_path)
+    reference = reference_key(reference_digest, duration)
+    key = generation_key(mode="audio2audio", reference=reference, **data)
+    cached = audio_store.get(key, output_format)
+    if cached:
+        print(f"♻️ Reusing stored audio: {cached}")
+        return await asyncio.to_thread(_deliver, cached, filename)
+
+    upload_path = await _prepared_reference_async(audio_path, reference, duration)
+    async def render(timeout):
+        # Reopened per attempt so a retry re-sends the whole file; httpx reads
+        # it in small chunks as the body is sent instead of holding it in memory
+        with open(upload_path, "rb") as audio_file:
+            async with get_async_client().stream(
+                "POST",
+                AUDIO2AUDIO_URL,
+                headers=_headers(),
+                files={"audio": (os.path.basename(upload_path), audio_file)},
+                data={key: str(value) for key, value in data.items()},
+                timeout=_render_timeout(timeout),
+            ) as response:
+                return await _save_stream_async(response, key, output_format, filename)
 
-    print(f"✅ Saved transformed audio to: {filename}")
-    return filename
+    path = await resilience.call_async("stability", render)
+    print(f"✅ Saved transformed audio to: {path}")
+    return path
 
 if __name__ == "__main__":
     # === Config ===
@@ -0,0 +1,48 @@
+import pytest
+
+from audio_serving import _parse_range
+
+SIZE = 1000
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=0-0", (0, 0)),
+    ("bytes=500-", (500, 999)),
+    ("bytes=990-5000", (990, 999)),       # end clamped to the file
+    (" bytes=10-19 ", (10, 19)),
+])
+def test_byte_ranges(header, expected):
+    assert _parse_range(header, SIZE) == expected
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=-100", (900, 999)),
+    ("bytes=-1", (999, 999)),
+    ("bytes=-5000", (0, 999)),            # longer than the file: all of it
+])
+def test_suffix_ranges(header, expected):
+    assert _parse_range(header, SIZE) == expected
+
+@pytest.mark.parametrize("header", [
+    "bytes=1000-",                        # starts past the end
+    "bytes=1000-1005",
+    "bytes=500-100",                      # end before start
+    "bytes=-0",                           # empty suffix
+    "bytes=-",
+])
+def test_unsatisfiable_ranges(header):
+    assert _parse_range(header, SIZE) == "invalid"
+
+def test_nothing_is_satisfiable_in_an_empty_file():
+    assert _parse_range("bytes=0-", 0) == "invalid"
+    assert _parse_range("bytes=-10", 0) == "invalid"
+
+@pytest.mark.parametrize("header", [
+    "bytes=0-9,20-29",                    # multi-range: served whole
+    "items=0-9",                          # unknown unit
+    "bytes=a-b",
+    "bytes 0-9",
+    "bytes=0-9-",
+    "",
+])
+def test_malformed_or_unsupported_ranges_are_ignored(header):
+    assert _parse_range(header, SIZE) is None
@@ -0,0 +1,47 @@
+import ipaddress
+
+import pytest
+
+import geoip
+from geoip import client_ip
+
+@pytest.fixture
+def trusted(monkeypatch):
+    """Trust loopback plus an internal proxy tier on 10.0.0.0/8."""
+    monkeypatch.setattr(geoip, "_trusted", [ipaddress.ip_network(n) for n in ("127.0.0.1/32", "::1/128", "10.0.0.0/8")])
+
+def test_direct_client_is_the_peer(trusted):
+    assert client_ip("203.0.113.7") == "203.0.113.7"
+    assert client_ip("203.0.113.7", {}) == "203.0.113.7"
+
+def test_missing_or_malformed_peer_is_unknown(trusted):
+    assert client_ip(None, {"x-forwarded-for": "203.0.113.7"}) is None
+    assert client_ip("not-an-ip") is None
+
+def test_untrusted_peer_cannot_spoof_its_address(trusted):
+    # The header came from the client itself: it is ignored
+    assert client_ip("198.51.100.9", {"x-forwarded-for": "8.8.8.8"}) == "198.51.100.9"
+
+def test_trusted_proxy_forwards_the_client(trusted):
+    assert client_ip("127.0.0.1", {"x-forwarded-for": "203.0.113.7"}) == "203.0.113.7"
+    assert client_ip("::1", {"x-forwarded-for": "2001:db8::1"}) == "2001:db8::1"
+
+def test_spoofed_hops_left_of_the_first_untrusted_address_are_ignored(trusted):
+    # The client sent "X-Forwarded-For: 8.8.8.8" and the proxy appended the real address
+    headers = {"x-forwarded-for": "8.8.8.8, 203.0.113.7"}
+    assert client_ip("127.0.0.1", headers) == "203.0.113.7"
+
+def test_multi_hop_chain_is_walked_through_trusted_proxies(trusted):
+    # client -> edge proxy (10.0.0.5) -> internal proxy (10.1.2.3) -> loopback
+    headers = {"x-forwarded-for": "203.0.113.7, 10.0.0.5, 10.1.2.3"}
+    assert client_ip("127.0.0.1", headers) == "203.0.113.7"
+
+def test_chain_stops_at_a_malformed_hop(trusted):
+    headers = {"x-forwarded-for": "8.8.8.8, garbage, 10.0.0.5"}
+    assert client_ip("127.0.0.1", headers) == "10.0.0.5"
+
+def test_empty_hops_are_skipped(trusted):
+    assert client_ip("127.0.0.1", {"x-forwarded-for": " , 203.0.113.7, "}) == "203.0.113.7"
+
+def test_chain_made_only_of_trusted_proxies_ends_at_the_leftmost(trusted):
+    assert client_ip("127.0.0.1", {"x-forwarded-for": "10.0.0.1, 10.0.0.2"}) == "10.0.0.1"
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from jobs import JobQueue, QueueNotShared, server_processes
+
+@pytest.mark.parametrize("argv, environ, expected", [
+    (["uvicorn", "api:app"], {}, 1),
+    (["uvicorn", "api:app", "--workers", "2"], {}, 2),
+    (["uvicorn", "api:app", "--workers=3"], {}, 3),
+    (["gunicorn", "-w", "4", "api:app"], {}, 4),
+    (["gunicorn", "-w4", "api:app"], {}, 4),
+    (["gunicorn", "api:app"], {"GUNICORN_CMD_ARGS": "--bind :8000 --workers=5"}, 5),
+    (["gunicorn", "-w2", "api:app"], {"GUNICORN_CMD_ARGS": "-w 5"}, 2),   # the command line wins
+    (["uvicorn", "api:app"], {"WEB_CONCURRENCY": "6"}, 6),
+    (["python", "script.py", "-w4"], {}, 1),                              # not a server launcher
+    (["uvicorn", "api:app", "--workers", "many"], {}, 1),
+])
+def test_server_processes(argv, environ, expected):
+    assert server_processes(argv, environ) == expected
+
+def test_several_processes_disable_submission_instead_of_startup(monkeypatch):
+    monkeypatch.setattr("jobs.server_processes", lambda: 2)
+    queue = JobQueue(workers=1)
+
+    async def main():
+        await queue.start()
+        try:
+            with pytest.raises(QueueNotShared) as error:
+                queue.submit(lambda job: asyncio.sleep(0))
+            assert error.value.status_code == 503
+        finally:
+            await queue.stop()
+
+    asyncio.run(main())
+    assert queue.stats()["shared"] is False
+
+def test_job_ids_tell_other_processes_apart_from_unknown_ids():
+    queue, other = JobQueue(), JobQueue()
+
+    async def main():
+        await queue.start()
+        await other.start()
+        try:
+            return queue.submit(_done).id, other.submit(_done).id
+        finally:
+            await queue.stop()
+            await other.stop()
+
+    mine, theirs = asyncio.run(main())
+    assert queue.get(mine) is not None and not queue.foreign(mine)
+    assert queue.get(theirs) is None and queue.foreign(theirs)
+    assert not queue.foreign("not-a-job-id")
+
+async def _done(job):
+    return {}
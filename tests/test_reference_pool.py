@@ -0,0 +1,55 @@
+import os
+import sys
+import wave
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+import audio_preprocess
+from audio_store import AudioStore
+
+@pytest.fixture
+def stableaudio_api(tmp_path, monkeypatch):
+    """The module with a throwaway reference store and pool; no API call is made."""
+    if "config" not in sys.modules:
+        try:
+            import config  # noqa: F401
+        except ImportError:
+            (tmp_path / "config.py").write_text('STABILITY_API_KEY = "test"\n')
+            monkeypatch.syspath_prepend(str(tmp_path))
+    import stableaudio_api
+
+    monkeypatch.setattr(audio_preprocess, "REFERENCE_WORKERS", 1)
+    monkeypatch.setattr(stableaudio_api, "reference_store", AudioStore(str(tmp_path / "references")))
+    monkeypatch.setattr(stableaudio_api, "_pool", None)
+    yield stableaudio_api
+    stableaudio_api.shutdown_reference_pool()
+
+def _write_wav(path: str, seconds: float = 1.0, rate: int = 8000):
+    pcm = (np.sin(np.arange(int(seconds * rate)) / 10) * 2 ** 14).astype("<i2")
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.tobytes())
+
+def test_broken_pool_is_replaced_on_the_next_reference(stableaudio_api, tmp_path):
+    source = str(tmp_path / "reference.wav")
+    _write_wav(source)
+
+    async def main():
+        broken = stableaudio_api._get_pool()
+        with pytest.raises(BrokenProcessPool):
+            await asyncio.get_running_loop().run_in_executor(broken, os._exit, 1)   # a worker dies
+
+        # That reference falls back to the original file...
+        assert await stableaudio_api._prepared_reference_async(source, "first", 6) == source
+        assert stableaudio_api._pool is None
+        # ...and the next one is prepared by a fresh pool
+        prepared = await stableaudio_api._prepared_reference_async(source, "second", 6)
+        assert prepared != source and os.path.exists(prepared)
+        assert stableaudio_api._pool is not broken
+
+    asyncio.run(main())
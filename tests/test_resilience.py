@@ -0,0 +1,205 @@
+import time
+import asyncio
+
+import pytest
+
+import resilience
+import scheduler
+from resilience import CircuitBreaker, CircuitOpen, DeadlineExceeded, Policy, UpstreamHTTPError
+
+@pytest.fixture
+def provider(monkeypatch):
+    """A throwaway provider with its own policy, breaker and scheduler queue."""
+    def make(queue_limits=None, **policy):
+        policy = Policy(**dict({"timeout": 1.0, "backoff": 0.0, "failure_threshold": 3, "reset_after": 60.0}, **policy))
+        monkeypatch.setitem(resilience.POLICIES, "test", policy)
+        monkeypatch.setitem(resilience._breakers, "test",
+                            CircuitBreaker("test", policy.failure_threshold, policy.reset_after))
+        if queue_limits:
+            monkeypatch.setitem(scheduler._queues, "test", scheduler.ProviderQueue("test", queue_limits))
+        return resilience._breakers["test"]
+    return make
+
+# === Circuit Breaker ===
+def test_breaker_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_after=60.0)
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    assert breaker.stats()["short_circuits"] == 1
+    assert breaker.stats()["opened"] == 1
+
+def test_breaker_success_resets_failure_count():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_after=60.0)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+def test_half_open_allows_one_trial_then_closes_on_success():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_after=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    breaker.allow()                   # the trial
+    with pytest.raises(CircuitOpen):
+        breaker.allow()               # everyone else while it runs
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.allow()
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_after=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.stats()["opened"] == 2
+
+def test_abandoned_trial_lets_the_next_call_try():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_after=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.abandon()
+    breaker.allow()
+
+# === Calls ===
+def test_call_retries_upstream_failures(provider):
+    breaker = provider(retries=2)
+    attempts = []
+
+    def fetch(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise UpstreamHTTPError("test", 503)
+        return "ok"
+
+    assert resilience.call("test", fetch) == "ok"
+    assert len(attempts) == 3
+    assert breaker.stats()["retries"] == 2
+    assert breaker.state == "closed"
+
+def test_call_does_not_retry_or_count_our_own_errors(provider):
+    breaker = provider(retries=2)
+    attempts = []
+
+    def fetch(timeout):
+        attempts.append(timeout)
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        resilience.call("test", fetch)
+    assert len(attempts) == 1
+    assert breaker.stats()["consecutive_failures"] == 0
+
+def test_call_opens_the_breaker_after_repeated_failures(provider):
+    breaker = provider(retries=0, failure_threshold=2)
+
+    def fetch(timeout):
+        raise UpstreamHTTPError("test", 502)
+
+    for _ in range(2):
+        with pytest.raises(UpstreamHTTPError):
+            resilience.call("test", fetch)
+    with pytest.raises(CircuitOpen):
+        resilience.call("test", fetch)
+    assert breaker.state == "open"
+
+def test_expired_deadline_fails_before_calling(provider):
+    provider()
+    with resilience.deadline(0.0):
+        with pytest.raises(DeadlineExceeded):
+            resilience.call("test", lambda timeout: "never")
+
+def test_nested_deadlines_only_shrink():
+    with resilience.deadline(10.0):
+        with resilience.deadline(100.0):
+            assert resilience.remaining() <= 10.0
+    assert resilience.remaining() is None
+
+def test_attempt_timeout_is_capped_by_the_deadline(provider):
+    provider(timeout=5.0)
+    with resilience.deadline(0.5):
+        timeout = resilience.call("test", lambda timeout: timeout)
+    assert timeout <= 0.5
+
+# === Hedging ===
+def test_hedge_wins_and_cancels_the_slow_attempt(provider):
+    breaker = provider(hedge_after=0.05)
+    started, cancelled = [], []
+
+    async def fetch(timeout):
+        attempt = len(started)
+        started.append(attempt)
+        try:
+            await asyncio.sleep(0.5 if attempt == 0 else 0.0)
+        except asyncio.CancelledError:
+            cancelled.append(attempt)
+            raise
+        return attempt
+
+    async def main():
+        result = await resilience.call_async("test", fetch)
+        await asyncio.sleep(0)   # let the cancellation reach the slow attempt
+        assert cancelled == [0]  # checked inside the loop: asyncio.run cancels leftovers itself
+        return result
+
+    assert asyncio.run(main()) == 1
+    assert breaker.stats()["hedges"] == 1
+
+def test_cancelled_call_cancels_both_attempts(provider):
+    provider(hedge_after=0.01)
+    cancelled = []
+
+    async def fetch(timeout):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(timeout)
+            raise
+
+    async def main():
+        task = asyncio.create_task(resilience.call_async("test", fetch))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert len(cancelled) == 2
+
+# === Scheduler slots ===
+def test_slots_are_released_after_success_failure_and_cancellation(provider):
+    provider(retries=1, queue_limits=scheduler.Limits(concurrency=2))
+    queue = scheduler._queues["test"]
+
+    async def ok(timeout):
+        return "ok"
+
+    async def failing(timeout):
+        raise UpstreamHTTPError("test", 500)
+
+    async def slow(timeout):
+        await asyncio.sleep(10)
+
+    async def main():
+        assert await resilience.call_async("test", ok) == "ok"
+        with pytest.raises(UpstreamHTTPError):
+            await resilience.call_async("test", failing)
+        task = asyncio.create_task(resilience.call_async("test", slow))
+        await asyncio.sleep(0.01)
+        assert queue.stats()["active"] == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert queue.stats()["active"] == 0
+    assert queue.stats()["admitted"] == 4   # ok, two failing attempts, slow
@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+
+import scheduler
+from scheduler import Limits, Overloaded, ProviderQueue
+
+BUDGETS = {"interactive": 5.0, "batch": 5.0}
+
+def _queue(**limits) -> ProviderQueue:
+    return ProviderQueue("test", Limits(**limits), budgets=BUDGETS)
+
+async def _acquire(queue: ProviderQueue, priority: str, order: list):
+    with scheduler.priority(priority):
+        slot = await queue.acquire_async()
+    order.append(priority)
+    return slot
+
+def test_free_slot_is_granted_at_once():
+    queue = _queue(concurrency=1)
+    slot = queue.acquire()
+    assert queue.stats()["active"] == 1
+    slot.release()
+    slot.release()   # releasing twice is harmless
+    assert queue.stats()["active"] == 0
+
+def test_interactive_waiters_are_served_before_batch():
+    queue = _queue(concurrency=1)
+    order = []
+
+    async def main():
+        held = queue.acquire()
+        batch = [asyncio.create_task(_acquire(queue, "batch", order)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        interactive = asyncio.create_task(_acquire(queue, "interactive", order))
+        await asyncio.sleep(0.01)
+        assert queue.stats()["waiting"] == 3
+
+        held.release()
+        for task in (interactive, *batch):
+            (await task).release()
+
+    asyncio.run(main())
+    assert order == ["interactive", "batch", "batch"]
+    assert queue.stats()["active"] == 0
+
+def test_waiters_of_one_priority_are_served_in_order():
+    queue = _queue(concurrency=1)
+    order = []
+
+    async def acquire(name):
+        slot = await queue.acquire_async()
+        order.append(name)
+        await asyncio.sleep(0)
+        slot.release()
+
+    async def main():
+        held = queue.acquire()
+        tasks = []
+        for name in ("first", "second", "third"):
+            tasks.append(asyncio.create_task(acquire(name)))
+            await asyncio.sleep(0.005)
+        held.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == ["first", "second", "third"]
+
+def test_queue_drains_after_a_waiter_is_cancelled():
+    queue = _queue(concurrency=1)
+    order = []
+
+    async def main():
+        held = queue.acquire()
+        cancelled = asyncio.create_task(_acquire(queue, "interactive", order))
+        survivor = asyncio.create_task(_acquire(queue, "batch", order))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert queue.stats()["waiting"] == 1
+
+        held.release()
+        (await asyncio.wait_for(survivor, 1)).release()
+
+    asyncio.run(main())
+    assert order == ["batch"]
+    stats = queue.stats()
+    assert (stats["waiting"], stats["active"]) == (0, 0)
+
+def test_slot_granted_to_a_cancelled_waiter_is_handed_back():
+    queue = _queue(concurrency=1)
+
+    async def main():
+        held = queue.acquire()
+        waiter = asyncio.create_task(queue.acquire_async())
+        await asyncio.sleep(0.01)
+        held.release()      # grants the slot to the waiter...
+        waiter.cancel()     # ...which is cancelled before it can take it
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(main())
+    assert queue.stats()["active"] == 0
+
+def test_rate_limit_refuses_with_429_when_over_budget():
+    queue = ProviderQueue("test", Limits(rate=1, burst=1), budgets={"interactive": 0.1, "batch": 0.1})
+    queue.acquire().release()
+    with pytest.raises(Overloaded) as error:
+        queue.acquire()
+    assert error.value.status_code == 429
+    assert error.value.retry_after >= 1
+    assert queue.stats()["rejected_429"] == 1
+
+def test_busy_provider_refuses_with_503_when_over_budget():
+    queue = ProviderQueue("test", Limits(concurrency=1, typical=10.0), budgets={"interactive": 1.0, "batch": 1.0})
+    held = queue.acquire()
+    with pytest.raises(Overloaded) as error:
+        queue.acquire()
+    assert error.value.status_code == 503
+    held.release()
+
+def test_waiter_times_out_at_its_budget():
+    queue = ProviderQueue("test", Limits(concurrency=1, typical=0.01), budgets={"interactive": 0.05, "batch": 0.05})
+
+    async def main():
+        held = queue.acquire()
+        with pytest.raises(Overloaded):
+            await queue.acquire_async()
+        held.release()
+
+    asyncio.run(main())
+    stats = queue.stats()
+    assert stats["timed_out"] == 1
+    assert (stats["waiting"], stats["active"]) == (0, 0)
+
+def test_tokens_refill_and_wake_waiters():
+    queue = _queue(rate=50, burst=1)
+
+    async def main():
+        queue.acquire().release()
+        slot = await asyncio.wait_for(queue.acquire_async(), 1)   # woken by the refill timer
+        slot.release()
+
+    asyncio.run(main())
+    assert queue.stats()["queued"] == 1
+
+def test_try_acquire_never_queues():
+    queue = _queue(concurrency=1)
+    held = queue.try_acquire()
+    assert held is not None
+    assert queue.try_acquire() is None
+    held.release()
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        with scheduler.priority("urgent"):
+            pass
@@ -0,0 +1,140 @@
+import asyncio
+import threading
+
+import pytest
+
+from singleflight import Group
+
+def test_concurrent_async_calls_share_one_call():
+    group = Group("test")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(*(group.do_async("key", fetch) for _ in range(5)))
+
+    assert asyncio.run(main()) == ["result"] * 5
+    assert len(calls) == 1
+    assert group.stats()["calls"] == 1
+    assert group.stats()["coalesced"] == 4
+    assert group.stats()["in_flight"] == 0
+
+def test_different_keys_are_not_coalesced():
+    group = Group("test")
+
+    async def main():
+        return await asyncio.gather(group.do_async("a", _value("a")), group.do_async("b", _value("b")))
+
+    assert asyncio.run(main()) == ["a", "b"]
+    assert group.stats()["calls"] == 2
+
+def test_error_is_shared_and_not_remembered():
+    group = Group("test")
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def main():
+        results = await asyncio.gather(*(group.do_async("key", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        assert await group.do_async("key", _value("recovered")) == "recovered"
+
+    asyncio.run(main())
+    assert len(calls) == 1
+    assert group.stats()["errors"] == 1
+
+def test_cancelled_waiter_leaves_the_call_running_for_others():
+    group = Group("test")
+    finished = []
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        finished.append(1)
+        return "result"
+
+    async def main():
+        first = asyncio.create_task(group.do_async("key", fetch))
+        second = asyncio.create_task(group.do_async("key", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "result"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+    asyncio.run(main())
+    assert finished == [1]
+
+def test_call_is_cancelled_when_its_last_waiter_leaves():
+    group = Group("test")
+    cancelled = []
+
+    async def fetch():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def main():
+        waiters = [asyncio.create_task(group.do_async("key", fetch)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert group.stats()["in_flight"] == 0
+        # The next caller starts a fresh call instead of joining the cancelled one
+        assert await group.do_async("key", _value("fresh")) == "fresh"
+
+    asyncio.run(main())
+    assert cancelled == [1]
+
+def test_concurrent_sync_calls_share_one_call():
+    group = Group("test")
+    calls, results = [], []
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    threads = [threading.Thread(target=lambda: results.append(group.do("key", fetch))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    while group.stats()["coalesced"] < 3:
+        threading.Event().wait(0.005)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+    assert group.stats()["in_flight"] == 0
+
+def test_disabled_group_calls_every_time():
+    group = Group("test", enabled=False)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        await asyncio.gather(*(group.do_async("key", fetch) for _ in range(3)))
+
+    asyncio.run(main())
+    assert len(calls) == 3
+
+def _value(value):
+    async def fetch():
+        return value
+    return fetch
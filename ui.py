@@ -1,149 +1,277 @@
-import gradio as gr
+import random
+import asyncio
+import argparse
+import threading
 from typing import Optional
 
 # === Customized Module ===
 
-from image_caption     import caption_image_with_gpt4o
-from opencage_api      import location_text_to_latlon
-from openweather_api   import get_weather_by_lat_lon, get_weather_by_ip
-from weather_to_prompt import interpret_weather_to_music_prompt
-from stableaudio_api   import text2audio, audio2audio
+from image_caption     import caption_image_with_gpt4o_async
+from opencage_api      import location_text_to_latlon_async
+from openweather_api   import get_weather_by_lat_lon_async, get_weather_by_ip_async
+from weather_to_prompt import interpret_weather_to_music_prompt_async, interpret_with_image_async
+from stableaudio_api   import text2audio_async, audio2audio_async
+from pipeline          import PREVIEW_DURATION, PREVIEW_STEPS, MAX_SEED, WARMUP_ON_STARTUP, INTERPRETATION_MODE, warmup
+from utils             import get_setting
+import geoip
+import metrics
+import resilience
+import scheduler
+
+# === Configuration (override any of these in config.py) ===
+UI_CONCURRENCY = get_setting("UI_CONCURRENCY", 4)    # generations running at once, across all users
+UI_QUEUE_SIZE  = get_setting("UI_QUEUE_SIZE", 32)    # users waiting beyond that; None = unbounded
+UI_PROGRESSIVE = get_setting("UI_PROGRESSIVE", False) # "quick preview first" ticked by default (off, like the API)
 
 # === Wrap Core Functionality ===
-def generate_prompt_from_inputs(
+async def render_audio(prompt: str, reference_audio_file: str, duration: int, seed: int = 0, steps: int = 50):
+    if reference_audio_file:
+        audio_path = await audio2audio_async(
+            prompt=prompt,
+            audio_path=reference_audio_file,
+            duration=duration,
+            seed=seed,
+            steps=steps,
+        )
+        return audio_path, f"audio2audio (with reference, {duration}s)"
+    audio_path = await text2audio_async(
+        prompt=prompt,
+        duration=duration,
+        seed=seed,
+        steps=steps,
+    )
+    return audio_path, f"text2audio (no reference, {duration}s)"
+
+async def caption_image(image_file: str) -> str:
+    with metrics.stage("caption"):
+        return await caption_image_with_gpt4o_async(image_file)
+
+async def generate_prompt_from_inputs(
     location_text: str,
     journal_text: str,
     image_file: str,
     reference_audio_file: str,
-    audio_duration: int
+    audio_duration: int,
+    progressive: bool = False,
+    interpretation_mode: str = INTERPRETATION_MODE,
+    client_ip: Optional[str] = None
 ):
+    """
+    Yields the eight outputs each time a stage completes: the placeholders
+    straight away, the coordinates, the weather, then the image caption,
+    then mood / summary / prompt, then the audio (in progressive mode a
+    preview first, then the full render). Captioning runs alongside
+    geocode → weather; in fused mode the caption comes with the
+    interpretation instead.
+    """
+    outputs = [
+        "⏳ Locating…",
+        "⏳ Captioning image…" if image_file else "(no image uploaded)",
+        "⏳ Fetching weather…",
+        "", "", "", None, ""
+    ]
+    fused = interpretation_mode == "fused" and bool(image_file)
+    caption_task = asyncio.ensure_future(caption_image(image_file)) if image_file and not fused else None
+
     try:
-        latlon_str = "N/A"
-        image_caption = ""
+        yield tuple(outputs)
 
         # === Get weather ===
         if location_text.strip():
-            latlon = location_text_to_latlon(location_text)
+            with metrics.stage("geocode"):
+                latlon = await location_text_to_latlon_async(location_text)
             if not latlon:
-                return "❌ Could not find coordinates.", "", "", "", "", "", None, ""
+                yield "❌ Could not find coordinates.", "", "", "", "", "", None, ""
+                return
             lat, lon = latlon
             latlon_str = f"{lat:.4f}, {lon:.4f}"
-            weather = get_weather_by_lat_lon(lat, lon)
+            outputs[0] = latlon_str
+            yield tuple(outputs)
+            with metrics.stage("weather"):
+                weather = await get_weather_by_lat_lon_async(lat, lon)
         else:
-            weather = get_weather_by_ip()
+            with metrics.stage("weather"):
+                weather = await get_weather_by_ip_async(client_ip)
             latlon_str = "Detected via IP"
             if not weather:
-                return "❌ Failed to fetch weather.", "", "", "", "", "", None, ""
-
-        # === Image caption ===
-        if image_file:
-            image_caption = caption_image_with_gpt4o(image_file)
-
-        # === Prompt generation ===
-        result = interpret_weather_to_music_prompt(
-            weather=weather,
-            journal=journal_text or "",
-            image_caption=image_caption or ""
-        )
+                yield "❌ Failed to fetch weather.", "", "", "", "", "", None, ""
+                return
 
-        weather_summary = (
+        outputs[0] = latlon_str
+        outputs[2] = (
             f"{weather['city']} | {weather['temperature']}°C | "
             f"{weather['weather_desc']} | Humidity {weather['humidity']}% | "
             f"Wind {weather['wind_speed']} m/s"
         )
+        outputs[3] = "⏳ Interpreting…"
+        yield tuple(outputs)
+
+        # === Image caption ===
+        image_caption = ""
+        if caption_task:
+            image_caption = await caption_task
+            outputs[1] = image_caption or "(caption unavailable)"
+            yield tuple(outputs)
+
+        # === Prompt generation ===
+        with metrics.stage("interpret"):
+            if fused:
+                # One multimodal call; the caption arrives with the prompt
+                result = await interpret_with_image_async(weather, journal_text or "", image_file)
+                outputs[1] = result.description or "(caption unavailable)"
+            else:
+                result = await interpret_weather_to_music_prompt_async(
+                    weather=weather,
+                    journal=journal_text or "",
+                    image_caption=image_caption or ""
+                )
+        outputs[3:6] = ", ".join(result.mood_keywords), result.summary, result.suggested_prompt
+        outputs[7] = "⏳ Generating audio…"
+        yield tuple(outputs)
 
         # === Safe duration cap (max 180 sec) ===
         duration = min(audio_duration, 180)
 
+        # === Progressive preview: short, low-step render with the same prompt and seed ===
+        seed = 0
+        if progressive:
+            seed = random.randint(1, MAX_SEED)
+            preview_duration = min(PREVIEW_DURATION, duration)
+            with metrics.stage("preview"):
+                outputs[6], preview_mode = await render_audio(
+                    result.suggested_prompt, reference_audio_file, preview_duration, seed, PREVIEW_STEPS
+                )
+            outputs[7] = f"Preview: {preview_mode}, full render in progress…"
+            yield tuple(outputs)
+
         # === Audio generation ===
-        if reference_audio_file:
-            audio_path = audio2audio(
-                prompt=result.suggested_prompt,
-                audio_path=reference_audio_file,
-                duration=duration,
-            )
-            gen_mode = f"audio2audio (with reference, {duration}s)"
-        else:
-            audio_path = text2audio(
-                prompt=result.suggested_prompt,
-                duration=duration,
-            )
-            gen_mode = f"text2audio (no reference, {duration}s)"
-
-        return (
-            latlon_str,
-            image_caption or "(no image uploaded)",
-            weather_summary,
-            ", ".join(result.mood_keywords),
-            result.summary,
-            result.suggested_prompt,
-            audio_path,
-            gen_mode
-        )
+        with metrics.stage("audio"):
+            outputs[6], outputs[7] = await render_audio(result.suggested_prompt, reference_audio_file, duration, seed)
+
+        yield tuple(outputs)
 
     except Exception as e:
-        return f"❌ Error: {str(e)}", "", "", "", "", "", None, ""
+        yield f"❌ Error: {str(e)}", "", "", "", "", "", None, ""
+    finally:
+        if caption_task:
+            caption_task.cancel()
+
+async def generate_with_timing(*inputs, client_ip: Optional[str] = None):
+    # Same stage hooks as the API; timings are logged instead of sent as a header.
+    # The run is a single task so its deadline and timing scope (inherited by the
+    # caption task) hold no matter which task Gradio iterates this generator from.
+    updates = asyncio.Queue()
+
+    async def run():
+        with metrics.track_request() as timings, resilience.deadline(), scheduler.priority("interactive"):
+            async for outputs in generate_prompt_from_inputs(*inputs, client_ip=client_ip):
+                updates.put_nowait(outputs)
+        print(f"⏱️ {metrics.server_timing(timings)}")
+
+    task = asyncio.create_task(run())
+    task.add_done_callback(lambda _: updates.put_nowait(None))
+    try:
+        while (outputs := await updates.get()) is not None:
+            yield outputs
+        await task
+    finally:
+        task.cancel()  # the user left or the event was cancelled
 
 
-    
 # === Gradio UI ===
-with gr.Blocks(title="🎵 MoodSound: A Multimodal Music Generator from Weather, Journals, and Images") as demo:
-    gr.Markdown("## 🎵 AI sonifies your daily life—from the weather to your snapshots and personal writing")
-    gr.Markdown("Enter a location (or leave blank to auto-detect), write a journal entry, and optionally upload an image. The AI will craft a music generation prompt.")
-
-    with gr.Row():
-        location_input = gr.Text(label="📍 Location (optional)", placeholder="e.g., Taipei 101")
-        journal_input = gr.Textbox(label="📝 Journal Entry (optional)", lines=3)
-
-    with gr.Row():
-        image_input = gr.Image(label="🖼️ Upload Image (optional)", type="filepath")
-        reference_audio_input = gr.Audio(label="🎧 Reference Audio (optional)", type="filepath")
-
-    audio_duration_input = gr.Slider(
-        label="⏱️ Audio Duration (seconds)",
-        minimum=5,
-        maximum=180,
-        value=20,
-        step=5
-    )
+def build_demo():
+    # Gradio is imported here, not at module load, so importing ui stays cheap
+    import gradio as gr
 
-    generate_btn = gr.Button("🎶 Generate Music")
-
-    with gr.Row():
-        latlon_output = gr.Textbox(label="🌍 Lat / Lon", interactive=False)
-        image_caption_output = gr.Textbox(label="🖼️ Image Caption", interactive=False)
-        weather_output = gr.Textbox(label="🌤️ Weather Summary", interactive=False)
-
-    with gr.Row():
-        mood_output = gr.Textbox(label="🎼 Mood Keywords", interactive=False)
-        summary_output = gr.Textbox(label="🧠 LLM Summary", interactive=False)
-        prompt_output = gr.Textbox(label="🎧 Music Prompt (Stable Audio-style)", lines=3, interactive=False)
-
-    audio_output = gr.Audio(label="🔊 Generated Audio", interactive=False)
-    mode_output = gr.Textbox(label="⚙️ Generation Mode", interactive=False)
-
-    generate_btn.click(
-        fn=generate_prompt_from_inputs,
-        inputs=[
-            location_input,
-            journal_input,
-            image_input,
-            reference_audio_input,
-            audio_duration_input
-        ],
-        outputs=[
-            latlon_output,
-            image_caption_output,
-            weather_output,
-            mood_output,
-            summary_output,
-            prompt_output,
-            audio_output,
-            mode_output
-        ]
-    )
+    with gr.Blocks(title="🎵 MoodSound: A Multimodal Music Generator from Weather, Journals, and Images") as demo:
+        gr.Markdown("## 🎵 AI sonifies your daily life—from the weather to your snapshots and personal writing")
+        gr.Markdown("Enter a location (or leave blank to auto-detect), write a journal entry, and optionally upload an image. The AI will craft a music generation prompt.")
+
+        with gr.Row():
+            location_input = gr.Text(label="📍 Location (optional)", placeholder="e.g., Taipei 101")
+            journal_input = gr.Textbox(label="📝 Journal Entry (optional)", lines=3)
+
+        with gr.Row():
+            image_input = gr.Image(label="🖼️ Upload Image (optional)", type="filepath")
+            reference_audio_input = gr.Audio(label="🎧 Reference Audio (optional)", type="filepath")
+
+        audio_duration_input = gr.Slider(
+            label="⏱️ Audio Duration (seconds)",
+            minimum=5,
+            maximum=180,
+            value=20,
+            step=5
+        )
+
+        progressive_input = gr.Checkbox(
+            label=f"⚡ Quick {PREVIEW_DURATION}s preview first, then the full render",
+            value=UI_PROGRESSIVE
+        )
+
+        interpretation_mode_input = gr.Radio(
+            label="🧠 Interpretation",
+            choices=[("Caption, then interpret", "separate"), ("Single multimodal call", "fused")],
+            value=INTERPRETATION_MODE
+        )
+
+        generate_btn = gr.Button("🎶 Generate Music")
+
+        with gr.Row():
+            latlon_output = gr.Textbox(label="🌍 Lat / Lon", interactive=False)
+            image_caption_output = gr.Textbox(label="🖼️ Image Caption", interactive=False)
+            weather_output = gr.Textbox(label="🌤️ Weather Summary", interactive=False)
+
+        with gr.Row():
+            mood_output = gr.Textbox(label="🎼 Mood Keywords", interactive=False)
+            summary_output = gr.Textbox(label="🧠 LLM Summary", interactive=False)
+            prompt_output = gr.Textbox(label="🎧 Music Prompt (Stable Audio-style)", lines=3, interactive=False)
+
+        audio_output = gr.Audio(label="🔊 Generated Audio", interactive=False)
+        mode_output = gr.Textbox(label="⚙️ Generation Mode", interactive=False)
+
+        async def generate(*inputs, request: gr.Request):
+            # Gradio passes the request to parameters annotated gr.Request; it locates IP-based weather
+            peer = request.client.host if request.client else None
+            async for outputs in generate_with_timing(*inputs, client_ip=geoip.client_ip(peer, request.headers)):
+                yield outputs
+
+        generate_btn.click(
+            fn=generate,
+            inputs=[
+                location_input,
+                journal_input,
+                image_input,
+                reference_audio_input,
+                audio_duration_input,
+                progressive_input,
+                interpretation_mode_input
+            ],
+            outputs=[
+                latlon_output,
+                image_caption_output,
+                weather_output,
+                mood_output,
+                summary_output,
+                prompt_output,
+                audio_output,
+                mode_output
+            ]
+        )
+
+    return demo
 
-    
+def main():
+    parser = argparse.ArgumentParser(description="Launch the MoodSound Gradio UI.")
+    parser.add_argument("--share", action=argparse.BooleanOptionalAction, default=True,
+                        help="Create a public Gradio share link (default: on).")
+    parser.add_argument("--port", type=int, default=None, help="Local port (default: Gradio's, 7860).")
+    args = parser.parse_args()
 
-demo.launch(share=True)
+    metrics.serve()
+    if WARMUP_ON_STARTUP:
+        threading.Thread(target=warmup, daemon=True).start()
+    demo = build_demo().queue(default_concurrency_limit=UI_CONCURRENCY, max_size=UI_QUEUE_SIZE)
+    demo.launch(share=args.share, server_port=args.port)
 
+if __name__ == "__main__":
+    main()
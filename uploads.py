@@ -0,0 +1,69 @@
+import os
+import asyncio
+import hashlib
+import tempfile
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+from utils import get_setting
+import metrics
+
+if TYPE_CHECKING:
+    from fastapi import UploadFile
+
+# === Configuration (override any of these in config.py) ===
+UPLOAD_DIR        = get_setting("UPLOAD_DIR", None)                     # None = system temp dir
+MAX_IMAGE_BYTES   = get_setting("MAX_IMAGE_UPLOAD_BYTES", 20 * 1024 ** 2)
+MAX_AUDIO_BYTES   = get_setting("MAX_AUDIO_UPLOAD_BYTES", 50 * 1024 ** 2)
+MAX_REQUEST_BYTES = get_setting("MAX_REQUEST_BYTES", MAX_IMAGE_BYTES + MAX_AUDIO_BYTES + 1024 ** 2)
+CHUNK_SIZE        = 1024 ** 2
+
+class UploadTooLarge(Exception):
+    status_code = 413
+
+@dataclass
+class SavedUpload:
+    path: str
+    sha256: str
+    size: int
+    filename: str = ""
+
+def _new_temp_path(filename: str) -> str:
+    suffix = os.path.splitext(filename or "")[1][:16]
+    fd, path = tempfile.mkstemp(prefix="upload_", suffix=suffix, dir=UPLOAD_DIR)
+    os.close(fd)
+    return path
+
+async def save_upload(upload: Optional["UploadFile"], max_bytes: int) -> Optional[SavedUpload]:
+    """
+    Stream an upload to a uniquely named temp file in CHUNK_SIZE pieces,
+    hashing it in the same pass. Oversized uploads are rejected as soon as
+    the limit is crossed and the partial file is removed.
+    """
+    if not upload:
+        return None
+    if upload.size is not None and upload.size > max_bytes:
+        raise UploadTooLarge(f"{upload.filename} exceeds the {max_bytes}-byte upload limit")
+
+    path = _new_temp_path(upload.filename)
+    sha = hashlib.sha256()
+    size = 0
+    try:
+        with metrics.stage("upload"), open(path, "wb") as f:
+            while chunk := await upload.read(CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"{upload.filename} exceeds the {max_bytes}-byte upload limit")
+                sha.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        discard(path)
+        raise
+    return SavedUpload(path=path, sha256=sha.hexdigest(), size=size, filename=upload.filename or "")
+
+def discard(*items):
+    """Remove temp files; accepts SavedUpload objects, paths or None."""
+    for item in items:
+        path = item.path if isinstance(item, SavedUpload) else item
+        if path and os.path.exists(path):
+            os.remove(path)
@@ -1,3 +1,45 @@
-def load_prompt(path: str) -> str:
+import os
+import time
+import hashlib
+import threading
+
+def get_setting(name: str, default):
+    """Read an optional tuning constant from config.py, falling back to `default`."""
+    try:
+        import config
+    except ImportError:
+        return default
+    return getattr(config, name, default)
+
+def file_digest(path: str, chunk_size: int = 1 << 20) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+# === Prompt templates ===
+# Templates are cached per path and re-read only when the file's mtime changes.
+# The mtime itself is checked at most once per PROMPT_RELOAD_INTERVAL seconds,
+# so the hot path is a dict lookup with no file I/O.
+PROMPT_RELOAD_INTERVAL = get_setting("PROMPT_RELOAD_INTERVAL", 2.0)
+
+_prompt_cache: dict[str, tuple[str, float, float]] = {}  # path -> (text, mtime, checked_at)
+_prompt_lock = threading.Lock()
+
+def _read_prompt(path: str) -> str:
     with open(path, "r", encoding="utf-8") as f:
-        return f.read()
\ No newline at end of file
+        return f.read()
+
+def load_prompt(path: str) -> str:
+    now = time.monotonic()
+    entry = _prompt_cache.get(path)
+    if entry is not None and now - entry[2] < PROMPT_RELOAD_INTERVAL:
+        return entry[0]
+
+    with _prompt_lock:
+        mtime = os.stat(path).st_mtime
+        entry = _prompt_cache.get(path)
+        text = entry[0] if entry is not None and entry[1] == mtime else _read_prompt(path)
+        _prompt_cache[path] = (text, mtime, now)
+        return text
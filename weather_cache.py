@@ -0,0 +1,201 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from utils import get_setting
+from geocode_cache import normalize_key
+
+# === Configuration (override any of these in config.py) ===
+GEOHASH_PRECISION = get_setting("WEATHER_CACHE_GEOHASH_PRECISION", 5)   # ~4.9 km x 4.9 km cells
+TTL               = get_setting("WEATHER_CACHE_TTL", 10 * 60)            # served as fresh
+STALE_TTL         = get_setting("WEATHER_CACHE_STALE_TTL", 50 * 60)      # then served stale while refreshing
+MAX_CELLS         = get_setting("WEATHER_CACHE_MAX_CELLS", 10_000)
+STATS_TOP_CELLS   = get_setting("WEATHER_CACHE_STATS_TOP_CELLS", 20)     # per-cell rows in stats()
+
+_COUNTERS = ("hits", "stale_hits", "misses", "refreshes")
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+class WeatherCache:
+    """
+    Weather cache keyed on geohash cells (or normalized city names).
+
+    Entries younger than `ttl` are served as-is. Between `ttl` and
+    `ttl + stale_ttl` the stale value is still returned immediately while one
+    background refresh per cell replaces it (stale-while-revalidate). Older
+    entries are treated as misses. Failed fetches (None) are never cached.
+
+    Per-cell counters are kept for at most `max_cells` recently looked-up
+    keys, so misses on keys that never get stored cannot grow them without
+    bound; the totals are kept separately and count every lookup.
+    """
+    def __init__(
+        self,
+        precision: int = GEOHASH_PRECISION,
+        ttl: float = TTL,
+        stale_ttl: float = STALE_TTL,
+        max_cells: int = MAX_CELLS,
+    ):
+        self.precision = precision
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_cells = max_cells
+        self._entries: "OrderedDict[str, tuple[dict, float]]" = OrderedDict()
+        self._cell_stats: "OrderedDict[str, dict]" = OrderedDict()
+        self._totals = dict.fromkeys(_COUNTERS, 0)
+        self._refreshing: set[str] = set()
+        self._tasks: set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+
+    # === Keys ===
+    def cell_for(self, lat: float, lon: float) -> str:
+        return geohash(lat, lon, self.precision)
+
+    def city_key(self, city: str) -> str:
+        return "city:" + normalize_key(city)
+
+    # === Lookup ===
+    def get_or_fetch(self, key: str, fetch: Callable[[], Optional[dict]]) -> Optional[dict]:
+        state, value = self._lookup(key)
+        if state == "fresh":
+            return value
+        if state == "stale":
+            if self._claim_refresh(key):
+                threading.Thread(target=self._refresh, args=(key, fetch), daemon=True).start()
+            return value
+        return self._store(key, fetch())
+
+    async def get_or_fetch_async(self, key: str, fetch: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        state, value = self._lookup(key)
+        if state == "fresh":
+            return value
+        if state == "stale":
+            if self._claim_refresh(key):
+                task = asyncio.create_task(self._refresh_async(key, fetch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return value
+        return self._store(key, await fetch())
+
+    def peek(self, key: str) -> Optional[dict]:
+        """Return whatever is cached for `key`, however old, without touching stats."""
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    def stats(self, top: int = STATS_TOP_CELLS) -> dict:
+        """Totals over every lookup, plus the `top` most looked-up cells still tracked."""
+        with self._lock:
+            totals = dict(self._totals)
+            totals["cells"] = len(self._entries)
+            busiest = sorted(
+                self._cell_stats.items(),
+                key=lambda item: item[1]["hits"] + item[1]["stale_hits"] + item[1]["misses"],
+                reverse=True,
+            )[:top]
+            cells = {key: dict(stats) for key, stats in busiest}
+        lookups = totals["hits"] + totals["stale_hits"] + totals["misses"]
+        totals["hit_ratio"] = (totals["hits"] + totals["stale_hits"]) / lookups if lookups else 0.0
+        return {"totals": totals, "cells": cells}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._cell_stats.clear()
+            self._totals = dict.fromkeys(_COUNTERS, 0)
+
+    # === Internals ===
+    def _lookup(self, key: str):
+        now = time.time()
+        with self._lock:
+            stats = self._track(key)
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, fetched_at = entry
+                age = now - fetched_at
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._count(stats, "hits")
+                    return "fresh", value
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    self._count(stats, "stale_hits")
+                    return "stale", value
+            self._count(stats, "misses")
+            return "miss", None
+
+    def _track(self, key: str) -> dict:
+        # Caller holds the lock. Stats are an LRU of their own, bounded like the entries
+        stats = self._cell_stats.get(key)
+        if stats is None:
+            stats = self._cell_stats[key] = dict.fromkeys(_COUNTERS, 0)
+            while len(self._cell_stats) > self.max_cells:
+                self._cell_stats.popitem(last=False)
+        else:
+            self._cell_stats.move_to_end(key)
+        return stats
+
+    def _count(self, stats: dict, name: str):
+        stats[name] += 1
+        self._totals[name] += 1
+
+    def _store(self, key: str, value: Optional[dict]) -> Optional[dict]:
+        if value is None:
+            return None
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_cells:
+                evicted, _ = self._entries.popitem(last=False)
+                self._cell_stats.pop(evicted, None)
+        return value
+
+    def _claim_refresh(self, key: str) -> bool:
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self._count(self._track(key), "refreshes")
+            return True
+
+    def _refresh(self, key, fetch):
+        try:
+            self._store(key, fetch())
+        except Exception as e:
+            print(f"❌ Weather refresh failed ({key}): {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    async def _refresh_async(self, key, fetch):
+        try:
+            self._store(key, await fetch())
+        except Exception as e:
+            print(f"❌ Weather refresh failed ({key}): {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+# Process-wide instance used by openweather_api
+weather_cache = WeatherCache()
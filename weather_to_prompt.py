@@ -1,11 +1,18 @@
-from typing import Dict, Optional
+import asyncio
+from typing import TYPE_CHECKING, Dict, Optional
 from pydantic import BaseModel
-from pydantic_ai import Agent
-from pydantic_ai.models.openai import OpenAIModel
-from pydantic_ai.providers.openai import OpenAIProvider
 
-from config import OPENAI_API_KEY
+from agents import get_agent
 from utils  import load_prompt
+from image_caption import ImageCaption, build_image_input, cache_keys
+from caption_cache import caption_cache
+from interpretation_cache import interpretation_cache
+from singleflight import interpretation_flight
+import metrics
+import resilience
+
+if TYPE_CHECKING:
+    from pydantic_ai import Agent
 
 # === Pydantic Schema ===
 class WeatherInterpretation(BaseModel):
@@ -15,27 +22,20 @@ class WeatherInterpretation(BaseModel):
     suggested_prompt: str
 
 # === Create Agent (only once) ===
-def create_weather_agent() -> Agent:
-    provider = OpenAIProvider(api_key=OPENAI_API_KEY)
-    model = OpenAIModel(model_name="gpt-4", provider=provider)
-    return Agent(
-        model=model,
+def create_weather_agent() -> "Agent":
+    return get_agent(
+        "weather",
+        model_name="gpt-4",
         result_type=WeatherInterpretation,
-        system_prompt=load_prompt("prompts/weather_music_system.txt")
+        prompt_path="prompts/weather_music_system.txt"
     )
 
-# === Main Function ===
-def interpret_weather_to_music_prompt(
+# === Prompt Construction ===
+def build_weather_prompt(
     weather: Dict,
     journal: Optional[str] = "",
     image_caption: Optional[str] = ""
-) -> WeatherInterpretation:
-    agent = Agent(
-        model=create_weather_agent().model,
-        result_type=WeatherInterpretation,
-        system_prompt=load_prompt("prompts/weather_music_system.txt")
-    )
-
+) -> str:
     dynamic_context = f"""
     Location: {weather['city']}
     Temperature: {weather['temperature']} °C
@@ -50,11 +50,186 @@ def interpret_weather_to_music_prompt(
     if image_caption.strip():
         dynamic_context += f"\n\nImage description:\n{image_caption.strip()}"
 
-    base_prompt = dynamic_context + "\n\n" + load_prompt("prompts/weather_music_base.txt")
+    return dynamic_context + "\n\n" + load_prompt("prompts/weather_music_base.txt")
+
+# === Degraded Fallback (LLM unavailable) ===
+FALLBACK_STYLES = {
+    "Clear":        (["bright", "open", "uplifting"], "Acoustic Pop", "acoustic guitar, glockenspiel, light percussion"),
+    "Clouds":       (["mellow", "reflective", "soft"], "Ambient", "warm synth pads, felt piano"),
+    "Rain":         (["calm", "introspective", "melancholic"], "Lo-fi", "rhodes piano, vinyl crackle, soft drums"),
+    "Drizzle":      (["gentle", "wistful", "quiet"], "Lo-fi", "rhodes piano, brushed drums"),
+    "Thunderstorm": (["tense", "dramatic", "powerful"], "Cinematic", "low strings, taiko drums, brass swells"),
+    "Snow":         (["still", "serene", "delicate"], "Ambient", "celesta, airy pads, music box"),
+}
+DEFAULT_STYLE = (["atmospheric", "calm", "dreamy"], "Ambient", "synth pads, soft piano")
+
+def degraded_interpretation(weather: Dict) -> WeatherInterpretation:
+    """Template interpretation built from the weather alone, served when the LLM is unavailable."""
+    moods, genre, instruments = FALLBACK_STYLES.get(weather["weather_main"], DEFAULT_STYLE)
+    return WeatherInterpretation(
+        location=weather["city"] or "",
+        summary=f"{weather['weather_desc'].capitalize()} at {weather['temperature']} °C.",
+        mood_keywords=moods,
+        suggested_prompt=(
+            f"Solo | Genre: {genre} | Instruments: {instruments} | Moods: {', '.join(moods)} | "
+            f"Additional descriptors: inspired by {weather['weather_desc']}"
+        ),
+    )
+
+def _degrade(weather: Dict, error: Exception) -> WeatherInterpretation:
+    if not resilience.is_upstream_failure(error):
+        raise error
+    print(f"⚠️ LLM unavailable ({error}); using template interpretation")
+    return degraded_interpretation(weather)
 
-    result = agent.run_sync(base_prompt)
+# === LLM Call (key = interpretation cache bucket to store into, if any) ===
+def _interpret(weather: Dict, journal: str, image_caption: str, key: Optional[str]) -> WeatherInterpretation:
+    agent = create_weather_agent()
+    prompt = build_weather_prompt(weather, journal, image_caption)
+    try:
+        result = resilience.call("openai", lambda timeout: agent.run_sync(prompt, model_settings={"timeout": timeout}))
+    except Exception as e:
+        return _degrade(weather, e)  # not cached, the next request tries the LLM again
+    metrics.record_usage("weather", result.usage())
+    if key is not None:
+        interpretation_cache.add(key, result.data)
     return result.data
 
+async def _interpret_async(weather: Dict, journal: str, image_caption: str, key: Optional[str]) -> WeatherInterpretation:
+    agent = create_weather_agent()
+    prompt = build_weather_prompt(weather, journal, image_caption)
+    try:
+        result = await resilience.call_async("openai", lambda timeout: agent.run(prompt, model_settings={"timeout": timeout}))
+    except Exception as e:
+        return _degrade(weather, e)  # not cached, the next request tries the LLM again
+    metrics.record_usage("weather", result.usage())
+    if key is not None:
+        interpretation_cache.add(key, result.data)
+    return result.data
+
+# === Main Function ===
+# Cached calls that miss at the same time share one LLM call per bucket;
+# use_cache=False always asks for a fresh interpretation of its own.
+def interpret_weather_to_music_prompt(
+    weather: Dict,
+    journal: Optional[str] = "",
+    image_caption: Optional[str] = "",
+    use_cache: bool = True,
+) -> WeatherInterpretation:
+    if not use_cache:
+        return _interpret(weather, journal, image_caption, None)
+
+    key = interpretation_cache.key_for(weather, journal, image_caption)
+    cached = interpretation_cache.lookup(key)
+    if cached is not None:
+        return cached
+    return interpretation_flight.do(key, lambda: _interpret(weather, journal, image_caption, key))
+
+async def interpret_weather_to_music_prompt_async(
+    weather: Dict,
+    journal: Optional[str] = "",
+    image_caption: Optional[str] = "",
+    use_cache: bool = True,
+) -> WeatherInterpretation:
+    if not use_cache:
+        return await _interpret_async(weather, journal, image_caption, None)
+
+    key = interpretation_cache.key_for(weather, journal, image_caption)
+    cached = interpretation_cache.lookup(key)
+    if cached is not None:
+        return cached
+    return await interpretation_flight.do_async(key, lambda: _interpret_async(weather, journal, image_caption, key))
+
+# === Fused Mode (image caption + interpretation in one multimodal call) ===
+class FusedInterpretation(WeatherInterpretation, ImageCaption):
+    """`description` comes first, so the model describes the image before interpreting it."""
+
+def create_fused_agent() -> "Agent":
+    return get_agent(
+        "fused",
+        model_name="gpt-4o",
+        result_type=FusedInterpretation,
+        prompt_path="prompts/weather_music_fused.txt"
+    )
+
+def _with_caption(caption: str, interpretation: WeatherInterpretation) -> FusedInterpretation:
+    return FusedInterpretation(description=caption, **interpretation.model_dump())
+
+def _store_fused(weather: Dict, journal: str, keys: tuple, fused: FusedInterpretation):
+    # Later requests for the same image, or the same caption, hit the usual caches
+    caption_cache.add(*keys, fused.description)
+    interpretation_cache.add(interpretation_cache.key_for(weather, journal, fused.description), fused)
+
+def _fused_key(weather: Dict, journal: str, image_sha256: str) -> str:
+    return f"fused|{image_sha256}|{interpretation_cache.key_for(weather, journal, '')}"
+
+def _fuse(weather: Dict, journal: str, image_path: str, keys: Optional[tuple]) -> FusedInterpretation:
+    agent = create_fused_agent()
+    prompt = build_weather_prompt(weather, journal, "")
+    image_input = build_image_input(image_path)
+    try:
+        result = resilience.call("openai", lambda timeout: agent.run_sync([prompt, image_input], model_settings={"timeout": timeout}))
+    except Exception as e:
+        return _with_caption("", _degrade(weather, e))
+    metrics.record_usage("fused", result.usage())
+    if keys is not None:
+        _store_fused(weather, journal, keys, result.data)
+    return result.data
+
+async def _fuse_async(weather: Dict, journal: str, image_path: str, keys: Optional[tuple]) -> FusedInterpretation:
+    agent = create_fused_agent()
+    prompt = build_weather_prompt(weather, journal, "")
+    image_input = await asyncio.to_thread(build_image_input, image_path)
+    try:
+        result = await resilience.call_async("openai", lambda timeout: agent.run([prompt, image_input], model_settings={"timeout": timeout}))
+    except Exception as e:
+        return _with_caption("", _degrade(weather, e))
+    metrics.record_usage("fused", result.usage())
+    if keys is not None:
+        _store_fused(weather, journal, keys, result.data)
+    return result.data
+
+# A cached caption leaves nothing to fuse: its interpretation goes the usual
+# (cached, coalesced) way. Otherwise one gpt-4o call sees weather, journal and
+# image together, replacing the caption → interpretation round trips.
+def interpret_with_image(
+    weather: Dict,
+    journal: Optional[str],
+    image_path: str,
+    image_digest: Optional[str] = None,
+    use_cache: bool = True,
+) -> FusedInterpretation:
+    journal = journal or ""
+    if not use_cache:
+        return _fuse(weather, journal, image_path, None)
+
+    keys = cache_keys(image_path, image_digest)
+    caption = caption_cache.lookup(*keys)
+    if caption is not None:
+        return _with_caption(caption, interpret_weather_to_music_prompt(weather, journal, caption))
+    return interpretation_flight.do(
+        _fused_key(weather, journal, keys[0]), lambda: _fuse(weather, journal, image_path, keys)
+    )
+
+async def interpret_with_image_async(
+    weather: Dict,
+    journal: Optional[str],
+    image_path: str,
+    image_digest: Optional[str] = None,
+    use_cache: bool = True,
+) -> FusedInterpretation:
+    journal = journal or ""
+    if not use_cache:
+        return await _fuse_async(weather, journal, image_path, None)
+
+    keys = await asyncio.to_thread(cache_keys, image_path, image_digest)
+    caption = caption_cache.lookup(*keys)
+    if caption is not None:
+        return _with_caption(caption, await interpret_weather_to_music_prompt_async(weather, journal, caption))
+    return await interpretation_flight.do_async(
+        _fused_key(weather, journal, keys[0]), lambda: _fuse_async(weather, journal, image_path, keys)
+    )
+
 # === Example Usage ===
 if __name__ == "__main__":
     sample_weather = {